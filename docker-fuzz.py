@@ -73,6 +73,51 @@ def main():
     group = parser.add_mutually_exclusive_group()
     group.add_argument("-b", "--baseline", action="store_true")
     group.add_argument("-l", "--labrador", action="store_true")
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="per-request latency budget of the estimator in ms (degrades past it)",
+    )
+    parser.add_argument(
+        "-j",
+        "--preprocess-jobs",
+        type=int,
+        help="number of processes for preprocessing the static analysis result",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="ignore the preprocessing snapshot of the target and build it again",
+    )
+    parser.add_argument(
+        "--response-files",
+        action="store_true",
+        help="pass the PUT response to the estimator through files, not memfds",
+    )
+    parser.add_argument(
+        "--coverage-file",
+        action="store_true",
+        help="pass the coverage to the fuzzer through edges.txt, not trace_bits",
+    )
+    parser.add_argument(
+        "--coverage-delta",
+        action="store_true",
+        help="pass only the never-seen vertices to the fuzzer, on the status pipe",
+    )
+    parser.add_argument(
+        "--daemon-socket",
+        help="use the estimator daemon listening on this Unix socket",
+    )
+    parser.add_argument(
+        "--dedup-slots",
+        type=int,
+        help="size of the table of seen responses of the estimator (0: no dedup)",
+    )
+    parser.add_argument(
+        "--async-workers",
+        type=int,
+        help="serve the estimator from an event loop, inferring on this many processes",
+    )
 
     args = parser.parse_args()
 
@@ -86,6 +131,25 @@ def main():
         os.environ["FUZZ_BASELINE"] = "1"
     if args.labrador:
         os.environ["FUZZ_USE_LABRADOR_LOW"] = "1"
+    if args.time_budget:
+        os.environ["FUZZ_TIME_BUDGET_MS"] = str(args.time_budget)
+    if args.preprocess_jobs:
+        os.environ["FUZZ_PREPROCESS_JOBS"] = str(args.preprocess_jobs)
+    if args.rebuild:
+        os.environ["FUZZ_SNAPSHOT_REBUILD"] = "1"
+    if args.response_files:
+        os.environ["FUZZ_RESPONSE_FILES"] = "1"
+    if args.coverage_file:
+        os.environ["FUZZ_COVERAGE_FILE"] = "1"
+    if args.coverage_delta:
+        os.environ["FUZZ_COVERAGE_DELTA"] = "1"
+    if args.daemon_socket:
+        os.environ["FUZZ_DAEMON_SOCKET"] = args.daemon_socket
+    if args.dedup_slots is not None:
+        os.environ["FUZZ_DEDUP_SLOTS"] = str(args.dedup_slots)
+    if args.async_workers is not None:
+        os.environ["FUZZ_ASYNC_SERVER"] = "1"
+        os.environ["FUZZ_ASYNC_WORKERS"] = str(args.async_workers)
     put_path = afl_args[0]
 
     set_env_vars(put_name)
@@ -5,9 +5,12 @@ import pickle
 import json
 import os
 import sys
+from array import array
 
 sys.path.append("/work/src")
 from CFG_recover import CFG, XREF
+from cfg_arrays import CFGArrays, ADDR_TYPECODE
+from cfg_binary import BINARY_FILE_NAME, write_cfg_binary
 
 cfg = CFG()
 
@@ -192,6 +195,7 @@ pickle_file = f"{out_dir}/pickle_analysis.bin"
 baseaddr_file = f"{out_dir}/baseaddr.txt"
 vertex_file = f"{out_dir}/vertex.txt"
 edge_file = f"{out_dir}/edge.txt"
+binary_file = f"{out_dir}/{BINARY_FILE_NAME}"
 
 
 def custom_serializer(obj):
@@ -214,6 +218,14 @@ with open(vertex_file, "w") as f:
 with open(edge_file, "w") as f:
     f.write("\n".join([f"{hex(src)} {hex(dst)}" for src, dst in edge_list]))
 
+# Same result as above in the mmap-able binary format (preferred by the loader)
+arrays = CFGArrays.from_json(
+    json.loads(json.dumps(funcnode_dict, default=custom_serializer)), cfg.string_xref
+)
+arrays.vertices = array(ADDR_TYPECODE, vertex_list)
+arrays.edges = array(ADDR_TYPECODE, [addr for edge in edge_list for addr in edge])
+write_cfg_binary(binary_file, arrays)
+
 # bbm = BasicBlockModel(currentProgram)
 # blocks = bbm.getCodeBlocks(TaskMonitor.DUMMY)
 
@@ -0,0 +1,921 @@
+#!/usr/bin/python3
+import argparse
+import gc
+import json
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Set, Tuple
+
+# import CFG_recover from "$PWD/../src/CFG_recover.py"
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import CFG, Funcnode, BB, XREF  # noqa E402
+from CFG_transform import CFGTransformer  # noqa E402
+from graph_algo import CallGraph  # noqa E402
+import bz_common as bzc  # noqa E402
+from cfg_arrays import CFGArrays  # noqa E402
+from cfg_binary import BINARY_FILE_NAME, convert_static_analysis_result  # noqa E402
+from partition import coarsest_stable_partition  # noqa E402
+
+
+def make_synthetic_cfg(
+    num_funcs: int,
+    bbs_per_func: int = 8,
+    calls_per_func: int = 2,
+    strings_per_func: int = 1,
+    seed: int = 0,
+    string_func_ratio: float = 1.0,
+    recursive_call_ratio: float = 0.05,
+) -> CFG:
+    """
+    Random whole-program CFG: every function is a chain of BBs with forward branches
+    and a back edge, and calls mostly go "down" (callee index > caller index)
+    so that the call graph is a DAG with a few recursive cycles.
+    """
+    rng = random.Random(seed)
+    cfg = CFG()
+    funcs: List[Funcnode] = []
+    for i in range(num_funcs):
+        func_addr = 0x100000 + i * 0x1000
+        func = Funcnode(func_addr)
+        cfg.funcnode_dict[func_addr] = func
+        for k in range(bbs_per_func):
+            bb = BB(func_addr + k * 0x10, func)
+            bb.end_addr = bb.start_addr + 0xF
+            func.register_bb(bb)
+        bbs = func.get_bbs()
+        for k, bb in enumerate(bbs[:-1]):
+            bb.dst_bbs.add(bbs[k + 1])
+            if k + 2 < len(bbs) and rng.random() < 0.5:
+                bb.dst_bbs.add(bbs[k + 2])
+            if k > 0 and rng.random() < 0.1:
+                bb.dst_bbs.add(bbs[rng.randrange(1, k + 1)])
+        func.update_preds()
+        funcs.append(func)
+
+    for i, caller in enumerate(funcs):
+        for _ in range(calls_per_func):
+            if i + 1 < num_funcs and rng.random() >= recursive_call_ratio:
+                callee = funcs[rng.randrange(i + 1, num_funcs)]
+            else:
+                callee = funcs[rng.randrange(0, num_funcs)]
+            call_site = rng.choice(caller.get_bbs())
+            call_site.call_func.add(callee)
+            caller.call_func.add(callee)
+            callee.xrefs.add(call_site)
+
+    for i, func in enumerate(funcs):
+        # Calls mostly go down, so the callers of the first functions are few
+        if i >= string_func_ratio * num_funcs:
+            continue
+        for k in range(strings_per_func):
+            literal = f"message {i} {k} from the synthetic function".encode()
+            if rng.random() < 0.2:
+                # Shared literals make multiple candidates BBs for CDBI
+                literal = f"shared message {rng.randrange(0, 16)}".encode()
+            xref = cfg.string_xref.setdefault(literal, XREF(literal))
+            bb = rng.choice(func.get_bbs())
+            xref.bbs.add(bb)
+            bb.xrefs.add(xref)
+    return cfg
+
+
+def write_static_analysis_result(cfg: CFG, stat_dir: str):
+    """
+    Writes `cfg` in the format of ghidra/static_analysis_by_ghidra.py
+    """
+    funcnode_dict = {}
+    for func in cfg.get_funcs():
+        funcnode_dict[func.addr] = {
+            "call_func": [callee.addr for callee in func.call_func],
+            "BBs": {
+                bb.start_addr: {
+                    "dst_bbs": [dst.start_addr for dst in bb.dst_bbs],
+                    "call_func": [callee.addr for callee in bb.call_func],
+                    "xrefs": [],
+                    "end_addr": bb.end_addr,
+                    "parent_funcnode": func.addr,
+                }
+                for bb in func.get_bbs()
+            },
+            "xrefs": [],
+        }
+    ghidra_cfg = CFG()
+    for literal, xref in cfg.string_xref.items():
+        ghidra_xref = XREF(literal)
+        ghidra_xref.bbs = {bb.start_addr for bb in xref.bbs}
+        ghidra_xref.funcnodes = {bb.parent_funcnode.addr for bb in xref.bbs}
+        ghidra_cfg.string_xref[literal] = ghidra_xref
+    with open(os.path.join(stat_dir, "CFG_analysis.txt"), "w") as f:
+        json.dump(funcnode_dict, f)
+    with open(os.path.join(stat_dir, "pickle_analysis.bin"), "wb") as f:
+        pickle.dump(ghidra_cfg, f)
+    with open(os.path.join(stat_dir, "vertex.txt"), "w") as f:
+        for func in cfg.get_funcs():
+            for bb in func.get_bbs():
+                f.write(f"{bb.start_addr:x}\n")
+    with open(os.path.join(stat_dir, "edge.txt"), "w") as f:
+        for func in cfg.get_funcs():
+            for bb in func.get_bbs():
+                for dst in bb.dst_bbs:
+                    f.write(f"{bb.start_addr:x} {dst.start_addr:x}\n")
+
+
+def naive_func_distance_map(cfg: CFG) -> Dict[Tuple[Funcnode, Funcnode], int]:
+    """
+    The former CFG.build_func_distance_map; the caller-BFS runs for every pair.
+    """
+
+    def get_caller_distances(func: Funcnode) -> Dict[Funcnode, int]:
+        distances = {func: 0}
+        queue: List[Funcnode] = [func]
+        while queue:
+            current = queue.pop(0)
+            caller_funcs = {bb.parent_funcnode for bb in current.xrefs}
+            for caller in caller_funcs:
+                if caller not in distances:
+                    distances[caller] = distances[current] + 1
+                    queue.append(caller)
+        return distances
+
+    distance_map: Dict[Tuple[Funcnode, Funcnode], int] = {}
+    funcs = cfg.get_funcs()
+    for i, f1 in enumerate(funcs):
+        f1_dists = get_caller_distances(f1)
+        for f2 in funcs[i:]:
+            f2_dists = get_caller_distances(f2)
+            common_funcs = set(f1_dists.keys()) & set(f2_dists.keys())
+            if common_funcs:
+                min_dist = min(f1_dists[f] + f2_dists[f] for f in common_funcs)
+            else:
+                min_dist = 100
+            distance_map[f1, f2] = min_dist
+            distance_map[f2, f1] = min_dist
+    return distance_map
+
+
+def naive_dominators(func: Funcnode) -> Dict[BB, Set[BB]]:
+    """
+    The former Funcnode.build_dominators: a full dominator set on every BB.
+    """
+    entry_bb = func.get_entry()
+    bbs = func.get_bbs()
+    doms = {bb: {bb} if bb == entry_bb else set(bbs) for bb in bbs}
+    changed = True
+    while changed:
+        changed = False
+        for bb in bbs:
+            if bb == entry_bb or not bb.pred_bbs:
+                continue
+            new_doms = {bb} | set.intersection(*(doms[pred] for pred in bb.pred_bbs))
+            if new_doms != doms[bb]:
+                doms[bb] = new_doms
+                changed = True
+    return doms
+
+
+def traced(func, *args):
+    """
+    Like timed(), and also the peak of the memory allocated while running `func`
+    """
+    tracemalloc.start()
+    result, elapsed = timed(func, *args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_func_distance(args):
+    print("funcs,naive_s,fast_s,fast_parallel_s")
+    for num_funcs in args.sizes:
+        cfg = make_synthetic_cfg(num_funcs, seed=args.seed)
+        naive_time = float("nan")
+        if num_funcs <= args.naive_limit:
+            naive_map, naive_time = timed(naive_func_distance_map, cfg)
+        _, fast_time = timed(cfg.build_func_distance_map, 1)
+        if num_funcs <= args.naive_limit:
+            for (f1, f2), dist in naive_map.items():
+                assert cfg.get_func_distance(f1, f2) == dist
+        _, parallel_time = timed(cfg.build_func_distance_map, args.processes)
+        print(f"{num_funcs},{naive_time:.3f},{fast_time:.3f},{parallel_time:.3f}")
+
+
+def bench_dominators(args):
+    print("bbs_per_func,naive_s,naive_peak_kib,chk_s,chk_peak_kib")
+    for bbs_per_func in args.sizes:
+        cfg = make_synthetic_cfg(args.funcs, bbs_per_func=bbs_per_func, seed=args.seed)
+        funcs = cfg.get_funcs()
+        naive_doms, naive_time, naive_peak = traced(
+            lambda: [naive_dominators(func) for func in funcs]
+        )
+        _, chk_time, chk_peak = traced(
+            lambda: [func.build_dominators() for func in funcs]
+        )
+        for func, doms in zip(funcs, naive_doms):
+            for bb, bb_doms in doms.items():
+                assert set(func.dom_tree.dominators(bb)) == bb_doms
+        del naive_doms
+        print(
+            f"{bbs_per_func},{naive_time:.3f},{naive_peak / 1024:.0f},"
+            f"{chk_time:.3f},{chk_peak / 1024:.0f}"
+        )
+
+
+def preprocess(cfg: CFG, processes: int):
+    transformer = CFGTransformer(cfg, processes)
+    transformer.run_all_passes(cfg)
+    cfg.build_dominators(processes)
+
+
+def bench_passes(args):
+    print("funcs,serial_s,parallel_s")
+    for num_funcs in args.sizes:
+        cfg = make_synthetic_cfg(
+            num_funcs, bbs_per_func=args.bbs_per_func, seed=args.seed
+        )
+        _, serial_time = timed(preprocess, cfg, 1)
+        cfg = make_synthetic_cfg(
+            num_funcs, bbs_per_func=args.bbs_per_func, seed=args.seed
+        )
+        _, parallel_time = timed(preprocess, cfg, args.processes)
+        print(f"{num_funcs},{serial_time:.3f},{parallel_time:.3f}")
+
+
+class FormerNodeRemoval(CFGTransformer):
+    """
+    Node removal as before: one node at a time, rebuilding the pred_bbs of the whole
+    function and verifying it for each node
+    """
+
+    def remove_node(self, func: Funcnode, bb: BB):
+        func.update_preds()
+        super().remove_node(func, bb)
+        self.verify_func_cfg(func)
+
+    def remove_nodes(self, func: Funcnode, bbs: Set[BB]):
+        for bb in bbs:
+            self.remove_node(func, bb)
+
+
+class OneByOneNodeRemoval(CFGTransformer):
+    def remove_nodes(self, func: Funcnode, bbs: Set[BB]):
+        for bb in bbs:
+            self.remove_node(func, bb)
+
+
+def minimize_funcs(transformer: CFGTransformer, cfg: CFG):
+    saved_bbs = cfg.get_string_refer_bbs()
+    for func in cfg.get_funcs():
+        transformer.minimize_funcnode_cfg(func, saved_bbs)
+
+
+def dump_edges(cfg: CFG):
+    return {
+        bb.start_addr: (
+            sorted(dst.start_addr for dst in bb.dst_bbs),
+            {
+                dst.start_addr: sorted(
+                    i.start_addr for i in func.get_implicated_bbs(bb, dst)
+                )
+                for dst in bb.dst_bbs
+                if func.get_implicated_bbs(bb, dst)
+            },
+        )
+        for func in cfg.get_funcs()
+        for bb in func.get_bbs()
+    }
+
+
+def bench_node_removal(args):
+    print("bbs_per_func,former_s,one_by_one_s,batched_s")
+    for bbs_per_func in args.sizes:
+        results = []
+        for transformer_class in (
+            FormerNodeRemoval,
+            OneByOneNodeRemoval,
+            CFGTransformer,
+        ):
+            cfg = make_synthetic_cfg(
+                args.funcs,
+                bbs_per_func=bbs_per_func,
+                strings_per_func=args.strings_per_func,
+                seed=args.seed,
+            )
+            gc.collect()
+            _, elapsed = timed(minimize_funcs, transformer_class(cfg), cfg)
+            results.append((dump_edges(cfg), elapsed))
+        assert results[0][0] == results[1][0] == results[2][0]
+        print(f"{bbs_per_func}," + ",".join(f"{t:.3f}" for _, t in results))
+
+
+def former_merge_partition(labels, succs) -> List[List[int]]:
+    """
+    The partition of the former CFGTransformer.merge_duplicate_nodes: rebuilds every
+    segment on each iteration (and stops when the last segment does not split)
+    """
+    behavior_to_nodes: Dict[object, List[int]] = {}
+    for v, label in enumerate(labels):
+        behavior_to_nodes.setdefault(label, []).append(v)
+    segment = list(behavior_to_nodes.values())
+    node_to_segment = {v: i for i, nodes in enumerate(segment) for v in nodes}
+    converged = False
+    while not converged:
+        converged = True
+        new_segment: List[List[int]] = []
+        new_node_to_segment = {}
+        for nodes in segment:
+            if len(nodes) == 1:
+                new_node_to_segment[nodes[0]] = len(new_segment)
+                new_segment.append(nodes)
+                continue
+            nextseg_to_nodes: Dict[frozenset, List[int]] = {}
+            for v in nodes:
+                next_segment = frozenset(node_to_segment[w] for w in succs[v])
+                nextseg_to_nodes.setdefault(next_segment, []).append(v)
+            converged = len(nextseg_to_nodes) == 1
+            for nodes in nextseg_to_nodes.values():
+                for v in nodes:
+                    new_node_to_segment[v] = len(new_segment)
+                new_segment.append(nodes)
+        node_to_segment = new_node_to_segment
+        segment = new_segment
+    return sorted(sorted(nodes) for nodes in segment)
+
+
+def moore_partition(labels, succs) -> List[List[int]]:
+    """
+    Rebuilds every segment on each iteration until the number of segments is stable
+    """
+    ids: Dict[object, int] = {}
+    block_of = [ids.setdefault(label, len(ids)) for label in labels]
+    num_blocks = len(ids)
+    while True:
+        ids = {}
+        block_of = [
+            ids.setdefault(
+                (block_of[v], frozenset(block_of[w] for w in succs[v])), len(ids)
+            )
+            for v in range(len(labels))
+        ]
+        if len(ids) == num_blocks:
+            break
+        num_blocks = len(ids)
+    blocks: Dict[int, List[int]] = {}
+    for v, block in enumerate(block_of):
+        blocks.setdefault(block, []).append(v)
+    return sorted(blocks.values())
+
+
+def get_partition_inputs(cfg: CFG, num_funcs: int):
+    """
+    (labels, successors) of the `num_funcs` largest functions, as merge_duplicate_nodes
+    """
+    transformer = CFGTransformer(cfg)
+    funcs = set(cfg.get_funcs())
+    inputs = []
+    for func in sorted(funcs, key=lambda f: len(f.BBs), reverse=True)[:num_funcs]:
+        bbs = func.get_bbs()
+        bb_to_idx = {bb: i for i, bb in enumerate(bbs)}
+        labels = [transformer.get_bb_behavior(bb, funcs) for bb in bbs]
+        succs = [[bb_to_idx[succ] for succ in bb.dst_bbs] for bb in bbs]
+        inputs.append((len(bbs), labels, succs))
+    return inputs
+
+
+def bench_partition_inputs(name: str, inputs):
+    for num_bbs, labels, succs in inputs:
+        times = []
+        partitions = []
+        for partition_func in (
+            former_merge_partition,
+            moore_partition,
+            coarsest_stable_partition,
+        ):
+            partition, elapsed = timed(partition_func, labels, succs)
+            partitions.append(partition)
+            times.append(elapsed)
+        former, moore, paige_tarjan = partitions
+        assert moore == paige_tarjan
+        print(
+            f"{name},{num_bbs},{len(former)},{len(paige_tarjan)},"
+            + ",".join(f"{t:.3f}" for t in times)
+        )
+
+
+def bench_partition(args):
+    print("input,bbs,former_blocks,blocks,former_s,moore_s,paige_tarjan_s")
+    if args.static_analysis:
+        for stat_dir in args.static_analysis:
+            cfg, _, _ = bzc.load_static_analysis_result(stat_dir)
+            bench_partition_inputs(stat_dir, get_partition_inputs(cfg, args.funcs))
+        return
+    for bbs_per_func in args.sizes:
+        cfg = make_synthetic_cfg(
+            args.funcs, bbs_per_func=bbs_per_func, strings_per_func=4, seed=args.seed
+        )
+        bench_partition_inputs("synthetic", get_partition_inputs(cfg, 1))
+
+
+def bench_inliner(args):
+    print("funcs,interesting_funcs,after_inlining,inliner_s")
+    for num_funcs in args.sizes:
+        cfg = make_synthetic_cfg(num_funcs, bbs_per_func=4, seed=args.seed)
+        transformer = CFGTransformer(cfg)
+        transformer.remove_unrelated_funcs(cfg)
+        num_interesting = len(transformer.get_funcs())
+        gc.collect()
+        _, elapsed = timed(transformer.run_inliner_pass, cfg)
+        print(
+            f"{num_funcs},{num_interesting},{len(transformer.get_funcs())},"
+            f"{elapsed:.3f}"
+        )
+
+
+def make_call_chain(
+    num_funcs: int,
+    calls_per_func: int = 2,
+    seed: int = 0,
+    recursive_call_ratio: float = 0.01,
+) -> List[Funcnode]:
+    """
+    Functions of one BB each; function i calls i + 1 (a deep call chain) and
+    random later functions, and a few functions call an earlier one (recursion)
+    """
+    rng = random.Random(seed)
+    funcs: List[Funcnode] = []
+    for i in range(num_funcs):
+        func = Funcnode(0x100000 + i * 0x10)
+        func.register_bb(BB(func.addr, func))
+        funcs.append(func)
+    for i, caller in enumerate(funcs[:-1]):
+        call_site = caller.get_entry()
+        callees = [funcs[i + 1]]
+        for _ in range(calls_per_func - 1):
+            callees.append(funcs[rng.randrange(i + 1, num_funcs)])
+        if rng.random() < recursive_call_ratio:
+            callees.append(funcs[rng.randrange(0, i + 1)])
+        for callee in callees:
+            call_site.call_func.add(callee)
+            caller.call_func.add(callee)
+            callee.xrefs.add(call_site)
+    return funcs
+
+
+class FormerCallGraph(CallGraph):
+    """
+    CallGraph as before: recursive Tarjan and topological sort, list.pop(0) queue
+    and linear membership tests for the edges
+    """
+
+    def _build(self, init_funcs: List[Funcnode]):
+        def _add_func(f: Funcnode):
+            addr = f.addr
+            self.adj.append([])
+            self.addr_to_idx[addr] = self.num_vertices
+            self.idx_to_func.append(f)
+            self.removed.append(False)
+            self.num_vertices += 1
+            visited_funcs.add(addr)
+
+        visited_funcs: Set[int] = set()
+        for f in init_funcs:
+            _add_func(f)
+
+        funcs = init_funcs.copy()
+        while funcs:
+            f = funcs.pop(0)
+            for xref in f.xrefs:
+                caller = xref.parent_funcnode
+                if caller.addr not in visited_funcs:
+                    _add_func(caller)
+                    funcs.append(caller)
+                callee_idx = self.addr_to_idx[f.addr]
+                caller_idx = self.addr_to_idx[caller.addr]
+                if callee_idx not in self.adj[caller_idx]:
+                    self.adj[caller_idx].append(callee_idx)
+
+    def _find_sccs(self):
+        index = 0
+        stack = []
+        on_stack = [False] * self.num_vertices
+        indices = [-1] * self.num_vertices
+        lowlinks = [-1] * self.num_vertices
+        self.scc_ids = [-1] * self.num_vertices
+        self.scc_count = 0
+
+        def _strong_connect(v: int):
+            nonlocal index
+            indices[v] = index
+            lowlinks[v] = index
+            index += 1
+            stack.append(v)
+            on_stack[v] = True
+
+            for w in self.adj[v]:
+                if indices[w] == -1:
+                    _strong_connect(w)
+                    lowlinks[v] = min(lowlinks[v], lowlinks[w])
+                elif on_stack[w]:
+                    lowlinks[v] = min(lowlinks[v], indices[w])
+
+            if lowlinks[v] == indices[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    self.scc_ids[w] = self.scc_count
+                    if w == v:
+                        break
+                self.scc_count += 1
+
+        for v in range(self.num_vertices):
+            if indices[v] == -1:
+                _strong_connect(v)
+
+    def _build_contracted_dag(self):
+        self.scc_dag = [[] for _ in range(self.scc_count)]
+        for v in range(self.num_vertices):
+            for w in self.adj[v]:
+                scc_v, scc_w = self.scc_ids[v], self.scc_ids[w]
+                if scc_v != scc_w and scc_w not in self.scc_dag[scc_v]:
+                    self.scc_dag[scc_v].append(scc_w)
+
+    def reverse_topological_sort(self) -> List[int]:
+        visited = [False] * self.scc_count
+        stack = []
+
+        def dfs(v):
+            visited[v] = True
+            for neighbor in self.scc_dag[v]:
+                if not visited[neighbor]:
+                    dfs(neighbor)
+            stack.append(v)
+
+        for i in range(self.scc_count):
+            if not visited[i]:
+                dfs(i)
+        return stack
+
+
+def build_callgraph(callgraph_class, init_funcs: List[Funcnode]):
+    cg = callgraph_class(init_funcs)
+    return cg, cg.reverse_topological_sort()
+
+
+def bench_callgraph(args):
+    print("funcs,init_funcs,sccs,former_s,iterative_s")
+    # The former recursion is as deep as the call chain; Python (3.11+) frames
+    # do not use the C stack, so raising the limit is enough for it to finish
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * args.former_limit))
+    for num_funcs in args.sizes:
+        funcs = make_call_chain(num_funcs, args.calls_per_func, seed=args.seed)
+        # A few leaves of the call chain; the BFS over the callers reaches the rest
+        init_funcs = funcs[-args.init_funcs :]
+        gc.collect()
+        (cg, order), elapsed = timed(build_callgraph, CallGraph, init_funcs)
+        former_time = float("nan")
+        if num_funcs <= args.former_limit:
+            (former, former_order), former_time = timed(
+                build_callgraph, FormerCallGraph, init_funcs
+            )
+            assert former.adj == cg.adj and former.scc_ids == cg.scc_ids
+            assert former.scc_dag == cg.scc_dag and former_order == order
+            del former, former_order
+        print(
+            f"{num_funcs},{len(init_funcs)},{cg.scc_count},"
+            f"{former_time:.3f},{elapsed:.3f}"
+        )
+        del cg, order, funcs
+
+
+def bench_callgraph_updates(args):
+    print("funcs,changes,rebuild_s_per_change,incremental_s_per_change")
+    for num_funcs in args.sizes:
+        rng = random.Random(args.seed)
+        # No recursion to begin with: only the new calls make (small) cycles
+        funcs = make_call_chain(
+            num_funcs, args.calls_per_func, args.seed, recursive_call_ratio=0
+        )
+        cg = CallGraph(funcs[-args.init_funcs :])
+        # Random new calls between nearby functions of the chain; those going up the
+        # chain close cycles (merging SCCs), which split again when removed
+        calls = []
+        for _ in range(args.changes):
+            caller_idx = rng.randrange(num_funcs)
+            callee_idx = caller_idx + rng.randint(-args.span, args.span)
+            callee_idx = min(max(callee_idx, 0), num_funcs - 1)
+            calls.append((funcs[caller_idx], funcs[callee_idx]))
+        call_sites = []
+        for caller, callee in calls:
+            call_site = BB(caller.addr + 0x10 * len(caller.BBs), caller)
+            caller.register_bb(call_site)
+            call_sites.append(call_site)
+
+        def update():
+            for (caller, callee), call_site in zip(calls, call_sites):
+                callee.xrefs.add(call_site)
+                cg.add_call(caller, callee)
+            for (caller, callee), call_site in zip(calls, call_sites):
+                callee.xrefs.discard(call_site)
+                if all(xref.parent_funcnode != caller for xref in callee.xrefs):
+                    cg.remove_call(caller, callee)
+
+        gc.collect()
+        _, incremental_time = timed(update)
+        num_changes = 2 * len(calls)
+        _, rebuild_time = timed(CallGraph, funcs[-args.init_funcs :])
+        print(
+            f"{num_funcs},{num_changes},{rebuild_time:.4f},"
+            f"{incremental_time / num_changes:.6f}"
+        )
+
+
+def bench_implications(args):
+    print("funcs,implicated_edges,passes_s,passes_peak_mib,retained_mib")
+    for num_funcs in args.sizes:
+        cfg = make_synthetic_cfg(
+            num_funcs, bbs_per_func=args.bbs_per_func, seed=args.seed
+        )
+        gc.collect()
+        _, elapsed = timed(CFGTransformer(cfg).run_all_passes, cfg)
+        del cfg
+        cfg = make_synthetic_cfg(
+            num_funcs, bbs_per_func=args.bbs_per_func, seed=args.seed
+        )
+        gc.collect()
+        # What the passes leave allocated (mostly the edge implications)
+        tracemalloc.start()
+        CFGTransformer(cfg).run_all_passes(cfg)
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cfg.freeze()
+        num_edges = sum(
+            len(bb.edge_implicate_bbs)
+            for func in cfg.get_funcs()
+            for bb in func.get_bbs()
+        )
+        print(
+            f"{num_funcs},{num_edges},{elapsed:.3f},"
+            f"{peak / 2**20:.1f},{retained / 2**20:.1f}"
+        )
+
+
+def bench_load_memory(stat_dir: str):
+    # tracemalloc slows down the allocations; time a separate load
+    _, load_time = timed(bzc.load_static_analysis_result, stat_dir)
+    tracemalloc.start()
+    cfg, _, _ = bzc.load_static_analysis_result(stat_dir)
+    loaded, load_peak = tracemalloc.get_traced_memory()
+    cfg.freeze()
+    frozen = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    num_bbs = cfg.get_num_bbs()
+    del cfg
+
+    _, arrays_time = timed(CFGArrays.from_static_analysis, stat_dir)
+    tracemalloc.start()
+    arrays = CFGArrays.from_static_analysis(stat_dir)
+    arrays_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del arrays
+    print(
+        f"{num_bbs},{load_time:.3f},{load_peak / 2**20:.1f},"
+        f"{loaded / 2**20:.1f},{frozen / 2**20:.1f},"
+        f"{arrays_time:.3f},{arrays_size / 2**20:.1f}"
+    )
+
+
+def load_and_prune(stat_dir: str, prefer_binary: bool, pruned: bool) -> CFG:
+    cfg, _, _ = bzc.load_static_analysis_result(stat_dir, prefer_binary, pruned)
+    CFGTransformer(cfg).remove_unrelated_funcs(cfg)
+    return cfg
+
+
+def bench_pruned_load(args):
+    print("funcs,kept_funcs,format,full_s,full_peak_mib,pruned_s,pruned_peak_mib")
+    for num_funcs in args.sizes:
+        cfg = make_synthetic_cfg(
+            num_funcs,
+            bbs_per_func=32,
+            seed=args.seed,
+            string_func_ratio=args.string_func_ratio,
+            recursive_call_ratio=args.recursive_call_ratio,
+        )
+        with tempfile.TemporaryDirectory() as stat_dir:
+            write_static_analysis_result(cfg, stat_dir)
+            del cfg
+            convert_static_analysis_result(
+                stat_dir, os.path.join(stat_dir, BINARY_FILE_NAME)
+            )
+            for prefer_binary in (False, True):
+                results = []
+                for pruned in (False, True):
+                    # Do not let the previous (freed) CFG be collected in the timing
+                    gc.collect()
+                    _, elapsed = timed(load_and_prune, stat_dir, prefer_binary, pruned)
+                    cfg, _, peak = traced(
+                        load_and_prune, stat_dir, prefer_binary, pruned
+                    )
+                    results.append((cfg.get_num_funcs(), elapsed, peak))
+                    del cfg
+                assert results[0][0] == results[1][0]
+                (kept, full_time, full_peak), (_, pruned_time, pruned_peak) = results
+                print(
+                    f"{num_funcs},{kept},{'binary' if prefer_binary else 'text'},"
+                    f"{full_time:.3f},{full_peak / 2**20:.1f},"
+                    f"{pruned_time:.3f},{pruned_peak / 2**20:.1f}"
+                )
+
+
+def bench_memory(args):
+    print("bbs,load_s,load_peak_mib,loaded_mib,frozen_mib,arrays_load_s,arrays_mib")
+    if args.static_analysis:
+        for stat_dir in args.static_analysis:
+            bench_load_memory(stat_dir)
+        return
+    for num_funcs in args.sizes:
+        cfg = make_synthetic_cfg(num_funcs, bbs_per_func=32, seed=args.seed)
+        with tempfile.TemporaryDirectory() as stat_dir:
+            write_static_analysis_result(cfg, stat_dir)
+            del cfg
+            bench_load_memory(stat_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the preprocessing steps on synthetic CFGs"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    func_distance = subparsers.add_parser(
+        "func-distance", help="CFG.build_func_distance_map vs the former pairwise BFS"
+    )
+    func_distance.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 200, 400, 800, 1600]
+    )
+    func_distance.add_argument(
+        "--naive-limit",
+        type=int,
+        default=400,
+        help="Skip the former implementation above this number of functions",
+    )
+    func_distance.add_argument("-p", "--processes", type=int, default=os.cpu_count())
+    func_distance.set_defaults(func=bench_func_distance)
+
+    dominators = subparsers.add_parser(
+        "dominators", help="Dominator trees (CHK) vs the former dominator sets"
+    )
+    dominators.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[8, 32, 128, 512],
+        help="Numbers of BBs per function",
+    )
+    dominators.add_argument("--funcs", type=int, default=50)
+    dominators.set_defaults(func=bench_dominators)
+
+    passes = subparsers.add_parser(
+        "passes", help="CFGTransformer passes and dominators, serial vs process pool"
+    )
+    passes.add_argument("--sizes", type=int, nargs="+", default=[200, 800, 3200])
+    passes.add_argument("--bbs-per-func", type=int, default=32)
+    passes.add_argument("-p", "--processes", type=int, default=os.cpu_count())
+    passes.set_defaults(func=bench_passes)
+
+    node_removal = subparsers.add_parser(
+        "node-removal",
+        help="CFGTransformer.minimize_funcnode_cfg: former, one node at a time, batched",
+    )
+    node_removal.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[64, 256, 1024],
+        help="Numbers of BBs per function",
+    )
+    node_removal.add_argument("--funcs", type=int, default=20)
+    node_removal.add_argument("--strings-per-func", type=int, default=4)
+    node_removal.set_defaults(func=bench_node_removal)
+
+    inliner = subparsers.add_parser(
+        "inliner", help="One CFGTransformer inliner pass on growing call graphs"
+    )
+    inliner.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 4000, 16000, 32000]
+    )
+    inliner.set_defaults(func=bench_inliner)
+
+    callgraph = subparsers.add_parser(
+        "callgraph",
+        help="CallGraph construction, SCCs and topological sort: former vs iterative",
+    )
+    callgraph.add_argument(
+        "--sizes", type=int, nargs="+", default=[500, 5000, 50000, 500000]
+    )
+    callgraph.add_argument("--init-funcs", type=int, default=10)
+    callgraph.add_argument("--calls-per-func", type=int, default=4)
+    callgraph.add_argument(
+        "--former-limit",
+        type=int,
+        default=50000,
+        help="Skip the former implementation above this number of functions",
+    )
+    callgraph.set_defaults(func=bench_callgraph)
+
+    callgraph_updates = subparsers.add_parser(
+        "callgraph-updates",
+        help="CallGraph: incremental call changes vs a rebuild per change",
+    )
+    callgraph_updates.add_argument(
+        "--sizes", type=int, nargs="+", default=[5000, 50000, 500000]
+    )
+    callgraph_updates.add_argument("--changes", type=int, default=200)
+    callgraph_updates.add_argument(
+        "--span", type=int, default=50, help="Distance of the callee in the chain"
+    )
+    callgraph_updates.add_argument("--init-funcs", type=int, default=10)
+    callgraph_updates.add_argument("--calls-per-func", type=int, default=4)
+    callgraph_updates.set_defaults(func=bench_callgraph_updates)
+
+    implications = subparsers.add_parser(
+        "implications",
+        help="CFGTransformer.run_all_passes: time and memory of the edge implications",
+    )
+    implications.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000])
+    implications.add_argument("--bbs-per-func", type=int, default=64)
+    implications.set_defaults(func=bench_implications)
+
+    partition = subparsers.add_parser(
+        "partition",
+        help="Partition of merge_duplicate_nodes: former, Moore, Paige-Tarjan",
+    )
+    partition.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 4000, 16000],
+        help="Numbers of BBs per function",
+    )
+    partition.add_argument(
+        "--funcs",
+        type=int,
+        default=5,
+        help="Number of synthetic functions / largest functions to measure",
+    )
+    partition.add_argument(
+        "--static-analysis",
+        nargs="+",
+        help="Measure the largest functions of these Ghidra results",
+    )
+    partition.set_defaults(func=bench_partition)
+
+    memory = subparsers.add_parser(
+        "memory",
+        help="Load time and memory of the CFG (as loaded, frozen, and as CFGArrays)",
+    )
+    memory.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000])
+    memory.add_argument(
+        "--static-analysis",
+        nargs="+",
+        help="Measure these Ghidra results instead of synthetic CFGs",
+    )
+    memory.set_defaults(func=bench_memory)
+
+    pruned_load = subparsers.add_parser(
+        "pruned-load",
+        help="Full load + remove_unrelated_funcs vs the pruned load",
+    )
+    pruned_load.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000])
+    pruned_load.add_argument(
+        "--string-func-ratio",
+        type=float,
+        default=0.05,
+        help="Ratio of the functions that refer to string literals (the first ones)",
+    )
+    pruned_load.add_argument(
+        "--recursive-call-ratio",
+        type=float,
+        default=0.001,
+        help="Ratio of the calls to any function (the others call a later function)",
+    )
+    pruned_load.set_defaults(func=bench_pruned_load)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+import argparse
+import ctypes
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from fuzz_transport import (  # noqa E402
+    DELTA_HEADER,
+    PIPE_ACK,
+    PIPE_MESSAGE,
+    PIPE_REQUEST,
+    DeltaCoverage,
+    FileCoverage,
+    FileResponse,
+    MemfdResponse,
+    Session,
+    ShmCoverage,
+    read_exact,
+    serve_pipelined,
+)
+from async_server import AsyncServer, LatencyHistogram, StreamChannel  # noqa E402
+from response_dedup import HASH_NAME, ResponseDedup  # noqa E402
+
+sys.path.append(os.path.join(pwd, "..", "tests"))
+from testCFGArrays import write_ghidra_result  # noqa E402
+
+
+def make_response(rng: random.Random, num_lines: int) -> bytes:
+    words = [b"error", b"warning", b"parsing", b"tag", b"0x%x" % rng.getrandbits(16)]
+    return b"".join(
+        b" ".join(rng.choice(words) for _ in range(rng.randrange(1, 8))) + b"\n"
+        for _ in range(num_lines)
+    )
+
+
+class FormerFileResponse(FileResponse):
+    """
+    The former load_put_response: the files line by line
+    """
+
+    def load(self, max_lines: int) -> bytes:
+        lines = []
+        for path in self.paths:
+            prev_line = None
+            with open(path, "rb") as f:
+                for line in f:
+                    if line != prev_line:
+                        lines.append(line)
+                    prev_line = line
+        return b"".join(lines[-max_lines:])
+
+
+def per_load(response, max_lines: int, loads: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loads):
+        response.load(max_lines)
+    return (time.perf_counter() - start) / loads
+
+
+def bench_transport(args):
+    rng = random.Random(args.seed)
+    # /dev/shm like the default fuzzer output directory
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    print("lines,bytes,former_us_per_load,files_us_per_load,memfd_us_per_load")
+    with tempfile.TemporaryDirectory(dir=base_dir) as out_dir:
+        fds = (os.memfd_create("stdout"), os.memfd_create("stderr"))
+        for num_lines in args.lines:
+            stdout = make_response(rng, num_lines)
+            stderr = make_response(rng, num_lines // 10)
+            for name, fd, data in (
+                ("stdout.txt", fds[0], stdout),
+                ("stderr.txt", fds[1], stderr),
+            ):
+                with open(os.path.join(out_dir, name), "wb") as f:
+                    f.write(data)
+                os.ftruncate(fd, 0)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, data)
+            former = FormerFileResponse(out_dir)
+            files = FileResponse(out_dir)
+            memfds = MemfdResponse(fds)
+            expected = former.load(args.max_lines)
+            assert files.load(args.max_lines) == memfds.load(args.max_lines) == expected
+            former_s = per_load(former, args.max_lines, args.loads)
+            files_s = per_load(files, args.max_lines, args.loads)
+            memfd_s = per_load(memfds, args.max_lines, args.loads)
+            print(
+                f"{num_lines},{len(stdout) + len(stderr)},{former_s * 1e6:.1f},"
+                f"{files_s * 1e6:.1f},{memfd_s * 1e6:.1f}"
+            )
+        memfds.close()
+
+
+def per_write(coverage, idxs, writes: int) -> float:
+    start = time.perf_counter()
+    for _ in range(writes):
+        coverage.write(idxs)
+    return (time.perf_counter() - start) / writes
+
+
+def bench_coverage(args):
+    rng = random.Random(args.seed)
+    libc = ctypes.CDLL(None, use_errno=True)
+    # A trace_bits segment like afl_shm_init: IPC_PRIVATE, IPC_CREAT | 0600
+    shm_id = libc.shmget(0, args.map_size, 0o1000 | 0o600)
+    if shm_id < 0:
+        raise OSError(ctypes.get_errno(), "shmget")
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    print("vertices,edges_txt_us_per_write,shm_us_per_write")
+    try:
+        with tempfile.TemporaryDirectory(dir=base_dir) as out_dir:
+            files = FileCoverage(out_dir)
+            shm = ShmCoverage(str(shm_id), args.map_size)
+            for num_vertices in args.vertices:
+                idxs = [rng.randrange(1 << 20) for _ in range(num_vertices)]
+                files_s = per_write(files, idxs, args.writes)
+                shm_s = per_write(shm, idxs, args.writes)
+                print(f"{num_vertices},{files_s * 1e6:.1f},{shm_s * 1e6:.1f}")
+            shm.close()
+    finally:
+        # IPC_RMID
+        libc.shmctl(shm_id, 0, None)
+
+
+def bench_delta(args):
+    """
+    Executions whose coverage sets mostly repeat: what the server sends and
+    what the fuzzer sets in trace_bits per execution
+    """
+    rng = random.Random(args.seed)
+    # Coverage sets of paths through a few hot regions
+    regions = [
+        [rng.randrange(args.vertices) for _ in range(rng.randrange(10, 200))]
+        for _ in range(args.regions)
+    ]
+    sets = [
+        sorted({idx for region in rng.sample(regions, 4) for idx in region})
+        for _ in range(args.sets)
+    ]
+    runs = [rng.choice(sets) for _ in range(args.executions)]
+    print("mode,us_per_execution,payload_bytes_per_execution,bits_set_per_execution")
+    with tempfile.TemporaryDirectory() as out_dir:
+        files = FileCoverage(out_dir)
+        start = time.perf_counter()
+        for idxs in runs:
+            files.write(idxs)
+        elapsed = time.perf_counter() - start
+        # The fuzzer parses and sets every vertex
+        bits_set = sum(len(idxs) for idxs in runs)
+        payload_bytes = sum(len(f"{idx:x}\n") for idxs in runs for idx in idxs)
+        print(
+            f"edges_txt,{elapsed / len(runs) * 1e6:.1f},"
+            f"{payload_bytes / len(runs):.1f},{bits_set / len(runs):.1f}"
+        )
+
+    delta = DeltaCoverage()
+    payload_bytes = 0
+    start = time.perf_counter()
+    for idxs in runs:
+        delta.write(idxs)
+        payload_bytes += len(delta.payload())
+    elapsed = time.perf_counter() - start
+    bits_set = len(delta.reported)
+    print(
+        f"delta,{elapsed / len(runs) * 1e6:.1f},"
+        f"{payload_bytes / len(runs):.1f},{bits_set / len(runs):.1f}"
+    )
+
+
+def spend(seconds: float, busy: bool):
+    if not busy:
+        time.sleep(seconds)
+        return
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def serve_lockstep(read_fd, write_fd, load_response, infer):
+    """
+    Like start_fuzz_server: a 4-byte request, then the token and the payload
+    """
+    while read_exact(read_fd, 4) is not None:
+        token, payload = infer(load_response())
+        os.write(write_fd, token + payload)
+
+
+def read_result(fd: int) -> bytes:
+    header = read_exact(fd, DELTA_HEADER.size)
+    _, count = DELTA_HEADER.unpack(header)
+    return read_exact(fd, 4 * count) if count else b""
+
+
+def run_fuzzer(args, depth: int) -> float:
+    """
+    Executions per second of an emulated fuzzer against a forked server
+    (lock-step for depth 0)
+    """
+    rng = random.Random(args.seed)
+    responses = [make_response(rng, args.lines) for _ in range(64)]
+    fds = (os.memfd_create("stdout"), os.memfd_create("stderr"))
+    request_r, request_w = os.pipe()
+    result_r, result_w = os.pipe()
+    server_pid = os.fork()
+    if not server_pid:
+        os.close(request_w)
+        os.close(result_r)
+        response = MemfdResponse(fds)
+        coverage = DeltaCoverage()
+
+        def infer(data: bytes):
+            spend(args.infer_ms / 1000, args.busy)
+            coverage.write(range(hash(data) % 50))
+            return b"DONE", coverage.payload()
+
+        def load_response():
+            return response.load(5000)
+
+        if depth:
+            serve_pipelined(request_r, result_w, load_response, infer, depth)
+        else:
+            serve_lockstep(request_r, result_w, load_response, infer)
+        os._exit(0)
+
+    os.close(request_r)
+    os.close(result_w)
+    start = time.perf_counter()
+    results = 0
+    for request_id in range(args.executions):
+        # The PUT execution writes its response
+        spend(args.put_ms / 1000, args.busy)
+        for fd in fds:
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, rng.choice(responses), 0)
+        if not depth:
+            os.write(request_w, b"HOW\n")
+            read_exact(result_r, 4)
+            read_result(result_r)
+            results += 1
+            continue
+        os.write(request_w, PIPE_MESSAGE.pack(PIPE_REQUEST, request_id))
+        while True:
+            tag, _ = PIPE_MESSAGE.unpack(read_exact(result_r, PIPE_MESSAGE.size))
+            if tag == PIPE_ACK:
+                break
+            read_result(result_r)
+            results += 1
+    while results < args.executions:
+        # Only results are left
+        read_exact(result_r, PIPE_MESSAGE.size)
+        read_result(result_r)
+        results += 1
+    elapsed = time.perf_counter() - start
+    os.close(request_w)
+    os.waitpid(server_pid, 0)
+    os.close(result_r)
+    for fd in fds:
+        os.close(fd)
+    return args.executions / elapsed
+
+
+def bench_pipeline(args):
+    print(f"cpus: {os.cpu_count()}, busy: {args.busy}")
+    print("put_ms,infer_ms,lockstep_execs_per_s,pipelined_execs_per_s")
+    for put_ms, infer_ms in args.timings:
+        args.put_ms = put_ms
+        args.infer_ms = infer_ms
+        lockstep = run_fuzzer(args, 0)
+        pipelined = run_fuzzer(args, args.depth)
+        print(f"{put_ms},{infer_ms},{lockstep:.1f},{pipelined:.1f}")
+
+
+def make_stat_dir(stat_dir: str, num_funcs: int):
+    """
+    A synthetic static analysis, with every BB in vertex.txt
+    """
+    write_ghidra_result(stat_dir, num_funcs, 0)
+    with open(os.path.join(stat_dir, "CFG_analysis.txt")) as f:
+        funcnode_dict = json.load(f)
+    with open(os.path.join(stat_dir, "vertex.txt"), "w") as f:
+        for func in funcnode_dict.values():
+            for bb_addr in func["BBs"]:
+                f.write(f"{int(bb_addr):x}\n")
+
+
+def pss_kb(pids) -> int:
+    """
+    Proportional set size: the pages shared by n processes count 1/n each
+    """
+    total = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    total += int(line.split()[1])
+    return total
+
+
+def child_pids(pid: int):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def bench_daemon(args):
+    """
+    Startup and memory of one estimator per fuzzer vs one daemon for all of them
+    """
+    src_dir = os.path.join(pwd, "..", "src")
+    print(f"cpus: {os.cpu_count()}, funcs: {args.funcs}")
+    print("setup,fuzzers,processes,ready_s,pss_mb")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stat_dir = os.path.join(tmp_dir, "stat")
+        os.mkdir(stat_dir)
+        make_stat_dir(stat_dir, args.funcs)
+        env = dict(os.environ, FUZZ_STATIC_ANALYSIS_PATH=stat_dir, FUZZ_NO_SNAPSHOT="1")
+        # What each fuzz_server.py does before serving
+        setup = (
+            "import sys, fuzz_server; "
+            f"fuzz_server.setup_estimator({stat_dir!r}); "
+            "print('READY', flush=True); sys.stdin.read()"
+        )
+        for fuzzers in args.fuzzers:
+            start = time.perf_counter()
+            servers = [
+                subprocess.Popen(
+                    [sys.executable, "-c", setup],
+                    cwd=src_dir,
+                    env=env,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                )
+                for _ in range(fuzzers)
+            ]
+            for server in servers:
+                server.stdout.readline()
+            ready_s = time.perf_counter() - start
+            pss = pss_kb(server.pid for server in servers)
+            for server in servers:
+                server.stdin.close()
+                server.wait()
+                server.stdout.close()
+            print(f"per_fuzzer,{fuzzers},{fuzzers},{ready_s:.2f},{pss / 1024:.1f}")
+
+            socket_path = os.path.join(tmp_dir, "daemon.sock")
+            workers = min(fuzzers, args.workers)
+            daemon_env = dict(
+                env, FUZZ_DAEMON_SOCKET=socket_path, FUZZ_DAEMON_WORKERS=str(workers)
+            )
+            start = time.perf_counter()
+            daemon = subprocess.Popen(
+                [sys.executable, os.path.join(src_dir, "estimator_daemon.py")],
+                env=daemon_env,
+                stdout=subprocess.PIPE,
+            )
+            daemon.stdout.readline()
+            clients = []
+            for _ in range(fuzzers):
+                client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                client.connect(socket_path)
+                hello = f"out_dir={tmp_dir}\ncoverage=delta\n".encode()
+                client.sendall(len(hello).to_bytes(4, sys.byteorder) + hello)
+                client.recv(4)
+                clients.append(client)
+            ready_s = time.perf_counter() - start
+            pids = [daemon.pid] + child_pids(daemon.pid)
+            pss = pss_kb(pids)
+            for client in clients:
+                client.close()
+            daemon.terminate()
+            daemon.wait()
+            daemon.stdout.close()
+            print(f"daemon,{fuzzers},{len(pids)},{ready_s:.2f},{pss / 1024:.1f}")
+
+
+def async_infer(whole_bytes: bytes, start: float):
+    """
+    The response starts with the inference time to emulate, in ms
+    """
+    infer_ms, busy, _ = whole_bytes.split(b":", 2)
+    spend(float(infer_ms) / 1000, busy == b"1")
+    return [hash(whole_bytes) % 50], b"DONE"
+
+
+def run_async_fuzzer(args, infer_ms: float, request_w, result_r, fds, latency):
+    rng = random.Random(args.seed)
+    for _ in range(args.executions):
+        spend(args.put_ms / 1000, args.busy)
+        response = f"{infer_ms}:{int(args.busy)}:".encode() + make_response(rng, 10)
+        os.ftruncate(fds[0], 0)
+        os.pwrite(fds[0], response, 0)
+        start = time.perf_counter()
+        os.write(request_w, b"HOW\n")
+        read_exact(result_r, 4)
+        read_result(result_r)
+        latency.add(time.perf_counter() - start)
+    os.close(request_w)
+
+
+def bench_async(args):
+    """
+    Round-trip latency of fast fuzzers next to a slow one, on one event loop:
+    inference inline (like a daemon worker) vs on the pool
+    """
+    print(f"cpus: {os.cpu_count()}, busy: {args.busy}")
+    print("setup,fuzzers,fast_p50_ms,fast_p99_ms,slow_p50_ms,elapsed_s")
+    for workers in (0, args.workers):
+        server = AsyncServer(
+            async_infer,
+            lambda session, whole_bytes: False,
+            b"DUPL",
+            lambda addr_list, session: session.coverage.write(addr_list),
+            lambda session: None,
+            5000,
+            workers,
+        )
+        server.start_workers()
+        channels = []
+        fuzzers = []
+        for i in range(args.fuzzers):
+            fds = (os.memfd_create("stdout"), os.memfd_create("stderr"))
+            request_r, request_w = os.pipe()
+            result_r, result_w = os.pipe()
+            session = Session(
+                str(i), MemfdResponse(tuple(os.dup(fd) for fd in fds)), DeltaCoverage()
+            )
+            channels.append(StreamChannel(str(i), session, request_r, result_w, 0))
+            infer_ms = args.slow_ms if i == 0 else args.infer_ms
+            fuzzers.append((infer_ms, request_w, result_r, fds, LatencyHistogram()))
+        server_thread = threading.Thread(target=server.run, args=(channels,))
+        server_thread.start()
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=run_async_fuzzer, args=(args,) + fuzzer)
+            for fuzzer in fuzzers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        server_thread.join()
+        fast = LatencyHistogram()
+        for fuzzer in fuzzers[1:]:
+            fast.merge(fuzzer[4])
+        for _, _, result_r, fds, _ in fuzzers:
+            for fd in (result_r,) + fds:
+                os.close(fd)
+        slow = fuzzers[0][4]
+        print(
+            f"{'pool' if workers else 'inline'},{args.fuzzers},"
+            f"{fast.percentile(0.5) * 1000:.2f},{fast.percentile(0.99) * 1000:.2f},"
+            f"{slow.percentile(0.5) * 1000:.2f},{elapsed:.2f}"
+        )
+
+
+def bench_dedup(args):
+    """
+    Per-execution cost and memory of the dedup: the sha256 set it replaced vs
+    the bounded table
+    """
+    rng = random.Random(args.seed)
+    unique = [make_response(rng, args.lines) for _ in range(args.unique)]
+    responses = [rng.choice(unique) for _ in range(args.executions)]
+    print(f"hash: {HASH_NAME}, slots: {args.slots}")
+    print("dedup,us_per_execution,duplicates,memory_mb")
+
+    seen_bytes = set()
+    duplicates = 0
+    start = time.perf_counter()
+    for data in responses:
+        digest = hashlib.sha256(data).digest()
+        if digest in seen_bytes:
+            duplicates += 1
+        else:
+            seen_bytes.add(digest)
+    elapsed = time.perf_counter() - start
+    memory = sys.getsizeof(seen_bytes) + sum(map(sys.getsizeof, seen_bytes))
+    print(
+        f"sha256_set,{elapsed / len(responses) * 1e6:.2f},{duplicates},"
+        f"{memory / 2**20:.1f}"
+    )
+
+    dedup = ResponseDedup(args.slots)
+    start = time.perf_counter()
+    for data in responses:
+        dedup.seen(data)
+    elapsed = time.perf_counter() - start
+    memory = dedup.table.itemsize * len(dedup.table)
+    print(
+        f"table,{elapsed / len(responses) * 1e6:.2f},{dedup.duplicates},"
+        f"{memory / 2**20:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the fuzz server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    transport = subparsers.add_parser(
+        "transport", help="Loading the PUT response: files vs memfds"
+    )
+    transport.add_argument("--lines", type=int, nargs="+", default=[10, 100, 1000])
+    transport.add_argument("--max-lines", type=int, default=5000)
+    transport.add_argument("--loads", type=int, default=2000)
+    transport.add_argument("--seed", type=int, default=0)
+    transport.set_defaults(func=bench_transport)
+
+    coverage = subparsers.add_parser(
+        "coverage", help="Passing the coverage: edges.txt vs trace_bits"
+    )
+    coverage.add_argument("--vertices", type=int, nargs="+", default=[10, 100, 1000])
+    coverage.add_argument("--map-size", type=int, default=1 << 16)
+    coverage.add_argument("--writes", type=int, default=2000)
+    coverage.add_argument("--seed", type=int, default=0)
+    coverage.set_defaults(func=bench_coverage)
+
+    delta = subparsers.add_parser(
+        "delta", help="Full coverage (edges.txt) vs the new vertices only"
+    )
+    delta.add_argument("--vertices", type=int, default=100000)
+    delta.add_argument("--regions", type=int, default=200)
+    delta.add_argument("--sets", type=int, default=500)
+    delta.add_argument("--executions", type=int, default=20000)
+    delta.add_argument("--seed", type=int, default=0)
+    delta.set_defaults(func=bench_delta)
+
+    pipeline = subparsers.add_parser(
+        "pipeline", help="Lock-step vs pipelined protocol with an emulated fuzzer"
+    )
+    pipeline.add_argument(
+        "--timings",
+        type=lambda pair: tuple(map(float, pair.split(":"))),
+        nargs="+",
+        default=[(1, 1), (1, 3), (3, 1)],
+        help="<PUT execution ms>:<inference ms> pairs",
+    )
+    pipeline.add_argument("--depth", type=int, default=4)
+    pipeline.add_argument("--executions", type=int, default=500)
+    pipeline.add_argument("--lines", type=int, default=100)
+    pipeline.add_argument(
+        "--busy",
+        action="store_true",
+        help="spin instead of sleeping (CPU-bound PUT and inference)",
+    )
+    pipeline.add_argument("--seed", type=int, default=0)
+    pipeline.set_defaults(func=bench_pipeline)
+
+    daemon = subparsers.add_parser(
+        "daemon", help="One estimator per fuzzer vs the estimator daemon"
+    )
+    daemon.add_argument("--fuzzers", type=int, nargs="+", default=[1, 4, 16])
+    daemon.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    daemon.add_argument("--funcs", type=int, default=2000)
+    daemon.set_defaults(func=bench_daemon)
+
+    async_server = subparsers.add_parser(
+        "async", help="Tail latency next to a slow fuzzer: inline vs pool inference"
+    )
+    async_server.add_argument("--fuzzers", type=int, default=4)
+    async_server.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    async_server.add_argument("--put-ms", type=float, default=1)
+    async_server.add_argument("--infer-ms", type=float, default=1)
+    async_server.add_argument("--slow-ms", type=float, default=20)
+    async_server.add_argument("--executions", type=int, default=200)
+    async_server.add_argument(
+        "--busy",
+        action="store_true",
+        help="spin instead of sleeping (CPU-bound PUT and inference)",
+    )
+    async_server.add_argument("--seed", type=int, default=0)
+    async_server.set_defaults(func=bench_async)
+
+    dedup = subparsers.add_parser(
+        "dedup", help="Response dedup: sha256 set vs the bounded table"
+    )
+    dedup.add_argument("--unique", type=int, default=200000)
+    dedup.add_argument("--executions", type=int, default=500000)
+    dedup.add_argument("--lines", type=int, default=20)
+    dedup.add_argument("--slots", type=int, default=1 << 20)
+    dedup.add_argument("--seed", type=int, default=0)
+    dedup.set_defaults(func=bench_dedup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+import argparse
+import os
+import sys
+import time
+
+# import CFG_recover from "$PWD/../src/CFG_recover.py"
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+import bz_common as bzc  # noqa E402
+from cfg_binary import BINARY_FILE_NAME, convert_static_analysis_result  # noqa E402
+
+
+def timed_load(loader, stat_dir: str, prefer_binary: bool) -> float:
+    start = time.perf_counter()
+    loader(stat_dir, prefer_binary)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Convert Ghidra results (CFG_analysis.txt, pickle_analysis.bin, "
+        f"vertex.txt, edge.txt) into {BINARY_FILE_NAME} and compare the load times"
+    )
+    parser.add_argument(
+        "result_dir",
+        nargs="?",
+        default="/work/static-analysis-result",
+        help="Directory of the static analysis results (one subdirectory per target)",
+    )
+    parser.add_argument("-s", "--select", help="Comma-separated list of targets")
+    parser.add_argument(
+        "--no-bench", action="store_true", help="Only convert; skip the load times"
+    )
+    args = parser.parse_args()
+
+    if not args.no_bench:
+        # cfg: object CFG (load_static_analysis_result), arrays: CFGArrays
+        print("target,cfg_text_s,cfg_binary_s,arrays_text_s,arrays_binary_s")
+    for target in bzc.get_target_list(args.result_dir, args.select):
+        stat_dir = os.path.join(args.result_dir, target)
+        convert_static_analysis_result(
+            stat_dir, os.path.join(stat_dir, BINARY_FILE_NAME)
+        )
+        if args.no_bench:
+            print(f"Converted {target}")
+            continue
+        times = [
+            timed_load(loader, stat_dir, prefer_binary)
+            for loader in (bzc.load_static_analysis_result, bzc.load_cfg_arrays)
+            for prefer_binary in (False, True)
+        ]
+        print(",".join([target] + [f"{t:.3f}" for t in times]))
+
+
+if __name__ == "__main__":
+    main()
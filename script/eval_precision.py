@@ -14,9 +14,9 @@ from collections import defaultdict
 # import CFG_recover from "/work/src/CFG_recover.py"
 sys.path.append("/work/src")
 import bz_common as bzc  # noqa E402
-from CFG_transform import CFGTransformer
+from snapshot import load_preprocessed
+from cfg_arrays import np
 from bb_match import (
-    BBMatcher,
     LabradorMatcher,
     RegexMatcher,
     augment_must_bbs,
@@ -70,7 +70,13 @@ def find_all_files_deep(directory):
     return all_files
 
 
+# Pin output: (src, dst) pairs of little-endian u64; returns an Nx2 array if numpy is
+# available (CFG.convert_edges_to_BBs takes it as is)
 def get_edges(edge_bytes):
+    # A trace cut off by the timeout may end in the middle of an edge
+    edge_bytes = edge_bytes[: len(edge_bytes) // 16 * 16]
+    if np is not None:
+        return np.frombuffer(edge_bytes, dtype="<u8").reshape(-1, 2)
     edges = []
     for i in range(0, len(edge_bytes), 16):
         src = int.from_bytes(edge_bytes[i : i + 8], "little")
@@ -133,13 +139,11 @@ def run_PIN_put(target_dir, input_file):
     return response, edges
 
 
-def build_minimized_cfg(target):
-    cfg, _, _ = bzc.load_static_analysis_result(os.path.join(ghidra_dir, target))
-    transformer = CFGTransformer(cfg)
-    transformer.run_all_passes(cfg)
-    cfg.build_dominators()
-    cfg.build_func_distance_map()
-    return cfg
+# Minimized CFG and its BBMatcher; reused from the snapshot unless `rebuild`
+def build_minimized_cfg(target, processes=1, rebuild=False):
+    return load_preprocessed(
+        os.path.join(ghidra_dir, target), processes, rebuild=rebuild
+    )
 
 
 def get_estimations(
@@ -191,13 +195,17 @@ def get_estimations(
 
 
 def get_precision_stats(real_bbs, estim_bbs):
-    tp = estim_bbs.intersection(real_bbs)
-    fp = estim_bbs.difference(real_bbs)
-    fn = real_bbs.difference(estim_bbs)
+    # real_bbs come from the original CFG and estim_bbs from the minimized one;
+    # BBs of different CFGs are compared by their addresses
+    real_addrs = {bb.start_addr for bb in real_bbs}
+    estim_addrs = {bb.start_addr for bb in estim_bbs}
+    tp = estim_addrs.intersection(real_addrs)
+    fp = estim_addrs.difference(real_addrs)
+    fn = real_addrs.difference(estim_addrs)
 
     try:
         recall = len(tp) / (len(tp) + len(fn))
-        precision = len(tp) / len(estim_bbs)
+        precision = len(tp) / len(estim_addrs)
         f1 = 2 * precision * recall / (precision + recall)
     except ZeroDivisionError:
         recall = 0
@@ -226,13 +234,14 @@ def run_func_timeout(generic_func, timeout):
     return func_wrapper
 
 
-def process_target(target_root, target):
+def process_target(target_root, target, processes=1, rebuild=False):
     target_dir = os.path.join(target_root, target)
     unpacked_seeds_dir = unpack_seeds(target_dir)
     all_seeds = find_all_files_deep(unpacked_seeds_dir)
-    min_cfg = build_minimized_cfg(target)
+    min_cfg, _, shepherd_bb_matcher = build_minimized_cfg(target, processes, rebuild)
 
-    orig_cfg, _, _ = bzc.load_static_analysis_result(os.path.join(ghidra_dir, target))
+    # The original CFG is only read (address lookups); the array form is enough
+    orig_cfg = bzc.load_cfg_arrays(os.path.join(ghidra_dir, target))
     # Create necessary directories for caching
     responses_dir = os.path.join(cache_dir, target, "responses")
     edges_dir = os.path.join(cache_dir, target, "edges")
@@ -285,7 +294,6 @@ def process_target(target_root, target):
     labrador_total_time = 0
     regex_total_time = 0
 
-    shepherd_bb_matcher = BBMatcher(min_cfg)
     # No-cache labrador matcher
     lab_low_matcher = LabradorMatcher(min_cfg, 0.35)
     lab_high_matcher = LabradorMatcher(min_cfg, 0.70)
@@ -423,7 +431,12 @@ def main():
         default=cpu_count(),
         help="Number of concurrent processes",
     )
-    parser.parse_args()
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Ignore the preprocessing snapshots and build them again",
+    )
+    args = parser.parse_args()
 
     target_root = "/work/target"
     target_list = bzc.get_target_list(target_root)
@@ -432,7 +445,7 @@ def main():
     print(f"Found {len(target_list)} targets")
     print(target_list)
     for target in target_list:
-        process_target(target_root, target)
+        process_target(target_root, target, args.processes, args.rebuild)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,41 @@
 # -*- coding: utf-8 -*-
 import json
-from typing import List, Dict, Optional, Set, Tuple, DefaultDict
-from bisect import bisect_right
+from collections import defaultdict
+from itertools import count
+from typing import List, Dict, Optional, Sequence, Set, Tuple, DefaultDict
+from cfg_arrays import SortedRanges, flatten_addrs
+from implications import ImplicationTable
+from func_distance import build_func_distance_matrix, LazyFuncDistance
+from dominators import (
+    DominatorTree,
+    build_dominator_tree,
+    build_post_dominator_tree,
+)
+
+
+# Process-wide id counter; CFG.assign_ids renumbers the BBs/functions densely per CFG
+_next_id = count()
+
+# Shared by every BB without edge implications after CFG.freeze
+_NO_IMPLICATIONS: Dict["BB", Tuple["BB", ...]] = {}
 
 
 class Funcnode:
+    # No __dict__ per object; this keeps large CFGs compact
+    __slots__ = (
+        "id",
+        "addr",
+        "BBs",
+        "call_func",
+        "xrefs",
+        "dom_tree",
+        "pdom_tree",
+        "implications",
+    )
+
     def __init__(self, addr: int):
+        # Integer id; dense in a CFG (see CFG.assign_ids)
+        self.id: int = next(_next_id)
         # Entry address of this function
         self.addr: int = addr
         # All BBs which this function own
@@ -14,71 +44,46 @@ class Funcnode:
         self.call_func: Set[Funcnode] = set()
         # All BBs that call this function
         self.xrefs: Set[BB] = set()
-
-    def build_dominators(self):
+        # (Post-)dominator trees over the BBs; built by CFG.build_dominators
+        self.dom_tree: Optional[DominatorTree] = None
+        self.pdom_tree: Optional[DominatorTree] = None
+        # Edge implications of the BBs while the CFG is transformed; created on
+        # first use and moved into BB.edge_implicate_bbs by CFG.freeze
+        self.implications: Optional[ImplicationTable] = None
+
+    def get_implications(self) -> ImplicationTable:
+        if self.implications is None:
+            self.implications = ImplicationTable()
+        return self.implications
+
+    def get_implicated_bbs(self, src: "BB", dst: "BB") -> Sequence["BB"]:
         """
-        We are not much interested in the performance of this function.
-        Naive dataflow equation solver (Lattice: Set of BBs, Join: Intersection)
+        BBs implicated by passing the edge (src -> dst), before or after CFG.freeze
         """
-        entry_bb = self.get_entry()
+        if self.implications is None:
+            return src.edge_implicate_bbs.get(dst, ())
+        return self.implications.to_bbs(self.implications.get(src, dst))
+
+    def _get_int_succs(self) -> Tuple[List["BB"], List[List[int]]]:
         bbs = self.get_bbs()
+        bb_to_idx = {bb: i for i, bb in enumerate(bbs)}
+        succs = [[bb_to_idx[succ] for succ in bb.dst_bbs] for bb in bbs]
+        return bbs, succs
 
-        for bb in bbs:
-            if bb == entry_bb:
-                bb.doms = {bb}
-            else:
-                bb.doms = set(bbs)
-
-        changed = True
-        while changed:
-            changed = False
-            for bb in bbs:
-                """
-                Dataflow Equation:
-                Dom(n) = {n}                                 if n is the entry_bb
-                         {n} ∪ (⋂ (Dom(p) for p in n.preds)) otherwise
-                """
-                if bb == entry_bb:
-                    assert bb.doms == {bb}
-                    continue
-                pred_doms = [pred.doms for pred in bb.pred_bbs]
-                new_doms = {bb} | set.intersection(*pred_doms)
-                if new_doms != bb.doms:
-                    bb.doms = new_doms
-                    changed = True
+    def build_dominators(self):
+        """
+        Immediate-dominator tree by the Cooper-Harvey-Kennedy algorithm
+        """
+        bbs, succs = self._get_int_succs()
+        entry_idx = bbs.index(self.get_entry())
+        self.dom_tree = build_dominator_tree(bbs, succs, entry_idx)
 
     def build_post_dominators(self):
         """
-        TODO: Precondition "every vertex is reachable from the entry" does not hold, so needs fix!
+        Immediate-post-dominator tree; sinks are connected to a virtual exit
         """
-        # Sink BBs are connecdted to the virtual entry BB
-        sink_bbs = set(self.get_sinks())
-        virtual_entry = BB(-1, self)
-        bbs = self.get_bbs()
-        for bb in bbs:
-            if bb in sink_bbs:
-                bb.pdoms = {bb, virtual_entry}
-            else:
-                bb.pdoms = set(bbs)
-
-        changed = True
-        while changed:
-            changed = False
-            for bb in bbs:
-                if bb in sink_bbs:
-                    assert bb.pdoms == {bb, virtual_entry}
-                    continue
-                succ_pdoms = [succ.pdoms for succ in bb.dst_bbs]
-                new_pdoms = {bb} | set.intersection(*succ_pdoms)
-                if new_pdoms != bb.pdoms:
-                    bb.pdoms = new_pdoms
-                    changed = True
-
-        for bb in bbs:
-            if virtual_entry in bb.pdoms:
-                bb.pdoms.remove(virtual_entry)
-
-        del virtual_entry
+        bbs, succs = self._get_int_succs()
+        self.pdom_tree = build_post_dominator_tree(bbs, succs)
 
     def update_preds(self):
         """
@@ -113,8 +118,27 @@ class Funcnode:
 
 
 class BB:
+    """
+    BBs hash by identity (natively); BBs of different CFG objects are never equal,
+    so compare their start_addr instead.
+    """
+
+    __slots__ = (
+        "id",
+        "start_addr",
+        "end_addr",
+        "dst_bbs",
+        "pred_bbs",
+        "parent_funcnode",
+        "xrefs",
+        "call_func",
+        "edge_implicate_bbs",
+    )
+
     def __init__(self, start_addr: int, parent_funcnode: Funcnode):
-        # Entry of this BB; this works as a unique identifier
+        # Integer id; dense in a CFG (see CFG.assign_ids)
+        self.id: int = next(_next_id)
+        # Entry of this BB; this is unique in a CFG
         # In Ghidra, `block.getFirstStartAddress().getOffset()``
         self.start_addr: int = start_addr
         # Address of final inst of this BB
@@ -122,6 +146,7 @@ class BB:
         self.end_addr: Optional[int] = None
 
         # Successor BBs
+        # (The containers of BBs/functions/xrefs become tuples by CFG.freeze)
         self.dst_bbs: Set[BB] = set()
         # Predecessor BBs (NOT always correct; sometimes needs rebuilding by Funcnode.update_preds)
         self.pred_bbs: Set[BB] = set()
@@ -136,12 +161,9 @@ class BB:
         # Passing edge (self -> other) can implicate passing other removed BBs
         # (i.e. self -> removed -> other in original CFG)
         # Or can be perceived as a metadata of the outgoing edges
-        self.edge_implicate_bbs: DefaultDict[BB, Set[BB]] = DefaultDict(set)
-
-        # Dominators of this BB
-        self.doms: Set["BB"] = set()
-        # Post-dominators of this BB
-        self.pdoms: Set["BB"] = set()
+        # Filled by CFG.freeze from the ImplicationTable of the function (which the
+        # transformations update); a read-only dict without empty entries, use .get()
+        self.edge_implicate_bbs: Dict[BB, Tuple[BB, ...]] = _NO_IMPLICATIONS
 
     def __str__(self):
         return hex(self.start_addr)
@@ -149,19 +171,14 @@ class BB:
     def __repr__(self):
         return self.__str__()
 
-    def __eq__(self, other):
-        assert isinstance(other, BB)
-        return self.start_addr == other.start_addr
-
-    def __hash__(self):
-        return hash(self.start_addr)
-
 
 class XREF:
     """
     Represents info about string literals (literal + referring BBs)
     """
 
+    __slots__ = ("bbs", "literal", "ro_addrs", "funcnodes")
+
     def __init__(self, literal: bytes):
         # BBs that refer to this literal
         self.bbs: Set[BB] = set()
@@ -173,6 +190,17 @@ class XREF:
         # This is not used; just for Ghidra-output compatibility
         self.funcnodes: Set[int] = set()
 
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # pickle_analysis.bin made before __slots__ holds the __dict__ of each XREF;
+        # (__dict__, slots) pairs come from the default reduction of other Pythons
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
 class AddrToBBLookup:
     """
@@ -184,18 +212,34 @@ class AddrToBBLookup:
         bbs = list(bb_set)
         self.sorted_bbs = sorted(bbs, key=lambda x: x.start_addr)
         self.start_addrs = [bb.start_addr for bb in self.sorted_bbs]
+        self.ranges = SortedRanges(
+            self.start_addrs, [bb.end_addr or 0 for bb in self.sorted_bbs]
+        )
 
     def _get_bb(self, addr: int):
-        index = bisect_right(self.start_addrs, addr) - 1
-        if index >= 0:
-            bb = self.sorted_bbs[index]
-            if bb.end_addr and bb.start_addr <= addr <= bb.end_addr:
-                return bb
-        return None
+        index = self.ranges.find(addr)
+        return self.sorted_bbs[index] if index >= 0 else None
 
     def __call__(self, addr: int):
         return self._get_bb(addr)
 
+    def lookup_many(self, addrs) -> List[Optional[BB]]:
+        """
+        BB (or None) of every address, resolved at once
+        """
+        sorted_bbs = self.sorted_bbs
+        return [
+            sorted_bbs[index] if index >= 0 else None
+            for index in self.ranges.find_many(addrs)
+        ]
+
+    def lookup_unique(self, addrs) -> Set[BB]:
+        """
+        The BBs containing any of `addrs`; duplicated addresses are resolved once
+        """
+        sorted_bbs = self.sorted_bbs
+        return {sorted_bbs[index] for index in self.ranges.find_unique(addrs)}
+
 
 class Edge:
     """
@@ -341,44 +385,81 @@ class CFG:
             for bb in func.BBs.values()
         )
 
-    def build_dominators(self):
-        for func in self.get_funcs():
-            func.build_dominators()
-            func.build_post_dominators()
+    def build_dominators(self, processes: int = 1):
+        if processes <= 1:
+            for func in self.get_funcs():
+                func.build_dominators()
+                func.build_post_dominators()
+            return
+        # parallel_preprocess depends on this module
+        from parallel_preprocess import PreprocessPool, run_idoms
 
-    def build_func_distance_map(self):
+        funcs = self.get_funcs()
+        int_succs = [func._get_int_succs() for func in funcs]
+        args_list = [
+            (succs, bbs.index(func.get_entry()))
+            for func, (bbs, succs) in zip(funcs, int_succs)
+        ]
+        with PreprocessPool(processes) as pool:
+            idoms = pool.map(run_idoms, args_list)
+        for func, (bbs, _), (idom, post_idom) in zip(funcs, int_succs, idoms):
+            func.dom_tree = DominatorTree(bbs, idom)
+            func.pdom_tree = DominatorTree(bbs, post_idom)
+
+    def assign_ids(self):
         """
-        NOTE: This is super slow, although we don't need a super fast implementation.
+        Dense ids: functions in funcnode_dict order, BBs in the order of the functions
+        and then Funcnode.get_bbs() (i.e. the order of CFG_analysis.txt after loading)
         """
+        bb_id = 0
+        for func_id, func in enumerate(self.funcnode_dict.values()):
+            func.id = func_id
+            for bb in func.BBs.values():
+                bb.id = bb_id
+                bb_id += 1
+        self.num_bb_ids = bb_id
+
+    def freeze(self):
+        """
+        Compact read-only form for the estimation, after all the transformations:
+        edges, xrefs and calls become tuples and only the non-empty edge
+        implications are kept. Nothing may modify the CFG after this.
+        """
+        for func in self.funcnode_dict.values():
+            func.update_preds()
+        for func in self.funcnode_dict.values():
+            func.call_func = tuple(func.call_func)
+            func.xrefs = tuple(func.xrefs)
+            for bb in func.BBs.values():
+                bb.dst_bbs = tuple(bb.dst_bbs)
+                bb.pred_bbs = tuple(bb.pred_bbs)
+                bb.xrefs = tuple(bb.xrefs)
+                bb.call_func = tuple(bb.call_func)
+                bb.edge_implicate_bbs = _NO_IMPLICATIONS
+            if func.implications is not None:
+                table = func.implications
+                for src, dst, bits in table.items():
+                    if src.edge_implicate_bbs is _NO_IMPLICATIONS:
+                        src.edge_implicate_bbs = {}
+                    src.edge_implicate_bbs[dst] = tuple(table.to_bbs(bits))
+                func.implications = None
+        for xref in self.string_xref.values():
+            xref.bbs = tuple(xref.bbs)
 
-        def get_caller_distances(func: Funcnode) -> Dict[Funcnode, int]:
-            distances = {func: 0}
-            queue: List[Funcnode] = [func]
-            while queue:
-                current = queue.pop(0)
-                caller_funcs = {bb.parent_funcnode for bb in current.xrefs}
-                for caller in caller_funcs:
-                    if caller not in distances:
-                        distances[caller] = distances[current] + 1
-                        queue.append(caller)
-            return distances
-
-        distance_map: Dict[Tuple[Funcnode, Funcnode], int] = {}
+    def build_func_distance_map(self, processes: int = 1):
+        """
+        One up-then-down BFS per function fills a compact symmetric matrix
+        (the former implementation re-ran the caller-BFS for every pair).
+        """
         funcs = self.get_funcs()
+        self.func_distance_map = build_func_distance_matrix(funcs, processes)
 
-        for i, f1 in enumerate(funcs):
-            f1_dists = get_caller_distances(f1)
-            for f2 in funcs[i:]:
-                f2_dists = get_caller_distances(f2)
-                # Find the smallest common element in the two distance maps
-                common_funcs = set(f1_dists.keys()) & set(f2_dists.keys())
-                if common_funcs:
-                    min_dist = min(f1_dists[f] + f2_dists[f] for f in common_funcs)
-                else:
-                    min_dist = 100
-                distance_map[f1, f2] = min_dist
-                distance_map[f2, f1] = min_dist
-        self.func_distance_map = distance_map
+    def build_lazy_func_distance_map(self, cache_size: int = 1 << 16):
+        """
+        Distances are computed on first use instead; startup does not pay for the
+        whole matrix (see LazyFuncDistance).
+        """
+        self.func_distance_map = LazyFuncDistance(self.get_funcs(), cache_size)
 
     def get_func_distance(self, f1: Funcnode, f2: Funcnode) -> int:
         return self.func_distance_map[f1, f2]
@@ -386,15 +467,24 @@ class CFG:
     def get_bb_distance(self, bb1: BB, bb2: BB) -> int:
         return self.get_func_distance(bb1.parent_funcnode, bb2.parent_funcnode)
 
-    def struct_CFG(self, json_path: str):
+    def struct_CFG(self, json_path: str, pruned: bool = False):
         """
         The loaded data of Ghidra CFG is not complete and needs some more work here.
-        This is the actual initialization of this class
+        This is the actual initialization of this class.
+        With `pruned`, only the functions that refer to strings and their transitive
+        callers are built (see get_string_related_func_addrs).
         """
         # _funcnode: {"call_func": [], "BBs": {}, "xrefs":[]}
         # _bb: {"dst_bbs": [], "call_func": [], "xrefs":[], "end_addr": None, "parent_funcnode": None}
         with open(json_path, "r") as f:
             _fuccnode_dict = json.load(f)
+        if pruned:
+            func_addrs = self.get_string_related_func_addrs(_fuccnode_dict)
+            _fuccnode_dict = {
+                func_addr: _funcnode
+                for func_addr, _funcnode in _fuccnode_dict.items()
+                if int(func_addr) in func_addrs
+            }
         bb_set = set()
         for func_addr in _fuccnode_dict.keys():
             _funcnode = _fuccnode_dict[str(func_addr)]
@@ -415,6 +505,7 @@ class CFG:
         """
 
         self.addr2bb = AddrToBBLookup(bb_set)
+        self.assign_ids()
 
         for func_addr in _fuccnode_dict.keys():
             _funcnode = _fuccnode_dict[func_addr]
@@ -426,21 +517,106 @@ class CFG:
                     bb.dst_bbs.add(funcnode.BBs[dst_addr])
                     funcnode.BBs[dst_addr].pred_bbs.add(bb)
                 for call_addr in _bb["call_func"]:
-                    callee = self.funcnode_dict[call_addr]
+                    callee = self.funcnode_dict.get(call_addr)
+                    if callee is None:
+                        # Pruned
+                        continue
                     bb.call_func.add(callee)
                     funcnode.call_func.add(callee)
                     callee.xrefs.add(bb)
 
         for xref in self.string_xref.values():
             funcnode_addr = xref.funcnodes
-            xref.funcnodes = set()
+            xref.funcnodes = set(funcnode_addr)
             bb_addr = xref.bbs
             xref.bbs = set()
             for funcaddr in funcnode_addr:
-                xref.funcnodes.add(self.funcnode_dict[funcaddr].addr)
+                funcnode = self.funcnode_dict.get(funcaddr)
+                if funcnode is None:
+                    # Pruned; none of `bb_addr` is in this function
+                    continue
                 for bbaddr in bb_addr:
-                    if bbaddr in self.funcnode_dict[funcaddr].BBs.keys():
-                        xref.bbs.add(self.funcnode_dict[funcaddr].BBs[bbaddr])
+                    if bbaddr in funcnode.BBs.keys():
+                        xref.bbs.add(funcnode.BBs[bbaddr])
+            for bb in xref.bbs:
+                bb.xrefs.add(xref)
+
+    def get_string_related_func_addrs(self, _fuccnode_dict: dict) -> Set[int]:
+        """
+        Functions that CFGTransformer keeps, computed on the raw CFG_analysis.txt:
+        the functions with a BB referring to a string and their transitive callers
+        """
+        callers: DefaultDict[int, Set[int]] = defaultdict(set)
+        for func_addr, _funcnode in _fuccnode_dict.items():
+            for _bb in _funcnode["BBs"].values():
+                for call_addr in _bb["call_func"]:
+                    callers[call_addr].add(int(func_addr))
+
+        related: Set[int] = set()
+        for xref in self.string_xref.values():
+            for func_addr in xref.funcnodes:
+                _funcnode = _fuccnode_dict.get(str(func_addr))
+                if _funcnode is None or func_addr in related:
+                    continue
+                _bbs = _funcnode["BBs"]
+                if any(str(bb_addr) in _bbs for bb_addr in xref.bbs):
+                    related.add(func_addr)
+        queue = list(related)
+        while queue:
+            for caller in callers[queue.pop()]:
+                if caller not in related:
+                    related.add(caller)
+                    queue.append(caller)
+        return related
+
+    def struct_CFG_from_arrays(self, arrays, func_ids: Optional[Set[int]] = None):
+        """
+        Same as struct_CFG, from CFGArrays (e.g. a mmap-ed static_analysis.bin);
+        every reference is already resolved to an id, so nothing is parsed here.
+        With `func_ids`, only those functions (array ids) are materialized, and
+        calls to the other functions are dropped.
+        """
+        if func_ids is None:
+            func_ids = range(len(arrays.func_addr))
+        funcs: List[Optional[Funcnode]] = [None] * len(arrays.func_addr)
+        bbs: List[Optional[BB]] = [None] * len(arrays.bb_start)
+        func_bbs, bb_start, bb_end = arrays.func_bbs, arrays.bb_start, arrays.bb_end
+        for func_id in sorted(func_ids):
+            funcnode = funcs[func_id] = Funcnode(arrays.func_addr[func_id])
+            self.funcnode_dict[funcnode.addr] = funcnode
+            for bb_id in range(func_bbs[func_id], func_bbs[func_id + 1]):
+                start_addr = bb_start[bb_id]
+                bb = bbs[bb_id] = BB(start_addr, funcnode)
+                bb.end_addr = bb_end[bb_id] or None
+                funcnode.BBs[start_addr] = bb
+        live_bbs = [bb for bb in bbs if bb is not None]
+        self.addr2bb = AddrToBBLookup(set(live_bbs))
+        self.assign_ids()
+
+        succ_offsets, succ_ids = arrays.succs.offsets, arrays.succs.ids
+        call_offsets, call_ids = arrays.calls.offsets, arrays.calls.ids
+        for bb_id, bb in enumerate(bbs):
+            if bb is None:
+                continue
+            for k in range(succ_offsets[bb_id], succ_offsets[bb_id + 1]):
+                dst_bb = bbs[succ_ids[k]]
+                bb.dst_bbs.add(dst_bb)
+                dst_bb.pred_bbs.add(bb)
+            for k in range(call_offsets[bb_id], call_offsets[bb_id + 1]):
+                callee = funcs[call_ids[k]]
+                if callee is None:
+                    continue
+                bb.call_func.add(callee)
+                bb.parent_funcnode.call_func.add(callee)
+                callee.xrefs.add(bb)
+
+        for xref_id, literal in enumerate(arrays.literals):
+            xref = XREF(literal)
+            xref.bbs = {bbs[bb_id] for bb_id in arrays.xref_bbs[xref_id]}
+            xref.bbs.discard(None)
+            xref.funcnodes = set(arrays.xref_func_addrs[xref_id])
+            xref.ro_addrs = set(arrays.xref_ro_addrs[xref_id])
+            self.string_xref[literal] = xref
             for bb in xref.bbs:
                 bb.xrefs.add(xref)
 
@@ -478,18 +654,10 @@ class CFG:
             path.create_BB_set()
         return list(paths.values())
 
-    def convert_edges_to_BBs(self, edges: List[Tuple[int, int]]) -> Set[BB]:
+    def convert_edges_to_BBs(self, edges) -> Set[BB]:
         """
         We need this method in addition to another that retrieves real edges because
-        Ghidra CFG graph lacks completeness (i.e. missing run-time edges)
+        Ghidra CFG graph lacks completeness (i.e. missing run-time edges).
+        `edges`: (src, dst) tuples, an Nx2 numpy array or a flat address array
         """
-        bbs: Set[BB] = set()
-        for src_addr, dst_addr in edges:
-            src_bb = self.get_bb_from_addr(src_addr)
-            dst_bb = self.get_bb_from_addr(dst_addr)
-            if src_bb:
-                bbs.add(src_bb)
-            if dst_bb:
-                bbs.add(dst_bb)
-
-        return bbs
+        return self.addr2bb.lookup_unique(flatten_addrs(edges))
@@ -2,14 +2,105 @@
 import logging
 from CFG_recover import Funcnode, BB, CFG
 from graph_algo import CallGraph
-from typing import List, Set
-from collections import defaultdict
+from implications import ImplicationTable
+from parallel_preprocess import (
+    PreprocessPool,
+    encode_func,
+    apply_result,
+    run_minimize,
+    run_merge,
+)
+from dominators import reverse_postorder
+from partition import coarsest_stable_partition
+from typing import Dict, Iterable, List, Set, Hashable, Optional, Tuple
+
+
+class _RemovedRegion:
+    """
+    The BBs removed by CFGTransformer.remove_nodes, numbered, with their outgoing
+    edges; implicated BBs are bitsets of the ImplicationTable of the function
+    """
+
+    def __init__(self, bbs: Set[BB], table: ImplicationTable):
+        self.bbs = list(bbs)
+        self.idx = {bb: i for i, bb in enumerate(self.bbs)}
+        self.table = table
+        # (index of the successor or -1 if it remains, successor, implicated bits);
+        # a self loop implicates more than the path without it, so it is left out
+        self.out_edges: List[List[Tuple[int, BB, int]]] = []
+        for bb in self.bbs:
+            edges = []
+            for succ in bb.dst_bbs:
+                if succ == bb:
+                    continue
+                bits = table.get(bb, succ)
+                succ_idx = self.idx.get(succ, -1)
+                if succ_idx != -1:
+                    bits |= table.bit(succ)
+                edges.append((succ_idx, succ, bits))
+            self.out_edges.append(edges)
+        self.succs = [
+            [succ_idx for succ_idx, _, _ in edges if succ_idx != -1]
+            for edges in self.out_edges
+        ]
+
+    def contract_paths(self, src: BB) -> Dict[BB, int]:
+        """
+        The remaining BBs reached from `src` through the removed BBs, and for each
+        of them the BBs implicated by every such path: the implications of the edges
+        on the path and the removed BBs on it, intersected over the paths.
+        """
+        roots = []
+        # Implicated bits of the paths src -> ... -> (removed BB)
+        reached: List[Optional[int]] = [None] * len(self.bbs)
+        for succ in src.dst_bbs:
+            succ_idx = self.idx.get(succ, -1)
+            if succ_idx == -1:
+                continue
+            reached[succ_idx] = self.table.get(src, succ) | self.table.bit(succ)
+            roots.append(succ_idx)
+        order = reverse_postorder(self.succs, roots)
+        rpo_num = {v: i for i, v in enumerate(order)}
+
+        # Round-robin in reverse postorder; the bits only shrink, and another round
+        # is needed only if a back edge shrinks them
+        changed = True
+        while changed:
+            changed = False
+            for v in order:
+                bits = reached[v]
+                for succ_idx, _, edge_bits in self.out_edges[v]:
+                    if succ_idx == -1:
+                        continue
+                    current = reached[succ_idx]
+                    new_bits = bits | edge_bits
+                    if current is not None:
+                        new_bits &= current
+                        if new_bits == current:
+                            continue
+                    reached[succ_idx] = new_bits
+                    if rpo_num[succ_idx] <= rpo_num[v]:
+                        changed = True
+
+        exits: Dict[BB, int] = {}
+        for v in order:
+            bits = reached[v]
+            for succ_idx, succ, edge_bits in self.out_edges[v]:
+                if succ_idx != -1:
+                    continue
+                current = exits.get(succ)
+                new_bits = bits | edge_bits
+                exits[succ] = new_bits if current is None else new_bits & current
+        return exits
 
 
 class CFGTransformer:
-    def __init__(self, cfg: CFG):
+    def __init__(self, cfg: CFG, processes: int = 1):
         self.cfg = cfg
         self.operation_count = 0
+        # The per-function steps run on a process pool if processes > 1
+        self.processes = processes
+        self.pool: Optional[PreprocessPool] = None
 
     def _rebuild_callgraph(self):
         live_funcs = set(self.cfg.funcnode_dict.values())
@@ -24,7 +115,7 @@ class CFGTransformer:
     # We don't care about order but return interesting funcs rapidly
     def get_funcs(self) -> Set[Funcnode]:
         cg = self.get_callgraph()
-        return set(cg.idx_to_func)
+        return set(cg.get_funcs())
 
     def get_funcs_in_bottomup_order(self) -> List[Funcnode]:
         cg = self.get_callgraph()
@@ -37,10 +128,12 @@ class CFGTransformer:
                 result.append(funcnode)
         return result
 
-    def get_string_calling_bbs(self) -> Set[BB]:
+    def get_string_calling_bbs(
+        self, callers: Optional[Set[Funcnode]] = None
+    ) -> Set[BB]:
         funcs = self.get_funcs()
         result: Set[BB] = set()
-        for caller in funcs:
+        for caller in funcs if callers is None else callers:
             for bb in caller.get_bbs():
                 for callee in bb.call_func:
                     if callee in funcs:
@@ -53,12 +146,22 @@ class CFGTransformer:
         caller = call_site.parent_funcnode
         callee_sinks: List[BB] = callee.get_sinks()
         call_site_succs = call_site.dst_bbs
-        # Connect sink of the callee to the successors of the call site
-        for sink in callee_sinks:
-            sink.dst_bbs = call_site_succs.copy()
-            sink.edge_implicate_bbs = call_site.edge_implicate_bbs.copy()
+        table = caller.get_implications()
+        if callee.implications is not None:
+            table.absorb(callee.implications)
+            callee.implications = None
+        # Connect sink of the callee to the successors of the call site; the first
+        # sink takes over the set of the call site, the others get their own copies
+        for i, sink in enumerate(callee_sinks):
+            sink.dst_bbs = call_site_succs if i == 0 else call_site_succs.copy()
+        # The edges from the sinks implicate what the edges from the call site did
+        for succ in call_site_succs:
+            bits = table.get(call_site, succ)
+            if bits:
+                for sink in callee_sinks:
+                    table.set(sink, succ, bits)
+                table.discard(call_site, succ)
         # Connect the call site to the entry of the callee
-        call_site.edge_implicate_bbs.clear()
         call_site.dst_bbs = {callee.get_entry()}
         # Overwrite the parent func of the callee BBs to the caller
         for callee_bb in callee.BBs.values():
@@ -75,57 +178,66 @@ class CFGTransformer:
         caller: Funcnode,
         interesting_funcs: Set[Funcnode],
         removed_funcs: List[Funcnode],
-        same_scc_funcs: Set[Funcnode],
+        func_to_scc_id: Dict[int, int],
     ) -> bool:
-        changed = False
+        caller_scc_id = func_to_scc_id[caller.addr]
         new_bbs: List[BB] = []
         for bb in caller.get_bbs():
-            removed_callee = set()
+            removed_callee = []
             for callee in bb.call_func:
                 if (
                     callee in interesting_funcs
                     and len(callee.xrefs) == 1
-                    and callee not in same_scc_funcs
+                    and func_to_scc_id[callee.addr] != caller_scc_id
                 ):
                     logging.debug(f"  Inlining {callee} into {caller}")
                     self.inline_callee(bb, callee, new_bbs)
                     removed_funcs.append(callee)
-                    removed_callee.add(callee)
-                    changed = True
-                    self.verify_func_cfg(caller)
+                    removed_callee.append(callee)
             for callee in removed_callee:
                 bb.call_func.remove(callee)
 
         # Add the new BBs to the parent funcnode
         for bb in new_bbs:
             caller.register_bb(bb)
+        if new_bbs:
+            self.verify_func_cfg(caller)
 
-        return changed
+        return len(new_bbs) > 0
 
     def run_inliner_pass(self, cfg: CFG) -> bool:
+        return len(self._inline_callees_of(cfg, self.get_funcs())) > 0
+
+    def _inline_callees_of(self, cfg: CFG, callers: Set[Funcnode]) -> Set[Funcnode]:
+        """
+        The inliner pass on `callers` only; returns the callers that inlined a callee
+        """
         funcs = self.get_funcs_in_bottomup_order()
+        interesting_funcs = set(funcs)
         cg = self.get_callgraph()
         func_to_scc_id = cg.build_func_to_scc_id()
         removed_funcs: List[Funcnode] = []
+        inlined: List[Tuple[Funcnode, List[Funcnode]]] = []
         for caller in funcs:
-            same_scc_func_indices = cg.scc_funcidx_map[func_to_scc_id[caller.addr]]
-            same_scc_funcs = {cg.idx_to_func[idx] for idx in same_scc_func_indices}
+            if caller not in callers:
+                continue
             assert len(caller.get_bbs()) > 0, (
                 "Function is not visited in bottom-up order."
             )
-            self._inline_function_callees(
-                caller, set(funcs), removed_funcs, same_scc_funcs
-            )
+            num_removed = len(removed_funcs)
+            if self._inline_function_callees(
+                caller, interesting_funcs, removed_funcs, func_to_scc_id
+            ):
+                inlined.append((caller, removed_funcs[num_removed:]))
 
-        if len(removed_funcs) == 0:
-            return False
-        # Remove the inlined functions from the CFG
-
-        for func in removed_funcs:
-            cfg.funcnode_dict.pop(func.addr)
-        self._rebuild_callgraph()
+        # Remove the inlined functions from the CFG and the call graph, in the order
+        # of inlining (a callee may have absorbed its own callees before)
+        for caller, callees in inlined:
+            for callee in callees:
+                cfg.funcnode_dict.pop(callee.addr)
+            cg.merge_into(callees, caller)
 
-        return True
+        return {caller for caller, _ in inlined}
 
     # Remove edge (bb -> entry_bb) by redirecting them to the successors of the entry node
     def remove_entry_incoming_edge(self, bb: BB, entry_bb: BB):
@@ -134,7 +246,10 @@ class CFGTransformer:
             f"  Redirecting entry incoming edge {bb} -> {entry_bb} ({len(func.get_bbs())} @ {self.operation_count})"
         )
         assert entry_bb in bb.dst_bbs, f"{bb} -> {entry_bb} edge does not exist"
+        table = func.get_implications()
+        implicated_bits = table.get(bb, entry_bb)
         bb.dst_bbs.remove(entry_bb)
+        entry_bb.pred_bbs.discard(bb)
         for entry_succ in entry_bb.dst_bbs.copy():
             # TODO: If the entry does not refer to strings, then the self-loop edge should be removed
             # But this would take almost no effect
@@ -142,14 +257,13 @@ class CFGTransformer:
                 continue
             overlap = entry_succ in bb.dst_bbs
             bb.dst_bbs.add(entry_succ)
+            entry_succ.pred_bbs.add(bb)
             if overlap:
-                bb.edge_implicate_bbs[entry_succ] &= bb.edge_implicate_bbs[entry_bb]
+                table.intersect(bb, entry_succ, implicated_bits)
             else:
-                bb.edge_implicate_bbs[entry_succ] = bb.edge_implicate_bbs[
-                    entry_bb
-                ].copy()
-            bb.edge_implicate_bbs[entry_bb].clear()
-        self.verify_bb(bb)
+                table.set(bb, entry_succ, implicated_bits)
+        # After the loop: every successor inherits the implication of the removed edge
+        table.discard(bb, entry_bb)
         self.operation_count += 1
 
     # Remove all incoming edges to the entry node by redirecting them to the successors of the entry node
@@ -164,6 +278,8 @@ class CFGTransformer:
         logging.debug(
             f"  Removing node {bb.start_addr:x} from {func.addr:x} ({len(func.get_bbs())} @ {self.operation_count})"
         )
+        table = func.get_implications()
+        bb_bit = table.bit(bb)
         # Add a edge (pred) -> (succ) for each pair of predecessors and successors
         # Still keeps the reverse edges well-formed for perf
         for p in bb.pred_bbs.copy():
@@ -183,35 +299,75 @@ class CFGTransformer:
 
                 # The new edge (p -> s) implicates BBs that are already implicated by
                 # either of (p -> bb) and (bb -> s) because we assume we passed both edges
-                implicated_bbs = set()
-                implicated_bbs.update(p.edge_implicate_bbs[bb])
-                implicated_bbs.update(bb.edge_implicate_bbs[s])
-
                 # Plus, bb itself is also implicated by (p -> s)
-                implicated_bbs.add(bb)
+                implicated_bits = table.get(p, bb) | table.get(bb, s) | bb_bit
 
                 # If (p -> s) already exists, the implication becomes intersected
                 # because we are merging multiple edges
                 if overlap_edge:
-                    p.edge_implicate_bbs[s] &= implicated_bbs
+                    table.intersect(p, s, implicated_bits)
                 else:
-                    assert len(p.edge_implicate_bbs[s]) == 0, (
+                    assert table.get(p, s) == 0, (
                         "(p -> s) should not exist before bb removal"
                     )
-                    p.edge_implicate_bbs[s] = implicated_bbs
-        func.update_preds()
-        for p in bb.pred_bbs.copy():
-            p.dst_bbs.remove(bb)
-            p.edge_implicate_bbs[bb].clear()
-        for s in bb.dst_bbs.copy():
-            s.pred_bbs.remove(bb)
+                    table.set(p, s, implicated_bits)
+        # pred_bbs are kept consistent above, so no rebuild of the whole function
+        for p in bb.pred_bbs:
+            if p != bb:
+                p.dst_bbs.remove(bb)
+                table.discard(p, bb)
+        for s in bb.dst_bbs:
+            table.discard(bb, s)
+            if s != bb:
+                s.pred_bbs.remove(bb)
         bb.pred_bbs.clear()
         bb.dst_bbs.clear()
 
         func.remove_bb(bb)
-        self.verify_func_cfg(func)
         self.operation_count += 1
 
+    def remove_nodes(self, func: Funcnode, bbs: Set[BB]):
+        """
+        Same result as remove_node for each of `bbs` (in any order), in one pass:
+        the edges (p -> s) around the removed BBs are made directly from the paths
+        through them, without the intermediate edges between the removed BBs.
+        Requires (and keeps) consistent pred_bbs.
+        """
+        if not bbs:
+            return
+        logging.debug(
+            f"  Removing {len(bbs)} nodes from {func.addr:x} ({len(func.get_bbs())} @ {self.operation_count})"
+        )
+        table = func.get_implications()
+        region = _RemovedRegion(bbs, table)
+        srcs = {p for bb in bbs for p in bb.pred_bbs if p not in bbs}
+        for p in srcs:
+            for s, implicated_bits in region.contract_paths(p).items():
+                # Joining an existing edge intersects the implications, as in remove_node
+                if s in p.dst_bbs:
+                    table.intersect(p, s, implicated_bits)
+                else:
+                    assert table.get(p, s) == 0, (
+                        "(p -> s) should not exist before bb removal"
+                    )
+                    p.dst_bbs.add(s)
+                    s.pred_bbs.add(p)
+                    table.set(p, s, implicated_bits)
+        for bb in bbs:
+            for p in bb.pred_bbs:
+                if p not in bbs:
+                    p.dst_bbs.remove(bb)
+                    table.discard(p, bb)
+            for s in bb.dst_bbs:
+                table.discard(bb, s)
+                if s not in bbs:
+                    s.pred_bbs.remove(bb)
+        for bb in bbs:
+            bb.pred_bbs.clear()
+            bb.dst_bbs.clear()
+            func.remove_bb(bb)
+        self.operation_count += len(bbs)
+
     # Remove every node that doesn't count
     def remove_non_interesting_nodes(
         self,
@@ -224,25 +380,62 @@ class CFGTransformer:
             if bb in interesting_nodes or bb == func.get_entry() or not bb.dst_bbs:
                 continue
             nodes_to_remove.append(bb)
-        for bb in nodes_to_remove:
-            self.remove_node(func, bb)
+        self.remove_nodes(func, set(nodes_to_remove))
 
     # Remove uninteresting nodes from the Funcnode
     def minimize_funcnode_cfg(self, func: Funcnode, interesting_nodes: Set[BB]):
         func.update_preds()
         self.remove_non_interesting_nodes(func, interesting_nodes)
         self.remove_entry_incomings(func)
+        if func.implications is not None:
+            func.implications.compact()
+        self.verify_func_cfg(func)
 
     def run_node_remove_pass(self, cfg: CFG) -> bool:
-        saved_bbs = cfg.get_string_refer_bbs() | self.get_string_calling_bbs()
-        funcs = self.get_funcs()
-        changed = False
+        return len(self._minimize_funcs(cfg, self.get_funcs())) > 0
+
+    def _minimize_funcs(self, cfg: CFG, funcs: Set[Funcnode]) -> Set[Funcnode]:
+        """
+        The node removal pass on `funcs` only; returns the changed functions
+        """
+        saved_bbs = cfg.get_string_refer_bbs() | self.get_string_calling_bbs(funcs)
+        if self.pool is not None:
+            return self._run_node_remove_pass_parallel(list(funcs), saved_bbs)
+        changed: Set[Funcnode] = set()
         for func in funcs:
             orig_bb_count = len(func.get_bbs())
             self.minimize_funcnode_cfg(func, saved_bbs)
             after_bb_count = len(func.get_bbs())
             assert orig_bb_count >= after_bb_count
-            changed |= orig_bb_count != after_bb_count
+            if orig_bb_count != after_bb_count:
+                changed.add(func)
+        return changed
+
+    def _run_node_remove_pass_parallel(
+        self, funcs: List[Funcnode], saved_bbs: Set[BB]
+    ) -> Set[Funcnode]:
+        # Ship only the functions that minimize_funcnode_cfg would change
+        work_funcs: List[Funcnode] = []
+        for func in funcs:
+            entry_bb = func.get_entry()
+            for bb in func.get_bbs():
+                if entry_bb in bb.dst_bbs or (
+                    bb not in saved_bbs and bb != entry_bb and bb.dst_bbs
+                ):
+                    work_funcs.append(func)
+                    break
+        encoded = [
+            encode_func(func, [int(bb in saved_bbs) for bb in func.get_bbs()])
+            for func in work_funcs
+        ]
+        results = self.pool.map(run_minimize, [(payload,) for payload, _ in encoded])
+        changed: Set[Funcnode] = set()
+        for func, (_, id_to_bb), result in zip(work_funcs, encoded, results):
+            removed = apply_result(func, result, id_to_bb)
+            self.operation_count += result.operation_count
+            self.verify_func_cfg(func)
+            if removed:
+                changed.add(func)
         return changed
 
     def _merge_bbs(
@@ -265,6 +458,7 @@ class CFGTransformer:
         The bb_list contains bbs to be removed, and the final is the BB to be kept.
         """
         assert final not in bb_list
+        table = func.get_implications()
         for bb in bb_list:
             # Firstly merging evey edge (p -> bb) into (p -> final) for all removed bbs
             for pred in bb.pred_bbs.copy():
@@ -278,17 +472,18 @@ class CFGTransformer:
                 final.pred_bbs.add(pred)
                 bb.pred_bbs.remove(pred)
 
-                implicated_bbs = pred.edge_implicate_bbs[bb].copy()
+                implicated_bits = table.get(pred, bb)
                 if overlap_edge:
-                    pred.edge_implicate_bbs[final] &= implicated_bbs
+                    table.intersect(pred, final, implicated_bits)
                 else:
-                    pred.edge_implicate_bbs[final] = implicated_bbs
+                    table.set(pred, final, implicated_bits)
 
-                pred.edge_implicate_bbs[bb].clear()
+                table.discard(pred, bb)
 
             # Next merging every edge (bb -> s) into (final -> s) for all removed bbs
             for succ in bb.dst_bbs.copy():
                 if succ == bb:
+                    table.discard(bb, bb)
                     continue
                 overlap_edge = succ in final.dst_bbs
 
@@ -298,13 +493,13 @@ class CFGTransformer:
                 bb.dst_bbs.remove(succ)
 
                 # Update edge metadata from final to succ
-                implicated_bbs = bb.edge_implicate_bbs[succ].copy()
+                implicated_bits = table.get(bb, succ)
                 if overlap_edge:
-                    final.edge_implicate_bbs[succ] &= implicated_bbs
+                    table.intersect(final, succ, implicated_bits)
                 else:
-                    final.edge_implicate_bbs[succ] = implicated_bbs
+                    table.set(final, succ, implicated_bits)
 
-                bb.edge_implicate_bbs[succ].clear()
+                table.discard(bb, succ)
 
         # Remove the BBs in the list from the function
         for bb in bb_list:
@@ -313,53 +508,27 @@ class CFGTransformer:
                     callee.xrefs.remove(bb)
             func.remove_bb(bb)
 
-        self.verify_func_cfg(func)
         self.operation_count += 1
 
-    # Merged indistinguishable nodes like the automata minimization
+    # BBs with different behaviors are never merged
+    def get_bb_behavior(self, bb: BB, interesting_funcs: Set[Funcnode]) -> Hashable:
+        literals = frozenset({xref.literal for xref in bb.xrefs})
+        callees = frozenset(bb.call_func).intersection(interesting_funcs)
+        return (literals, callees)
+
+    # Merged indistinguishable nodes like the automata minimization (see partition.py)
     def merge_duplicate_nodes(
         self, func: Funcnode, interesting_funcs: Set[Funcnode]
     ) -> bool:
         func.update_preds()
-        behavior_to_bb = defaultdict(list)
-        for bb in func.get_bbs():
-            literals = frozenset({xref.literal for xref in bb.xrefs})
-            callees = frozenset(bb.call_func).intersection(interesting_funcs)
-            bb_behavior = (literals, callees)
-            behavior_to_bb[bb_behavior].append(bb)
-
-        segment = list(behavior_to_bb.values())
-        bb_to_segment = {}
-        for id, bb_list in enumerate(segment):
-            for bb in bb_list:
-                bb_to_segment[bb] = id
-
-        converged = False
-        while not converged:
-            converged = True
-            new_segment: List[List[BB]] = []
-            new_bb_to_segment = {}
-            for bb_list in segment:
-                if len(bb_list) == 1:
-                    new_bb_to_segment[bb_list[0]] = len(new_segment)
-                    new_segment.append(bb_list)
-                    continue
-                # If there are multiple BBs, we might split them into different segments
-                nextseg_to_bb = defaultdict(list)
-                for bb in bb_list:
-                    next_segment = set()
-                    for succ in bb.dst_bbs:
-                        next_segment.add(bb_to_segment[succ])
-                    nextseg_to_bb[frozenset(next_segment)].append(bb)
-                converged = len(nextseg_to_bb) == 1
-                for bb_list in nextseg_to_bb.values():
-                    new_segment_id = len(new_segment)
-                    for bb in bb_list:
-                        new_bb_to_segment[bb] = new_segment_id
-                    new_segment.append(bb_list)
-
-            bb_to_segment = new_bb_to_segment
-            segment = new_segment
+        bbs = func.get_bbs()
+        bb_to_idx = {bb: i for i, bb in enumerate(bbs)}
+        behaviors = [self.get_bb_behavior(bb, interesting_funcs) for bb in bbs]
+        succs = [[bb_to_idx[succ] for succ in bb.dst_bbs] for bb in bbs]
+        segment = [
+            [bbs[i] for i in block]
+            for block in coarsest_stable_partition(behaviors, succs)
+        ]
 
         changed = False
         for bb_list in segment:
@@ -369,14 +538,61 @@ class CFGTransformer:
             saved_bb = bb_list[0]
             logging.debug(f"  Merging {bb_list} into {saved_bb}")
             self._merge_bbs(func, bb_list[1:], saved_bb, interesting_funcs)
+        if changed:
+            if func.implications is not None:
+                func.implications.compact()
+            self.verify_func_cfg(func)
 
         return changed
 
     def run_node_merge_pass(self, cfg: CFG) -> bool:
         funcs = self.get_funcs()
-        changed = False
+        return len(self._merge_funcs(funcs, funcs)) > 0
+
+    def _merge_funcs(
+        self, funcs: Set[Funcnode], interesting_funcs: Set[Funcnode]
+    ) -> Set[Funcnode]:
+        """
+        The node merge pass on `funcs` only; returns the changed functions
+        """
+        if self.pool is not None:
+            return self._run_node_merge_pass_parallel(funcs, interesting_funcs)
+        return {
+            func
+            for func in funcs
+            if self.merge_duplicate_nodes(func, interesting_funcs)
+        }
+
+    def _run_node_merge_pass_parallel(
+        self, funcs: Set[Funcnode], interesting_funcs: Set[Funcnode]
+    ) -> Set[Funcnode]:
+        work_funcs: List[Funcnode] = []
+        encoded = []
         for func in funcs:
-            changed |= self.merge_duplicate_nodes(func, funcs)
+            # Behaviors are numbered here; the worker only sees the numbers
+            behavior_ids = {}
+            labels = [
+                behavior_ids.setdefault(
+                    self.get_bb_behavior(bb, interesting_funcs), len(behavior_ids)
+                )
+                for bb in func.get_bbs()
+            ]
+            # Nothing to merge if every BB behaves differently
+            if len(behavior_ids) < len(labels):
+                work_funcs.append(func)
+                encoded.append(encode_func(func, labels))
+        results = self.pool.map(run_merge, [(payload,) for payload, _ in encoded])
+        changed: Set[Funcnode] = set()
+        for func, (_, id_to_bb), result in zip(work_funcs, encoded, results):
+            removed = apply_result(func, result, id_to_bb)
+            for bb in removed:
+                for callee in bb.call_func:
+                    if callee in interesting_funcs:
+                        callee.xrefs.remove(bb)
+            self.operation_count += result.operation_count
+            self.verify_func_cfg(func)
+            if removed:
+                changed.add(func)
         return changed
 
     def update_str_xrefs(self, cfg: CFG):
@@ -393,45 +609,55 @@ class CFGTransformer:
             if func not in funcs:
                 cfg.funcnode_dict.pop(func.addr)
 
-    def verify_bb(self, bb: BB):
-        if not __debug__:
+    def verify_func_cfg(self, func: Funcnode):
+        if not __debug__ or func.implications is None:
             return
-        for implicate_succ in bb.edge_implicate_bbs.keys():
-            if len(bb.edge_implicate_bbs[implicate_succ]) == 0:
-                continue
-            if implicate_succ not in bb.dst_bbs:
-                logging.debug(
-                    f"WRONG: {bb} -> {implicate_succ} NOT EXISTS in {bb.dst_bbs}"
-                )
-            assert implicate_succ in bb.dst_bbs
+        # Every implication belongs to an existing edge
+        for src, dst, _ in func.implications.items():
+            if dst not in src.dst_bbs:
+                logging.debug(f"WRONG: {src} -> {dst} NOT EXISTS in {src.dst_bbs}")
+            assert dst in src.dst_bbs
 
-    def verify_func_cfg(self, func: Funcnode):
+    def verify_funcs(self, funcs: Iterable[Funcnode]):
         if not __debug__:
             return
-        for bb in func.get_bbs():
-            self.verify_bb(bb)
+        for func in funcs:
+            self.verify_func_cfg(func)
 
     def verify_cfg(self, cfg: CFG):
         if not __debug__:
             return
-        for func in cfg.funcnode_dict.values():
-            self.verify_func_cfg(func)
+        self.verify_funcs(cfg.funcnode_dict.values())
 
     def run_all_passes(self, cfg: CFG):
         self.remove_unrelated_funcs(cfg)
-        changed = True
-        count = 0
-        while changed:
-            logging.debug(f"Running Pass {count}")
-            count += 1
-            changed = False
-            changed |= self.run_inliner_pass(cfg)
-            self.verify_cfg(cfg)
-            changed |= self.run_node_remove_pass(cfg)
-            self.verify_cfg(cfg)
-            changed |= self.run_node_merge_pass(cfg)
-            self.verify_cfg(cfg)
-            logging.debug(f"Finished Pass {count - 1}: {changed} changes")
+        if self.processes > 1:
+            self.pool = PreprocessPool(self.processes)
+        try:
+            # A pass is a no-op on a function that did not change since it last ran
+            # there, so each round runs only on the functions changed by the previous
+            # one. That covers the inliner too: merging the call sites of a callee in
+            # a function keeps one of them, so a callee left with a single xref is
+            # called from a changed function.
+            dirty = self.get_funcs()
+            count = 0
+            while dirty:
+                logging.debug(f"Running Pass {count} on {len(dirty)} functions")
+                count += 1
+                inlined = self._inline_callees_of(cfg, dirty)
+                funcs = self.get_funcs()
+                dirty &= funcs
+                self.verify_funcs(dirty)
+                minimized = self._minimize_funcs(cfg, dirty)
+                self.verify_funcs(dirty)
+                merged = self._merge_funcs(dirty, funcs)
+                self.verify_funcs(dirty)
+                dirty = inlined | minimized | merged
+                logging.debug(f"Finished Pass {count - 1}: {len(dirty)} changed")
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
 
         self.update_str_xrefs(cfg)
 
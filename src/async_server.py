@@ -0,0 +1,591 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio mode of the estimator (FUZZ_ASYNC_SERVER): one event loop serves many
+request channels at once, and the inference runs on a process pool, so a slow
+response on one channel does not hold up the others.
+
+Channels:
+- pipes: the fd 88/89 pair of the patched AFL++, lock-step or pipelined
+  (FUZZ_PIPELINE_DEPTH), like start_fuzz_server;
+- sockets: fuzzers connecting to FUZZ_ASYNC_SOCKET with the hello of
+  estimator_daemon.py (a depth key asks for the pipelined protocol);
+- doorbells: a socket fuzzer that also passes the fds named request, result and
+  area. It rings the request eventfd (with 1, or DOORBELL_ACK for REQUEST_ACK)
+  instead of writing to the socket; the result (a u32 length, the status token
+  and the coverage payload) is written at the start of the area memfd, then the
+  result eventfd is rung. The socket only tells when the fuzzer leaves.
+
+The pool workers are forked once the static analysis is loaded and run the
+matching (infer); the dedup, the coverage and the stats of each fuzzer stay in
+the event loop. Back-pressure: a channel reads no more requests while `depth`
+of them (1 in lock-step) have no result, and at most `workers` inferences are
+submitted at a time, the other requests waiting in their channel.
+Per channel, the stats saved in async_stats.txt give the number of requests,
+the queue depth (requests read without a result), how often the channel was
+held back, and the latency percentiles from reading a request to writing its
+result; the last line merges the latencies of all the channels.
+"""
+import asyncio
+import gc
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from fuzz_transport import (
+    HELLO_OK,
+    HELLO_TIMEOUT,
+    PIPE_ACK,
+    PIPE_MESSAGE,
+    PIPE_REQUEST,
+    REQUEST_ACK,
+    Session,
+    open_session,
+    recv_hello,
+)
+
+EVENTFD_VALUE = struct.Struct("=Q")
+# Rung instead of 1 for REQUEST_ACK
+DOORBELL_ACK = 2
+RESULT_LENGTH = struct.Struct("=I")
+
+
+async def wait_readable(fds: Sequence[int]):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def ready():
+        if not future.done():
+            future.set_result(None)
+
+    for fd in fds:
+        loop.add_reader(fd, ready)
+    try:
+        await future
+    finally:
+        for fd in fds:
+            loop.remove_reader(fd)
+
+
+async def wait_writable(fd: int):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    loop.add_writer(fd, lambda: future.done() or future.set_result(None))
+    try:
+        await future
+    finally:
+        loop.remove_writer(fd)
+
+
+async def read_exact_async(fd: int, size: int) -> Optional[bytes]:
+    """
+    `size` bytes from the non-blocking fd, or None at the end of the file
+    """
+    data = b""
+    while len(data) < size:
+        try:
+            more = os.read(fd, size - len(data))
+        except BlockingIOError:
+            await wait_readable([fd])
+            continue
+        if not more:
+            return None
+        data += more
+    return data
+
+
+async def write_all_async(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        try:
+            view = view[os.write(fd, view) :]
+        except BlockingIOError:
+            await wait_writable(fd)
+
+
+class LatencyHistogram:
+    """
+    Latencies in quarter-octave buckets from 1us: fixed memory over a campaign,
+    and percentiles within 19%
+    """
+
+    BUCKETS_PER_OCTAVE = 4
+    NUM_BUCKETS = 40 * BUCKETS_PER_OCTAVE
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        us = seconds * 1e6
+        idx = 0
+        if us > 1:
+            idx = int(math.log2(us) * self.BUCKETS_PER_OCTAVE)
+        self.counts[min(idx, self.NUM_BUCKETS - 1)] += 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        for idx, count in enumerate(other.counts):
+            self.counts[idx] += count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """
+        The upper bound of the bucket of the q-quantile, in seconds
+        """
+        if not self.total:
+            return 0.0
+        rank = max(math.ceil(q * self.total), 1)
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+        return min(2 ** ((idx + 1) / self.BUCKETS_PER_OCTAVE) / 1e6, self.max)
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{name} {seconds * 1000:.3f}ms"
+            for name, seconds in (
+                ("p50", self.percentile(0.5)),
+                ("p90", self.percentile(0.9)),
+                ("p99", self.percentile(0.99)),
+                ("max", self.max),
+            )
+        )
+
+
+class ChannelStats:
+    def __init__(self):
+        self.requests = 0
+        # Requests read without a result
+        self.depth = 0
+        self.max_depth = 0
+        self.depth_sum = 0
+        # Times the channel had `depth` requests without a result
+        self.stalls = 0
+        self.latency = LatencyHistogram()
+
+    def arrived(self):
+        self.requests += 1
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.depth_sum += self.depth
+
+    def answered(self, seconds: float):
+        self.depth -= 1
+        self.latency.add(seconds)
+
+    def summary(self) -> str:
+        mean_depth = self.depth_sum / self.requests if self.requests else 0.0
+        return (
+            f"requests {self.requests}, depth max {self.max_depth} "
+            f"mean {mean_depth:.2f}, stalls {self.stalls}, {self.latency.summary()}"
+        )
+
+
+class Channel(ABC):
+    """
+    A fuzzer, and the fds its requests come in; at most `depth` requests are
+    read without a result (1 with the lock-step protocol)
+    """
+
+    def __init__(self, name: str, session: Session, depth: int):
+        self.name = name
+        self.session = session
+        self.depth = depth
+        # Made in the event loop (serve_channel)
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.stats = ChannelStats()
+        self.next_id = 0
+
+    @abstractmethod
+    async def read_request(self) -> Optional[int]:
+        """
+        The id of the next request, or None once the fuzzer is gone
+        """
+
+    async def ack(self, request_id: int):  # noqa: B027
+        """
+        Tells the fuzzer that a request was taken; a no-op by default, as only
+        the pipelined protocol acks
+        """
+
+    @abstractmethod
+    async def write_result(self, request_id: int, mode: bytes, payload: bytes):
+        """
+        The status token and the coverage payload of a request
+        """
+
+    def close(self):  # noqa: B027
+        """
+        Closes the fds of the channel; a no-op by default, for channels that
+        own none
+        """
+
+
+class StreamChannel(Channel):
+    """
+    Requests and results on a pair of pipes, or both on a socket
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session: Session,
+        read_fd: int,
+        write_fd: int,
+        depth: int,
+        conn: Optional[socket.socket] = None,
+    ):
+        super().__init__(name, session, depth)
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.conn = conn
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+
+    async def read_request(self) -> Optional[int]:
+        if not self.depth:
+            request = await read_exact_async(self.read_fd, 4)
+            if request is None:
+                return None
+            self.session.coverage.acknowledge(request == REQUEST_ACK)
+            self.next_id += 1
+            return self.next_id
+        request = await read_exact_async(self.read_fd, PIPE_MESSAGE.size)
+        if request is None:
+            return None
+        tag, request_id = PIPE_MESSAGE.unpack(request)
+        if tag != PIPE_REQUEST:
+            raise ValueError(f"Unknown request {tag!r}")
+        return request_id
+
+    async def ack(self, request_id: int):
+        if self.depth:
+            await write_all_async(
+                self.write_fd, PIPE_MESSAGE.pack(PIPE_ACK, request_id)
+            )
+
+    async def write_result(self, request_id: int, mode: bytes, payload: bytes):
+        if self.depth:
+            mode = PIPE_MESSAGE.pack(mode, request_id)
+        await write_all_async(self.write_fd, mode + payload)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            return
+        os.close(self.read_fd)
+        if self.write_fd != self.read_fd:
+            os.close(self.write_fd)
+
+
+class DoorbellChannel(Channel):
+    """
+    Requests rung on an eventfd, results in a memfd; lock-step only
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session: Session,
+        request_fd: int,
+        result_fd: int,
+        area_fd: int,
+        conn: socket.socket,
+    ):
+        super().__init__(name, session, 0)
+        self.request_fd = request_fd
+        self.result_fd = result_fd
+        self.area_fd = area_fd
+        self.conn = conn
+        os.set_blocking(request_fd, False)
+
+    async def read_request(self) -> Optional[int]:
+        while True:
+            try:
+                (ring,) = EVENTFD_VALUE.unpack(os.read(self.request_fd, 8))
+                break
+            except BlockingIOError:
+                await wait_readable([self.request_fd, self.conn.fileno()])
+                try:
+                    if not self.conn.recv(1):
+                        return None
+                except BlockingIOError:
+                    pass
+        self.session.coverage.acknowledge(ring == DOORBELL_ACK)
+        self.next_id += 1
+        return self.next_id
+
+    async def write_result(self, request_id: int, mode: bytes, payload: bytes):
+        result = mode + payload
+        os.pwrite(self.area_fd, RESULT_LENGTH.pack(len(result)) + result, 0)
+        await write_all_async(self.result_fd, EVENTFD_VALUE.pack(1))
+
+    def close(self):
+        for fd in (self.request_fd, self.result_fd, self.area_fd):
+            os.close(fd)
+        self.conn.close()
+
+
+class AsyncServer:
+    """
+    infer(whole_bytes, start) -> (addresses, mode) runs on the pool, so it has
+    to be a module-level function; is_duplicate, account (the addresses into
+    the coverage of the session) and finish (the stats, once the fuzzer is gone)
+    run in the event loop
+    """
+
+    def __init__(
+        self,
+        infer: Callable[[bytes, float], Tuple[List[int], bytes]],
+        is_duplicate: Callable[[Session, bytes], bool],
+        duplicate_mode: bytes,
+        account: Callable[[List[int], Session], None],
+        finish: Callable[[Session], None],
+        max_lines: int,
+        workers: int,
+        stats_path: Optional[str] = None,
+    ):
+        self.infer = infer
+        self.is_duplicate = is_duplicate
+        self.duplicate_mode = duplicate_mode
+        self.account = account
+        self.finish = finish
+        self.max_lines = max_lines
+        self.workers = workers
+        self.stats_path = stats_path
+        self.pool: Optional[ProcessPoolExecutor] = None
+        # Submitted to the pool, not done yet
+        self.inferences: Set[Future] = set()
+        self.channels: List[Channel] = []
+        self.open_channels = 0
+        self.tasks = set()
+        self.listener: Optional[socket.socket] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stopped: Optional[asyncio.Event] = None
+        self.pool_slots: Optional[asyncio.Semaphore] = None
+
+    async def respond(
+        self, channel: Channel, whole_bytes: bytes, start: float
+    ) -> Tuple[bytes, bytes]:
+        session = channel.session
+        if self.is_duplicate(session, whole_bytes):
+            mode = self.duplicate_mode
+        elif self.pool is None:
+            addr_list, mode = self.infer(whole_bytes, start)
+            self.account(addr_list, session)
+        else:
+            async with self.pool_slots:
+                future = self.pool.submit(self.infer, whole_bytes, start)
+                self.inferences.add(future)
+                future.add_done_callback(self.inferences.discard)
+                addr_list, mode = await asyncio.wrap_future(future)
+            self.account(addr_list, session)
+        session.mode_counts[mode] += 1
+        return mode, session.coverage.payload()
+
+    async def read_requests(self, channel: Channel):
+        while True:
+            # A lock-step fuzzer waits for the result anyway
+            if channel.depth and channel.slots.locked():
+                channel.stats.stalls += 1
+            await channel.slots.acquire()
+            request_id = await channel.read_request()
+            if request_id is None:
+                return
+            start = time.perf_counter()
+            whole_bytes = channel.session.put_response.load(self.max_lines)
+            channel.stats.arrived()
+            channel.queue.put_nowait((request_id, whole_bytes, start))
+            await channel.ack(request_id)
+
+    async def answer_requests(self, channel: Channel):
+        while True:
+            request_id, whole_bytes, start = await channel.queue.get()
+            mode, payload = await self.respond(channel, whole_bytes, start)
+            await channel.write_result(request_id, mode, payload)
+            channel.stats.answered(time.perf_counter() - start)
+            channel.slots.release()
+
+    async def serve_channel(self, channel: Channel):
+        """
+        Until the fuzzer goes away; like serve_pipelined, the requests without
+        a result are dropped then
+        """
+        self.channels.append(channel)
+        self.open_channels += 1
+        channel.slots = asyncio.Semaphore(max(channel.depth, 1))
+        channel.queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(self.read_requests(channel)),
+            asyncio.create_task(self.answer_requests(channel)),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    sys.stderr.write(f"Server: {channel.name}: {task.exception()!r}\n")
+        finally:
+            for task in tasks:
+                task.cancel()
+            try:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                # Even if the server stops meanwhile
+                self.close_channel(channel)
+
+    def close_channel(self, channel: Channel):
+        channel.close()
+        try:
+            self.finish(channel.session)
+        except OSError as e:
+            sys.stderr.write(f"Server: stats of {channel.name}: {e}\n")
+        channel.session.close()
+        print(f"Server: {channel.name} stopped")
+        self.save_stats()
+        self.open_channels -= 1
+        if self.listener is None and not self.open_channels:
+            self.stopped.set()
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def accept_fuzzers(self):
+        while True:
+            conn, _ = await self.loop.sock_accept(self.listener)
+            self.spawn(self.open_socket_channel(conn))
+
+    async def open_socket_channel(self, conn: socket.socket):
+        conn.settimeout(HELLO_TIMEOUT)
+        fds: Dict[str, int] = {}
+        doorbell: Dict[str, int] = {}
+        session = None
+        opened = False
+        try:
+            hello, fds = await self.loop.run_in_executor(None, recv_hello, conn)
+            for name in ("request", "result", "area"):
+                if name in fds:
+                    doorbell[name] = fds.pop(name)
+            depth = int(hello.get("depth", "0"))
+            session = open_session(hello, fds)
+            conn.sendall(HELLO_OK)
+            opened = True
+        # Only this fuzzer is dropped
+        except Exception as e:
+            sys.stderr.write(f"Server: bad hello: {e!r}\n")
+        finally:
+            # Also when the server stops during the hello
+            if not opened:
+                for fd in list(fds.values()) + list(doorbell.values()):
+                    os.close(fd)
+                if session is not None:
+                    session.close()
+                conn.close()
+        if not opened:
+            return
+        conn.setblocking(False)
+        name = f"{session.fuzz_out_dir} (socket {conn.fileno()})"
+        if len(doorbell) == 3:
+            channel = DoorbellChannel(
+                name,
+                session,
+                doorbell["request"],
+                doorbell["result"],
+                doorbell["area"],
+                conn,
+            )
+        else:
+            for fd in doorbell.values():
+                os.close(fd)
+            fd = conn.fileno()
+            channel = StreamChannel(name, session, fd, fd, depth, conn)
+        print(f"Server: {name} connected")
+        await self.serve_channel(channel)
+
+    async def serve(self, channels: Sequence[Channel]):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.pool_slots = asyncio.Semaphore(max(self.workers, 1))
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                self.loop.add_signal_handler(signum, self.stopped.set)
+        except (ValueError, RuntimeError):
+            # Not the main thread
+            pass
+        for channel in channels:
+            self.spawn(self.serve_channel(channel))
+        if self.listener is not None:
+            self.spawn(self.accept_fuzzers())
+        elif not channels:
+            return
+        await self.stopped.wait()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def start_workers(self):
+        """
+        Forks the inference processes; they inherit every fd open by then
+        """
+        # Keep the analysis out of the collections of the workers, so that its
+        # pages stay shared
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        if self.workers:
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("fork")
+            )
+            self.pool.submit(os.getpid).result()
+
+    def run(
+        self, channels: Sequence[Channel], listener: Optional[socket.socket] = None
+    ):
+        """
+        Until every channel is closed, or until stop() without a listener
+        """
+        self.listener = listener
+        if self.pool is None:
+            self.start_workers()
+        try:
+            asyncio.run(self.serve(channels))
+        finally:
+            if self.pool is not None:
+                # No shutdown(cancel_futures=True) before Python 3.9 (PyPy)
+                for future in list(self.inferences):
+                    future.cancel()
+                self.pool.shutdown()
+            if listener is not None:
+                os.unlink(listener.getsockname())
+                listener.close()
+            self.save_stats()
+
+    def stop(self):
+        """
+        From another thread
+        """
+        self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def save_stats(self):
+        if self.stats_path is None:
+            return
+        latency = LatencyHistogram()
+        with open(self.stats_path, "w") as f:
+            for channel in self.channels:
+                f.write(f"{channel.name}: {channel.stats.summary()}\n")
+                latency.merge(channel.stats.latency)
+            f.write(f"all: requests {latency.total}, {latency.summary()}\n")
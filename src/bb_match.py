@@ -1,8 +1,10 @@
 import re
+import time
 import logging
-from CFG_recover import CFG, XREF, BB
+from CFG_recover import CFG, XREF, BB, Funcnode
+from collections import defaultdict
 from SeqMatcher import SeqMatcher, MatchItem, select_longest_matches
-from typing import List, Set, NamedTuple, Dict
+from typing import List, Set, NamedTuple, Dict, Optional, Tuple
 from labrador_coverage import _SIM
 
 pattern = rb"""
@@ -95,10 +97,14 @@ def find_nearby_xrefs(
 
 
 def CDBI(
-    match_items: List[MatchItem], idx_to_match_info: List[MatchInfo], cfg
-) -> Set[BB]:
+    match_items: List[MatchItem],
+    idx_to_match_info: List[MatchInfo],
+    cfg,
+    deadline: Optional[float] = None,
+) -> Optional[Set[BB]]:
     """
     Context-Driven Block Identification (CDBI) algorithm for BB matching.
+    Returns None once `deadline` (time.perf_counter() based) passes.
     """
     context_size = 5
     beam_width = 10
@@ -119,6 +125,8 @@ def CDBI(
             We have multiple candidates BBs for this string pattern:
                 decide which one is more likely by distance-based heuristic
             """
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
             nearby_xrefs = find_nearby_xrefs(
                 i, match_items, sub_xref, idx_to_match_info, context_size
             )
@@ -268,6 +276,12 @@ class BBMatcher:
                 )
             match_items.extend(line_matches)
 
+        return self.collect_bbs_without_beam(match_items)
+
+    def collect_bbs_without_beam(self, match_items: List[MatchItem]) -> Set[BB]:
+        """
+        Every BB referring to a matched literal is regarded as "passed" (no CDBI).
+        """
         match_bbs = set()
         for pat_idx, gap_matches, _, _ in match_items:
             assert isinstance(gap_matches, frozenset)
@@ -282,8 +296,13 @@ class BBMatcher:
         results: List[MatchItem] = self.seq_matcher.search(text)
         return CDBI(results, self.idx_to_match_info, self.cfg)
 
-    # New method: process text line by line with caching.
-    def search_bbs(self, text: bytes) -> Set[BB]:
+    def match_lines(
+        self, text: bytes, deadline: Optional[float] = None
+    ) -> Tuple[List[MatchItem], bool]:
+        """
+        Line-level cached matching. If `deadline` (time.perf_counter() based) passes,
+        the remaining lines are dropped and the second return value becomes True.
+        """
         # Split the text by newline and process each line individually.
         match_items: List[MatchItem] = []
         for line in text.splitlines(keepends=True):
@@ -293,18 +312,36 @@ class BBMatcher:
             if line in self.line_to_matchitems_cache:
                 match_items.extend(self.line_to_matchitems_cache[line])
             else:
+                if deadline is not None and time.perf_counter() > deadline:
+                    return match_items, True
                 line_matches = self.seq_matcher.search(line)
                 match_items.extend(line_matches)
                 self.line_to_matchitems_cache[line] = line_matches
-            # Apply Context-Driven Block Identification (CDBI) on the line's matches.
+        return match_items, False
+
+    # New method: process text line by line with caching.
+    def search_bbs(self, text: bytes) -> Set[BB]:
+        match_items, _ = self.match_lines(text)
+        # Apply Context-Driven Block Identification (CDBI) on the line's matches.
         return CDBI(match_items, self.idx_to_match_info, self.cfg)
 
 
 def augment_dominators(orig_bbs: Set[BB]) -> Set[BB]:
     bbs = orig_bbs.copy()
-    new_bbs = set()
+    # OR the memoized dominator bitsets per function, then decode once per function
+    dom_bits: Dict[Funcnode, int] = defaultdict(int)
+    pdom_bits: Dict[Funcnode, int] = defaultdict(int)
     for bb in bbs:
-        new_bbs.update(bb.doms | bb.pdoms)
+        func = bb.parent_funcnode
+        if func.dom_tree is None or func.pdom_tree is None:
+            continue
+        dom_bits[func] |= func.dom_tree.dominator_bits(bb)
+        pdom_bits[func] |= func.pdom_tree.dominator_bits(bb)
+    new_bbs = set()
+    for func, bits in dom_bits.items():
+        new_bbs.update(func.dom_tree.bbs_from_bits(bits))
+    for func, bits in pdom_bits.items():
+        new_bbs.update(func.pdom_tree.bbs_from_bits(bits))
     old_num = len(bbs)
     bbs.update(new_bbs)
     new_num = len(bbs)
@@ -321,10 +358,10 @@ def augment_must_bbs(orig_bbs: Set[BB]) -> Set[BB]:
         """
         if len(bb.pred_bbs) == 1:
             pred = next(iter(bb.pred_bbs))
-            implicate_bbs.update(pred.edge_implicate_bbs[bb])
+            implicate_bbs.update(pred.edge_implicate_bbs.get(bb, ()))
         if len(bb.dst_bbs) == 1:
             succ = next(iter(bb.dst_bbs))
-            implicate_bbs.update(bb.edge_implicate_bbs[succ])
+            implicate_bbs.update(bb.edge_implicate_bbs.get(succ, ()))
     old_num = len(match_bbs)
     match_bbs.update(implicate_bbs)
     new_num = len(match_bbs)
@@ -351,7 +388,7 @@ def aggressive_augment(orig_bbs) -> Set[BB]:
     for bb in match_bbs:
         for succ in bb.dst_bbs:
             if succ in match_bbs:
-                implicate_bbs.update(bb.edge_implicate_bbs[succ])
+                implicate_bbs.update(bb.edge_implicate_bbs.get(succ, ()))
 
     old_num = len(match_bbs)
     match_bbs.update(implicate_bbs)
@@ -1,8 +1,12 @@
-from typing import Dict, Tuple
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, Optional, Tuple
 import pickle
 import os
 import logging
 import datetime
+from CFG_recover import CFG
+from cfg_arrays import CFGArrays
+from cfg_binary import BINARY_FILE_NAME, read_cfg_binary
 
 
 # Configure the logger
@@ -21,33 +25,104 @@ def setup_logging(enabled=True):
         logging.disable(logging.CRITICAL)  # Disables all logging
 
 
-# load ghidra static analysis result pickle
-def load_static_analysis_result(stat_dir: str):
-    pickle_path = os.path.join(stat_dir, "pickle_analysis.bin")
-    json_path = os.path.join(stat_dir, "CFG_analysis.txt")
+class LazyIdxMap(Mapping):
+    """
+    Read-only mapping built by `build` on the first access
+    """
 
-    with open(pickle_path, "rb") as f:
-        put_cfg = pickle.load(f, encoding="bytes")
-    put_cfg.struct_CFG(json_path)
+    def __init__(self, build: Callable[[], Dict]):
+        self._build: Optional[Callable[[], Dict]] = build
+        self._map: Optional[Dict] = None
+
+    def _get_map(self) -> Dict:
+        if self._map is None:
+            self._map = self._build()
+            self._build = None
+        return self._map
+
+    def __getitem__(self, key):
+        return self._get_map()[key]
 
-    # Load the edge_idx_map and vertex_idx_map
+    def __iter__(self) -> Iterator:
+        return iter(self._get_map())
+
+    def __len__(self) -> int:
+        return len(self._get_map())
+
+
+def read_edge_idx_map(stat_dir: str) -> Dict[Tuple[int, int], int]:
     edge_idx_map: Dict[Tuple[int, int], int] = {}
-    vertex_idx_map: Dict[int, int] = {}
     with open(os.path.join(stat_dir, "edge.txt"), "r") as f:
         idx = 0
         for line in f:
             edge = line.strip().split(" ")
             edge_idx_map[(int(edge[0], 16), int(edge[1], 16))] = idx
             idx += 1
+    return edge_idx_map
+
+
+def read_vertex_idx_map(stat_dir: str) -> Dict[int, int]:
+    vertex_idx_map: Dict[int, int] = {}
     with open(os.path.join(stat_dir, "vertex.txt"), "r") as f:
         idx = 0
         for line in f:
             vertex = line.strip()
             vertex_idx_map[int(vertex, 16)] = idx
             idx += 1
+    return vertex_idx_map
+
+
+def get_edge_idx_map(arrays: CFGArrays) -> Dict[Tuple[int, int], int]:
+    edges = arrays.edges
+    return {
+        (edges[2 * idx], edges[2 * idx + 1]): idx for idx in range(len(edges) // 2)
+    }
+
+
+# load ghidra static analysis result pickle
+def load_static_analysis_result(
+    stat_dir: str, prefer_binary: bool = True, pruned: bool = False
+):
+    """
+    Returns (CFG, edge_idx_map, vertex_idx_map); edge_idx_map is built on first use.
+    With `pruned`, only the functions that refer to strings and their transitive
+    callers are materialized (the ones CFGTransformer keeps).
+    """
+    binary_path = os.path.join(stat_dir, BINARY_FILE_NAME)
+    if prefer_binary and os.path.exists(binary_path):
+        return load_static_analysis_binary(binary_path, pruned)
+    pickle_path = os.path.join(stat_dir, "pickle_analysis.bin")
+    json_path = os.path.join(stat_dir, "CFG_analysis.txt")
+    with open(pickle_path, "rb") as f:
+        put_cfg = pickle.load(f, encoding="bytes")
+    put_cfg.struct_CFG(json_path, pruned)
+
+    edge_idx_map = LazyIdxMap(lambda: read_edge_idx_map(stat_dir))
+    return put_cfg, edge_idx_map, read_vertex_idx_map(stat_dir)
+
+
+def load_static_analysis_binary(binary_path: str, pruned: bool = False):
+    arrays = read_cfg_binary(binary_path)
+    put_cfg = CFG()
+    func_ids = None
+    if pruned:
+        func_ids = arrays.transitive_caller_func_ids(arrays.string_refer_func_ids())
+    put_cfg.struct_CFG_from_arrays(arrays, func_ids)
+    edge_idx_map = LazyIdxMap(lambda: get_edge_idx_map(arrays))
+    vertex_idx_map: Dict[int, int] = {
+        vertex: idx for idx, vertex in enumerate(arrays.vertices)
+    }
     return put_cfg, edge_idx_map, vertex_idx_map
 
 
+# Array form of the static analysis result; mmap-ed if the binary exists
+def load_cfg_arrays(stat_dir: str, prefer_binary: bool = True) -> CFGArrays:
+    binary_path = os.path.join(stat_dir, BINARY_FILE_NAME)
+    if prefer_binary and os.path.exists(binary_path):
+        return read_cfg_binary(binary_path)
+    return CFGArrays.from_static_analysis(stat_dir)
+
+
 def get_target_list(target_dir: str, select_text=None):
     target_list = os.listdir(target_dir)
 
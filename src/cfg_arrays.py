@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+"""
+Whole-program CFG as compressed sparse row (CSR) arrays.
+
+BB ids follow the order of CFG_analysis.txt (which is also the order of vertex.txt),
+so the BBs of a function are contiguous. Every relation is a pair of arrays:
+`X_offsets[i]:X_offsets[i + 1]` is the slice of `X_ids` that belongs to i.
+There are no per-BB Python objects; the arrays are compact, cheap to build,
+and stay shared (copy-on-write pages are never touched) in forked processes.
+
+BBView/FuncView/XrefView are thin read-only views with the attribute names of
+BB/Funcnode/XREF, for the code that only reads the original CFG.
+The CFG transformations still work on the mutable object model (CFG_recover).
+"""
+import json
+import os
+import pickle
+from array import array
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Deque
+
+try:
+    import numpy as np
+except ImportError:  # PyPy: numpy is not installed there (see requirements.txt)
+    np = None
+
+# Address arrays; end address 0 means unknown
+ADDR_TYPECODE = "Q"
+# Id/offset arrays
+ID_TYPECODE = "q"
+
+
+def _ids(values: Iterable[int] = ()) -> array:
+    return array(ID_TYPECODE, values)
+
+
+def _addrs(values: Iterable[int] = ()) -> array:
+    return array(ADDR_TYPECODE, values)
+
+
+def _to_array(values) -> array:
+    # The arrays of a mmap-ed file are memoryviews, which cannot be pickled
+    return values if isinstance(values, array) else array(values.format, values)
+
+
+def flatten_addrs(pairs) -> Iterable[int]:
+    """
+    Addresses of (src, dst) pairs given as a list of tuples, an Nx2 numpy array,
+    or a flat array of src, dst, src, dst, ...
+    """
+    if np is not None:
+        return np.asarray(pairs, dtype=np.uint64).reshape(-1)
+    if isinstance(pairs, (array, memoryview)):
+        return pairs
+    return [addr for pair in pairs for addr in pair]
+
+
+class SortedRanges:
+    """
+    Address ranges start[i] <= addr <= end[i], sorted by the start; end 0 means
+    unknown, and such a range matches nothing. find_many() resolves many addresses
+    at once by numpy.searchsorted (by bisect without numpy).
+    """
+
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+        self._np_starts = None
+        self._np_ends = None
+
+    def find(self, addr: int) -> int:
+        index = bisect_right(self.starts, addr) - 1
+        if index >= 0:
+            end = self.ends[index]
+            if end and addr <= end:
+                return index
+        return -1
+
+    def find_many(self, addrs) -> Iterable[int]:
+        """
+        find() of every address (same order); a numpy array if numpy is available
+        """
+        if np is None:
+            return [self.find(addr) for addr in addrs]
+        if self._np_starts is None:
+            self._np_starts = np.asarray(self.starts, dtype=np.uint64)
+            self._np_ends = np.asarray(self.ends, dtype=np.uint64)
+        # Both sides uint64; mixing with int64 would compare as float64
+        addrs = np.asarray(addrs, dtype=np.uint64)
+        indices = np.searchsorted(self._np_starts, addrs, side="right").astype(np.int64)
+        indices -= 1
+        found = indices >= 0
+        ends = self._np_ends[np.where(found, indices, 0)]
+        found &= (ends != 0) & (addrs <= ends)
+        return np.where(found, indices, -1)
+
+    def find_unique(self, addrs) -> List[int]:
+        """
+        Sorted set of find() over `addrs` (duplicates are resolved once), without -1
+        """
+        if np is None:
+            indices = {self.find(addr) for addr in set(addrs)}
+            indices.discard(-1)
+            return sorted(indices)
+        indices = self.find_many(np.unique(np.asarray(addrs, dtype=np.uint64)))
+        return np.unique(indices[indices >= 0]).tolist()
+
+
+class CSR:
+    """
+    One-to-many relation over dense ids
+    """
+
+    __slots__ = ("offsets", "ids")
+
+    def __init__(self, offsets: array, ids: array):
+        self.offsets = offsets
+        self.ids = ids
+
+    @classmethod
+    def from_lists(cls, lists: List[List[int]], typecode: str = ID_TYPECODE) -> "CSR":
+        offsets = _ids([0])
+        ids = array(typecode)
+        for items in lists:
+            ids.extend(items)
+            offsets.append(len(ids))
+        return cls(offsets, ids)
+
+    def __getstate__(self):
+        return (_to_array(self.offsets), _to_array(self.ids))
+
+    def __setstate__(self, state):
+        self.offsets, self.ids = state
+
+    def __getitem__(self, i: int) -> array:
+        return self.ids[self.offsets[i] : self.offsets[i + 1]]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def degree(self, i: int) -> int:
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def transpose(self, num_targets: int) -> "CSR":
+        """
+        Reverse relation, by a counting sort (ids stay sorted in each row)
+        """
+        counts = [0] * (num_targets + 1)
+        for target in self.ids:
+            counts[target + 1] += 1
+        for i in range(num_targets):
+            counts[i + 1] += counts[i]
+        offsets = _ids(counts)
+        ids = _ids([0]) * len(self.ids)
+        fill = counts[:num_targets]
+        for source in range(len(self)):
+            for k in range(self.offsets[source], self.offsets[source + 1]):
+                target = self.ids[k]
+                ids[fill[target]] = source
+                fill[target] += 1
+        return CSR(offsets, ids)
+
+
+class CFGArrays:
+    """
+    Read-only whole-program CFG; build it with from_static_analysis()
+    """
+
+    def __init__(self):
+        # Functions: entry address; BBs of function f are ids func_bbs[f]:func_bbs[f+1]
+        self.func_addr = _addrs()
+        self.func_bbs = _ids([0])
+        # BBs
+        self.bb_start = _addrs()
+        self.bb_end = _addrs()
+        self.bb_func = _ids()
+        # Intra-procedural edges
+        self.succs = CSR(_ids([0]), _ids())
+        self.preds = CSR(_ids([0]), _ids())
+        # BB -> called function ids, and function -> calling BB ids
+        self.calls = CSR(_ids([0]), _ids())
+        self.callers = CSR(_ids([0]), _ids())
+        # String literals: xref -> referring BB ids, and BB -> xref ids
+        self.literals: List[bytes] = []
+        self.xref_bbs = CSR(_ids([0]), _ids())
+        self.bb_xrefs = CSR(_ids([0]), _ids())
+        # XREF.funcnodes and XREF.ro_addrs (addresses)
+        self.xref_func_addrs = CSR(_ids([0]), _addrs())
+        self.xref_ro_addrs = CSR(_ids([0]), _addrs())
+        # vertex.txt, and edge.txt as flat (src, dst) address pairs;
+        # only filled when loaded from the binary format (see cfg_binary)
+        self.vertices = _addrs()
+        self.edges = _addrs()
+        # BB ids sorted by the start address, for the address lookup
+        self.sorted_starts = _addrs()
+        self.sorted_bb_ids = _ids()
+
+        self._bb_views: Dict[int, BBView] = {}
+        self._func_views: Dict[int, FuncView] = {}
+        self._xref_views: Dict[int, XrefView] = {}
+        self._ranges: Optional[SortedRanges] = None
+
+    @classmethod
+    def from_static_analysis(cls, stat_dir: str) -> "CFGArrays":
+        with open(os.path.join(stat_dir, "pickle_analysis.bin"), "rb") as f:
+            ghidra_cfg = pickle.load(f, encoding="bytes")
+        with open(os.path.join(stat_dir, "CFG_analysis.txt"), "r") as f:
+            funcnode_dict = json.load(f)
+        return cls.from_json(funcnode_dict, ghidra_cfg.string_xref)
+
+    @classmethod
+    def from_json(cls, funcnode_dict: dict, string_xref: dict) -> "CFGArrays":
+        """
+        `funcnode_dict` is the content of CFG_analysis.txt, and `string_xref` is
+        CFG.string_xref of pickle_analysis.bin (addresses not resolved yet)
+        """
+        self = cls()
+        func_id_of: Dict[int, int] = {}
+        for func_addr in funcnode_dict.keys():
+            func_id_of[int(func_addr)] = len(self.func_addr)
+            self.func_addr.append(int(func_addr))
+
+        # Per function: BB address -> id (dst_bbs only refer to the same function)
+        local_ids: List[Dict[int, int]] = []
+        for func_id, _funcnode in enumerate(funcnode_dict.values()):
+            bb_ids: Dict[int, int] = {}
+            for bb_addr, _bb in _funcnode["BBs"].items():
+                bb_ids[int(bb_addr)] = len(self.bb_start)
+                self.bb_start.append(int(bb_addr))
+                self.bb_end.append(_bb["end_addr"] or 0)
+                self.bb_func.append(func_id)
+            self.func_bbs.append(len(self.bb_start))
+            local_ids.append(bb_ids)
+
+        succs = self.succs
+        calls = self.calls
+        for func_id, _funcnode in enumerate(funcnode_dict.values()):
+            bb_ids = local_ids[func_id]
+            for _bb in _funcnode["BBs"].values():
+                succs.ids.extend(bb_ids[dst_addr] for dst_addr in _bb["dst_bbs"])
+                succs.offsets.append(len(succs.ids))
+                calls.ids.extend(func_id_of[addr] for addr in _bb["call_func"])
+                calls.offsets.append(len(calls.ids))
+        num_bbs = len(self.bb_start)
+        self.preds = succs.transpose(num_bbs)
+        self.callers = calls.transpose(len(self.func_addr))
+
+        xref_bb_lists: List[List[int]] = []
+        xref_func_lists: List[List[int]] = []
+        xref_ro_lists: List[List[int]] = []
+        for literal, xref in string_xref.items():
+            bb_ids_of_xref: Set[int] = set()
+            for func_addr in xref.funcnodes:
+                bb_ids = local_ids[func_id_of[func_addr]]
+                for bb_addr in xref.bbs:
+                    bb_id = bb_ids.get(bb_addr)
+                    if bb_id is not None:
+                        bb_ids_of_xref.add(bb_id)
+            self.literals.append(literal)
+            xref_bb_lists.append(sorted(bb_ids_of_xref))
+            xref_func_lists.append(sorted(xref.funcnodes))
+            xref_ro_lists.append(sorted(xref.ro_addrs))
+        self.xref_bbs = CSR.from_lists(xref_bb_lists)
+        self.xref_func_addrs = CSR.from_lists(xref_func_lists, ADDR_TYPECODE)
+        self.xref_ro_addrs = CSR.from_lists(xref_ro_lists, ADDR_TYPECODE)
+        self.bb_xrefs = self.xref_bbs.transpose(num_bbs)
+
+        order = sorted(range(num_bbs), key=self.bb_start.__getitem__)
+        self.sorted_bb_ids = _ids(order)
+        self.sorted_starts = _addrs(self.bb_start[i] for i in order)
+        return self
+
+    def __getstate__(self):
+        state = {
+            name: _to_array(value) if isinstance(value, memoryview) else value
+            for name, value in self.__dict__.items()
+        }
+        # Views are rebuilt on demand
+        state["_bb_views"] = {}
+        state["_func_views"] = {}
+        state["_xref_views"] = {}
+        state["_ranges"] = None
+        return state
+
+    # Array-level API (ids)
+
+    @property
+    def num_bbs(self) -> int:
+        return len(self.bb_start)
+
+    @property
+    def num_funcs(self) -> int:
+        return len(self.func_addr)
+
+    def lookup_bb_id(self, addr: int) -> int:
+        """
+        Id of the BB containing `addr`, or -1
+        """
+        index = bisect_right(self.sorted_starts, addr) - 1
+        if index >= 0:
+            bb_id = self.sorted_bb_ids[index]
+            end = self.bb_end[bb_id]
+            if end and addr <= end:
+                return bb_id
+        return -1
+
+    def _get_ranges(self) -> SortedRanges:
+        if self._ranges is None:
+            if np is not None:
+                sorted_ids = np.asarray(self.sorted_bb_ids, dtype=np.int64)
+                ends = np.asarray(self.bb_end, dtype=np.uint64)[sorted_ids]
+            else:
+                ends = _addrs(self.bb_end[bb_id] for bb_id in self.sorted_bb_ids)
+            self._ranges = SortedRanges(self.sorted_starts, ends)
+        return self._ranges
+
+    def lookup_bb_ids(self, addrs) -> List[int]:
+        """
+        lookup_bb_id() of many addresses at once
+        """
+        ranks = self._get_ranges().find_many(addrs)
+        sorted_ids = self.sorted_bb_ids
+        if np is not None:
+            sorted_ids = np.asarray(sorted_ids, dtype=np.int64)
+            return np.where(ranks >= 0, sorted_ids[np.maximum(ranks, 0)], -1).tolist()
+        return [sorted_ids[rank] if rank >= 0 else -1 for rank in ranks]
+
+    def string_refer_bb_ids(self) -> Set[int]:
+        return set(self.xref_bbs.ids)
+
+    def string_refer_func_ids(self) -> Set[int]:
+        bb_func = self.bb_func
+        return {bb_func[bb_id] for bb_id in self.xref_bbs.ids}
+
+    def caller_func_ids(self, func_id: int) -> Set[int]:
+        bb_func = self.bb_func
+        return {bb_func[bb_id] for bb_id in self.callers[func_id]}
+
+    def transitive_caller_func_ids(self, func_ids: Iterable[int]) -> Set[int]:
+        """
+        `func_ids` and all of their (transitive) callers, by a BFS on the arrays
+        """
+        visited = set(func_ids)
+        queue: Deque[int] = deque(visited)
+        bb_func = self.bb_func
+        offsets, caller_bbs = self.callers.offsets, self.callers.ids
+        while queue:
+            func_id = queue.popleft()
+            for k in range(offsets[func_id], offsets[func_id + 1]):
+                caller = bb_func[caller_bbs[k]]
+                if caller not in visited:
+                    visited.add(caller)
+                    queue.append(caller)
+        return visited
+
+    def reachable_bb_ids(self, bb_id: int) -> Set[int]:
+        """
+        BBs reachable from `bb_id` inside its function
+        """
+        visited = {bb_id}
+        stack = [bb_id]
+        offsets, succ_ids = self.succs.offsets, self.succs.ids
+        while stack:
+            v = stack.pop()
+            for k in range(offsets[v], offsets[v + 1]):
+                w = succ_ids[k]
+                if w not in visited:
+                    visited.add(w)
+                    stack.append(w)
+        return visited
+
+    # Object-like API (views), compatible with the read-only use of CFG
+
+    def bb(self, bb_id: int) -> "BBView":
+        view = self._bb_views.get(bb_id)
+        if view is None:
+            view = self._bb_views[bb_id] = BBView(self, bb_id)
+        return view
+
+    def func(self, func_id: int) -> "FuncView":
+        view = self._func_views.get(func_id)
+        if view is None:
+            view = self._func_views[func_id] = FuncView(self, func_id)
+        return view
+
+    def xref(self, xref_id: int) -> "XrefView":
+        view = self._xref_views.get(xref_id)
+        if view is None:
+            view = self._xref_views[xref_id] = XrefView(self, xref_id)
+        return view
+
+    @property
+    def string_xref(self) -> Dict[bytes, "XrefView"]:
+        return {literal: self.xref(i) for i, literal in enumerate(self.literals)}
+
+    def get_funcs(self) -> List["FuncView"]:
+        return [self.func(i) for i in range(self.num_funcs)]
+
+    def get_string_refer_bbs(self) -> Set["BBView"]:
+        return {self.bb(bb_id) for bb_id in self.string_refer_bb_ids()}
+
+    def get_string_refer_funcs(self) -> Set["FuncView"]:
+        return {self.func(func_id) for func_id in self.string_refer_func_ids()}
+
+    def get_bb_from_addr(self, addr: int) -> Optional["BBView"]:
+        bb_id = self.lookup_bb_id(addr)
+        return self.bb(bb_id) if bb_id >= 0 else None
+
+    def get_num_funcs(self) -> int:
+        return self.num_funcs
+
+    def get_num_bbs(self) -> int:
+        return self.num_bbs
+
+    def get_num_edges(self) -> int:
+        return len(self.succs.ids)
+
+    def convert_edges_to_BBs(self, edges) -> Set["BBView"]:
+        """
+        `edges`: (src, dst) tuples, an Nx2 numpy array or a flat address array
+        """
+        ranks = self._get_ranges().find_unique(flatten_addrs(edges))
+        sorted_ids = self.sorted_bb_ids
+        return {self.bb(sorted_ids[rank]) for rank in ranks}
+
+
+class BBView:
+    """
+    Read-only BB of CFGArrays; one view per id, so views hash by identity like BB
+    """
+
+    __slots__ = ("cfg", "id")
+
+    def __init__(self, cfg: CFGArrays, bb_id: int):
+        self.cfg = cfg
+        self.id = bb_id
+
+    @property
+    def start_addr(self) -> int:
+        return self.cfg.bb_start[self.id]
+
+    @property
+    def end_addr(self) -> Optional[int]:
+        return self.cfg.bb_end[self.id] or None
+
+    @property
+    def parent_funcnode(self) -> "FuncView":
+        return self.cfg.func(self.cfg.bb_func[self.id])
+
+    @property
+    def dst_bbs(self) -> Tuple["BBView", ...]:
+        return tuple(self.cfg.bb(i) for i in self.cfg.succs[self.id])
+
+    @property
+    def pred_bbs(self) -> Tuple["BBView", ...]:
+        return tuple(self.cfg.bb(i) for i in self.cfg.preds[self.id])
+
+    @property
+    def call_func(self) -> Tuple["FuncView", ...]:
+        return tuple(self.cfg.func(i) for i in self.cfg.calls[self.id])
+
+    @property
+    def xrefs(self) -> Tuple["XrefView", ...]:
+        return tuple(self.cfg.xref(i) for i in self.cfg.bb_xrefs[self.id])
+
+    @property
+    def edge_implicate_bbs(self) -> Dict["BBView", Tuple["BBView", ...]]:
+        # Nothing is implicated in the original CFG
+        return {}
+
+    def __str__(self):
+        return hex(self.start_addr)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class FuncView:
+    """
+    Read-only Funcnode of CFGArrays
+    """
+
+    __slots__ = ("cfg", "id")
+
+    def __init__(self, cfg: CFGArrays, func_id: int):
+        self.cfg = cfg
+        self.id = func_id
+
+    @property
+    def addr(self) -> int:
+        return self.cfg.func_addr[self.id]
+
+    def get_bbs(self) -> List[BBView]:
+        first, last = self.cfg.func_bbs[self.id], self.cfg.func_bbs[self.id + 1]
+        return [self.cfg.bb(i) for i in range(first, last)]
+
+    @property
+    def BBs(self) -> Dict[int, BBView]:
+        return {bb.start_addr: bb for bb in self.get_bbs()}
+
+    def get_entry(self) -> BBView:
+        return self.BBs[self.addr]
+
+    def get_sinks(self) -> List[BBView]:
+        return [bb for bb in self.get_bbs() if self.cfg.succs.degree(bb.id) == 0]
+
+    @property
+    def call_func(self) -> Set["FuncView"]:
+        return {callee for bb in self.get_bbs() for callee in bb.call_func}
+
+    @property
+    def xrefs(self) -> Tuple[BBView, ...]:
+        return tuple(self.cfg.bb(i) for i in self.cfg.callers[self.id])
+
+    def __str__(self):
+        return hex(self.addr)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class XrefView:
+    """
+    Read-only XREF of CFGArrays
+    """
+
+    __slots__ = ("cfg", "id")
+
+    def __init__(self, cfg: CFGArrays, xref_id: int):
+        self.cfg = cfg
+        self.id = xref_id
+
+    @property
+    def literal(self) -> bytes:
+        return self.cfg.literals[self.id]
+
+    @property
+    def bbs(self) -> Tuple[BBView, ...]:
+        return tuple(self.cfg.bb(i) for i in self.cfg.xref_bbs[self.id])
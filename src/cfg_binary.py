@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Binary container of the static analysis result (static_analysis.bin).
+
+It replaces CFG_analysis.txt + pickle_analysis.bin + vertex.txt + edge.txt with
+the fixed-width arrays of CFGArrays, so that loading is a mmap and no parsing:
+
+    header:   magic, format version, byte order, number of sections
+    sections: (name, typecode, offset, count) table, then the 8-byte aligned arrays
+
+String literals are one blob plus an offset array.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Tuple
+
+from cfg_arrays import CFGArrays, CSR, ADDR_TYPECODE, ID_TYPECODE
+
+BINARY_FILE_NAME = "static_analysis.bin"
+
+MAGIC = b"SHEPCFG\0"
+FORMAT_VERSION = 1
+# magic, version, byte order ("<" or ">" as a byte), number of sections
+HEADER = struct.Struct("<8sIcxxxI")
+# name, typecode, offset, number of items
+SECTION = struct.Struct("<32scxxxxxxxQQ")
+ALIGN = 8
+
+# Plain arrays of CFGArrays
+ARRAY_FIELDS = [
+    "func_addr",
+    "func_bbs",
+    "bb_start",
+    "bb_end",
+    "bb_func",
+    "sorted_starts",
+    "sorted_bb_ids",
+    "vertices",
+    "edges",
+]
+# CSR relations of CFGArrays; stored as "<name>.off" and "<name>.ids"
+CSR_FIELDS = [
+    "succs",
+    "preds",
+    "calls",
+    "callers",
+    "xref_bbs",
+    "bb_xrefs",
+    "xref_func_addrs",
+    "xref_ro_addrs",
+]
+
+
+def _byte_order() -> bytes:
+    return b"<" if sys.byteorder == "little" else b">"
+
+
+def _collect_sections(cfg: CFGArrays) -> List[Tuple[str, array]]:
+    sections: List[Tuple[str, array]] = []
+    for name in ARRAY_FIELDS:
+        sections.append((name, getattr(cfg, name)))
+    for name in CSR_FIELDS:
+        relation: CSR = getattr(cfg, name)
+        sections.append((f"{name}.off", relation.offsets))
+        sections.append((f"{name}.ids", relation.ids))
+    literal_offsets = array(ID_TYPECODE, [0])
+    for literal in cfg.literals:
+        literal_offsets.append(literal_offsets[-1] + len(literal))
+    sections.append(("literals.off", literal_offsets))
+    sections.append(("literals.blob", array("B", b"".join(cfg.literals))))
+    return sections
+
+
+def write_cfg_binary(path: str, cfg: CFGArrays):
+    sections = _collect_sections(cfg)
+    for name, _ in sections:
+        assert len(name) <= 32, f"section name {name} is too long"
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, values in sections:
+        offset = (offset + ALIGN - 1) // ALIGN * ALIGN
+        table.append((name, values, offset))
+        offset += len(values) * values.itemsize
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, _byte_order(), len(sections)))
+        for name, values, offset in table:
+            f.write(
+                SECTION.pack(
+                    name.encode(), values.typecode.encode(), offset, len(values)
+                )
+            )
+        for _name, values, offset in table:
+            f.write(bytes(offset - f.tell()))
+            values.tofile(f)
+
+
+def read_cfg_binary(path: str) -> CFGArrays:
+    """
+    The arrays are memoryviews over the read-only mmap of the file;
+    the pages are shared by every process that maps the same file.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, byte_order, num_sections = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a static analysis binary")
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"{path} has format version {version}, expected {FORMAT_VERSION}; "
+            "convert it again with script/convert_static_analysis.py"
+        )
+    if byte_order != _byte_order():
+        raise ValueError(f"{path} was written on a machine of another byte order")
+
+    buffer = memoryview(mapped)
+    sections: Dict[str, memoryview] = {}
+    for i in range(num_sections):
+        name, typecode, offset, count = SECTION.unpack_from(
+            mapped, HEADER.size + i * SECTION.size
+        )
+        typecode = typecode.decode()
+        itemsize = array(typecode).itemsize
+        view = buffer[offset : offset + count * itemsize]
+        sections[name.rstrip(b"\0").decode()] = view.cast(typecode)
+
+    cfg = CFGArrays()
+    for name in ARRAY_FIELDS:
+        setattr(cfg, name, sections[name])
+    for name in CSR_FIELDS:
+        setattr(cfg, name, CSR(sections[f"{name}.off"], sections[f"{name}.ids"]))
+    literal_offsets = sections["literals.off"]
+    blob = sections["literals.blob"]
+    cfg.literals = [
+        bytes(blob[literal_offsets[i] : literal_offsets[i + 1]])
+        for i in range(len(literal_offsets) - 1)
+    ]
+    return cfg
+
+
+def convert_static_analysis_result(stat_dir: str, path: str):
+    """
+    Builds the binary from the text/pickle files of a static analysis result
+    """
+    cfg = CFGArrays.from_static_analysis(stat_dir)
+    with open(os.path.join(stat_dir, "vertex.txt"), "r") as f:
+        cfg.vertices = array(
+            ADDR_TYPECODE, (int(line, 16) for line in f if line.strip())
+        )
+    edges = array(ADDR_TYPECODE)
+    with open(os.path.join(stat_dir, "edge.txt"), "r") as f:
+        for line in f:
+            if line.strip():
+                src, dst = line.split()
+                edges.append(int(src, 16))
+                edges.append(int(dst, 16))
+    cfg.edges = edges
+    write_cfg_binary(path, cfg)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+from typing import List, Dict, Optional, Iterator, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from CFG_recover import BB
+
+
+def reverse_postorder(succs: Sequence[Sequence[int]], roots: Sequence[int]) -> List[int]:
+    """
+    Iterative DFS; returns the nodes reachable from `roots` in reverse postorder.
+    """
+    visited = [False] * len(succs)
+    postorder: List[int] = []
+    for root in roots:
+        if visited[root]:
+            continue
+        visited[root] = True
+        stack = [(root, iter(succs[root]))]
+        while stack:
+            v, it = stack[-1]
+            for w in it:
+                if not visited[w]:
+                    visited[w] = True
+                    stack.append((w, iter(succs[w])))
+                    break
+            else:
+                stack.pop()
+                postorder.append(v)
+    postorder.reverse()
+    return postorder
+
+
+def compute_idoms(succs: Sequence[Sequence[int]], root: int) -> List[int]:
+    """
+    Iterative algorithm of Cooper, Harvey and Kennedy ("A Simple, Fast Dominance
+    Algorithm"). Returns idom[v] (-1 for the nodes unreachable from `root`;
+    idom[root] == root).
+    """
+    num_nodes = len(succs)
+    preds: List[List[int]] = [[] for _ in range(num_nodes)]
+    for v, vsuccs in enumerate(succs):
+        for w in vsuccs:
+            preds[w].append(v)
+
+    rpo = reverse_postorder(succs, [root])
+    # Postorder number; larger is closer to the root
+    po_num = [-1] * num_nodes
+    for i, v in enumerate(rpo):
+        po_num[v] = len(rpo) - 1 - i
+
+    idom = [-1] * num_nodes
+    idom[root] = root
+
+    def intersect(b1: int, b2: int) -> int:
+        while b1 != b2:
+            while po_num[b1] < po_num[b2]:
+                b1 = idom[b1]
+            while po_num[b2] < po_num[b1]:
+                b2 = idom[b2]
+        return b1
+
+    changed = True
+    while changed:
+        changed = False
+        for v in rpo:
+            if v == root:
+                continue
+            new_idom = -1
+            for p in preds[v]:
+                if idom[p] == -1:
+                    continue
+                new_idom = p if new_idom == -1 else intersect(p, new_idom)
+            if idom[v] != new_idom:
+                idom[v] = new_idom
+                changed = True
+    return idom
+
+
+class DominatorTree:
+    """
+    Immediate-dominator tree over `nodes` (a node dominates itself).
+    dominates(a, b) is O(1) by the DFS intervals on the tree, and the set of
+    dominators of a node is available as a memoized bitset over the preorder numbers.
+    Nodes unreachable from the root are dominated only by themselves.
+    """
+
+    def __init__(self, nodes: List["BB"], idom: List[int]):
+        self.nodes = nodes
+        self.node_to_idx: Dict[BB, int] = {bb: i for i, bb in enumerate(nodes)}
+        self.idom_idx = idom
+
+        children: List[List[int]] = [[] for _ in nodes]
+        tree_roots: List[int] = []
+        for v, parent in enumerate(idom):
+            if parent == -1 or parent == v:
+                tree_roots.append(v)
+            else:
+                children[parent].append(v)
+
+        # DFS intervals: a dominates b iff pre[a] <= pre[b] and post[b] <= post[a]
+        self.pre = [-1] * len(nodes)
+        self.post = [-1] * len(nodes)
+        self.idx_by_pre: List[int] = []
+        counter = 0
+        for tree_root in tree_roots:
+            self.pre[tree_root] = len(self.idx_by_pre)
+            self.idx_by_pre.append(tree_root)
+            stack = [(tree_root, iter(children[tree_root]))]
+            while stack:
+                v, it = stack[-1]
+                child = next(it, None)
+                if child is None:
+                    stack.pop()
+                    self.post[v] = counter
+                    counter += 1
+                    continue
+                self.pre[child] = len(self.idx_by_pre)
+                self.idx_by_pre.append(child)
+                stack.append((child, iter(children[child])))
+
+        # Memoized bitsets of the dominators (bit = preorder number)
+        self._dom_bits: List[Optional[int]] = [None] * len(nodes)
+
+    def idom(self, bb: "BB") -> Optional["BB"]:
+        v = self.node_to_idx[bb]
+        parent = self.idom_idx[v]
+        if parent == -1 or parent == v:
+            return None
+        return self.nodes[parent]
+
+    def dominates(self, a: "BB", b: "BB") -> bool:
+        ai, bi = self.node_to_idx[a], self.node_to_idx[b]
+        return self.pre[ai] <= self.pre[bi] and self.post[bi] <= self.post[ai]
+
+    def dominator_bits(self, bb: "BB") -> int:
+        v = self.node_to_idx.get(bb)
+        if v is None:
+            return 0
+        # Walk up to the nearest memoized ancestor, then fill the memo downwards
+        path: List[int] = []
+        bits = 0
+        while v != -1:
+            memo = self._dom_bits[v]
+            if memo is not None:
+                bits = memo
+                break
+            path.append(v)
+            parent = self.idom_idx[v]
+            v = -1 if parent == v else parent
+        for v in reversed(path):
+            bits |= 1 << self.pre[v]
+            self._dom_bits[v] = bits
+        return bits
+
+    def bbs_from_bits(self, bits: int) -> Iterator["BB"]:
+        while bits:
+            low_bit = bits & -bits
+            yield self.nodes[self.idx_by_pre[low_bit.bit_length() - 1]]
+            bits ^= low_bit
+
+    def dominators(self, bb: "BB") -> List["BB"]:
+        return list(self.bbs_from_bits(self.dominator_bits(bb)))
+
+
+def build_dominator_tree(
+    nodes: List["BB"], succs: List[List[int]], entry: int
+) -> DominatorTree:
+    return DominatorTree(nodes, compute_idoms(succs, entry))
+
+
+def compute_post_idoms(succs: Sequence[Sequence[int]]) -> List[int]:
+    """
+    Dominators on the reversed CFG rooted at a virtual exit, which has an edge to
+    every sink. Nodes that cannot reach any sink (e.g. infinite loops) would stay
+    unreachable from the virtual exit, so the exit also gets an edge to one node
+    of each such region until everything is reachable.
+    Returns the immediate post-dominators (-1 for the roots of the forest).
+    """
+    num_nodes = len(succs)
+    exit_idx = num_nodes
+    rsuccs: List[List[int]] = [[] for _ in range(num_nodes + 1)]
+    for v, vsuccs in enumerate(succs):
+        if not vsuccs:
+            rsuccs[exit_idx].append(v)
+        for w in vsuccs:
+            rsuccs[w].append(v)
+
+    reached = [False] * (num_nodes + 1)
+
+    def mark_reached(root: int):
+        reached[root] = True
+        stack = [root]
+        while stack:
+            for w in rsuccs[stack.pop()]:
+                if not reached[w]:
+                    reached[w] = True
+                    stack.append(w)
+
+    mark_reached(exit_idx)
+    # Nodes at the end of the function (e.g. the bottom of a loop) are picked first
+    for v in reversed(range(num_nodes)):
+        if not reached[v]:
+            rsuccs[exit_idx].append(v)
+            mark_reached(v)
+
+    idom = compute_idoms(rsuccs, exit_idx)
+    # Drop the virtual exit: its children become roots of the post-dominator forest
+    return [-1 if parent == exit_idx else parent for parent in idom[:num_nodes]]
+
+
+def build_post_dominator_tree(
+    nodes: List["BB"], succs: List[List[int]]
+) -> DominatorTree:
+    return DominatorTree(nodes, compute_post_idoms(succs))
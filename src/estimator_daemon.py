@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+One long-lived estimator for all the fuzzers of a target, instead of a
+fuzz_server.py per AFL++ instance: the patched AFL++ connects to the Unix socket
+in FUZZ_DAEMON_SOCKET rather than starting its own server.
+
+The static analysis is loaded once, then FUZZ_DAEMON_WORKERS workers are
+forked and share it (copy-on-write); they all accept on the same socket, and a
+fuzzer stays with the worker that accepted it. Each fuzzer has its own Session:
+the duplicate responses, the vertices, the mode stats and the delta coverage
+of one fuzzer never mix with another's, and they are saved in its output
+directory when it disconnects.
+
+The fuzzer starts with a hello: a u32 length, then key=value lines (out_dir,
+coverage, shm_id, map_size), with the PUT response memfds attached
+(SCM_RIGHTS) unless it uses the files. The daemon answers HELLO_OK; from then
+on the socket carries the lock-step protocol of the fd 88/89 pipes.
+"""
+
+import gc
+import os
+import selectors
+import signal
+import socket
+import sys
+from typing import Dict
+
+import fuzz_server
+from fuzz_server import process_fuzzer_request, save_server_stats
+from fuzz_transport import (
+    HELLO_OK,
+    HELLO_TIMEOUT,
+    REQUEST_ACK,
+    Session,
+    listen_unix,
+    open_session,
+    recv_hello,
+)
+
+
+def read_daemon_configs():
+    stat_dir = os.environ.get("FUZZ_STATIC_ANALYSIS_PATH")
+    if stat_dir is None:
+        raise Exception("FUZZ_STATIC_ANALYSIS_PATH is not set")
+
+    socket_path = os.environ.get("FUZZ_DAEMON_SOCKET")
+    if socket_path is None:
+        raise Exception("FUZZ_DAEMON_SOCKET is not set")
+
+    workers = int(os.environ.get("FUZZ_DAEMON_WORKERS", str(os.cpu_count() or 1)))
+    return stat_dir, socket_path, max(workers, 1)
+
+
+class Worker:
+    """
+    Serves the fuzzers it accepts, one request at a time
+    """
+
+    def __init__(self, put_cfg, listener: socket.socket):
+        self.put_cfg = put_cfg
+        self.listener = listener
+        self.sessions: Dict[socket.socket, Session] = {}
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(listener, selectors.EVENT_READ)
+
+    def accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        except BlockingIOError:
+            # Another worker took it
+            return
+        conn.settimeout(HELLO_TIMEOUT)
+        session = None
+        try:
+            session = open_session(*recv_hello(conn))
+            conn.settimeout(None)
+            conn.sendall(HELLO_OK)
+        # Only this fuzzer is dropped, not the worker
+        except Exception as e:
+            sys.stderr.write(f"Daemon: bad hello: {e!r}\n")
+            if session is not None:
+                session.close()
+            conn.close()
+            return
+        self.sessions[conn] = session
+        self.selector.register(conn, selectors.EVENT_READ)
+        print(f"Daemon: fuzzer at {session.fuzz_out_dir} connected")
+
+    def serve(self, conn: socket.socket):
+        session = self.sessions[conn]
+        try:
+            request = conn.recv(4, socket.MSG_WAITALL)
+            if len(request) != 4:
+                return self.close(conn)
+            session.coverage.acknowledge(request == REQUEST_ACK)
+            mode = process_fuzzer_request(session)
+            conn.sendall(mode + session.coverage.payload())
+        # Only this fuzzer is dropped
+        except Exception as e:
+            sys.stderr.write(f"Daemon: fuzzer at {session.fuzz_out_dir}: {e!r}\n")
+            self.close(conn)
+
+    def close(self, conn: socket.socket):
+        session = self.sessions.pop(conn)
+        self.selector.unregister(conn)
+        conn.close()
+        try:
+            save_server_stats(self.put_cfg, session)
+        except OSError as e:
+            sys.stderr.write(f"Daemon: stats of {session.fuzz_out_dir}: {e}\n")
+        session.close()
+        print(f"Daemon: fuzzer at {session.fuzz_out_dir} stopped")
+
+    def run(self):
+        try:
+            while True:
+                for key, _ in self.selector.select():
+                    if key.fileobj is self.listener:
+                        self.accept()
+                    else:
+                        self.serve(key.fileobj)
+        finally:
+            for conn in list(self.sessions):
+                self.close(conn)
+
+
+def spawn_worker(put_cfg, listener: socket.socket) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        Worker(put_cfg, listener).run()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        sys.stdout.flush()
+        os._exit(0)
+
+
+def stop(signum, frame):
+    sys.exit(0)
+
+
+def main():
+    stat_dir, socket_path, num_workers = read_daemon_configs()
+    put_cfg = fuzz_server.setup_estimator(stat_dir)
+    # Keep the analysis out of the collections of the workers, so that its
+    # pages stay shared (no gc.freeze on PyPy)
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+    signal.signal(signal.SIGTERM, stop)
+    listener = listen_unix(socket_path)
+    workers = {spawn_worker(put_cfg, listener) for _ in range(num_workers)}
+    print(f"Daemon is READY: {socket_path}, {num_workers} workers")
+    sys.stdout.flush()
+    try:
+        while True:
+            pid, status = os.wait()
+            workers.discard(pid)
+            sys.stderr.write(f"Daemon: worker {pid} exited ({status})\n")
+            workers.add(spawn_worker(put_cfg, listener))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        listener.close()
+        os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+import math
+from array import array
+from collections import deque, OrderedDict
+from multiprocessing import Pool
+from typing import Dict, List, Tuple, Deque, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from CFG_recover import Funcnode
+
+# Distance between two functions that share no common caller
+NO_COMMON_CALLER_DISTANCE = 100
+# Bits of the bitmap of the pairs computed by LazyFuncDistance (1 MiB); a power of 2
+TOUCHED_BITMAP_BITS = 1 << 23
+
+
+def get_caller_distances(func: "Funcnode") -> Dict["Funcnode", int]:
+    """
+    BFS over the callers: maps every (transitive) caller of `func` to its distance.
+    """
+    distances = {func: 0}
+    queue: Deque[Funcnode] = deque([func])
+    while queue:
+        current = queue.popleft()
+        caller_funcs = {bb.parent_funcnode for bb in current.xrefs}
+        for caller in caller_funcs:
+            if caller not in distances:
+                distances[caller] = distances[current] + 1
+                queue.append(caller)
+    return distances
+
+
+def min_common_distance(dists1: Dict[int, int], dists2: Dict[int, int]) -> int:
+    """
+    Distance of two functions: the smallest sum of the distances to a common caller.
+    """
+    if len(dists1) > len(dists2):
+        dists1, dists2 = dists2, dists1
+    min_dist = None
+    for caller, dist1 in dists1.items():
+        dist2 = dists2.get(caller)
+        if dist2 is not None and (min_dist is None or dist1 + dist2 < min_dist):
+            min_dist = dist1 + dist2
+    return NO_COMMON_CALLER_DISTANCE if min_dist is None else min_dist
+
+
+def build_call_adjacency(
+    funcs: List["Funcnode"],
+) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    Integer form of the caller relation: (callers, callees) adjacency lists.
+    `funcs` get the ids 0..len(funcs)-1; their transitive callers outside of `funcs`
+    get the ids after that.
+    """
+    func_to_idx: Dict[Funcnode, int] = {f: i for i, f in enumerate(funcs)}
+    callers: List[List[int]] = [[] for _ in funcs]
+    callees: List[List[int]] = [[] for _ in funcs]
+    queue: Deque[Funcnode] = deque(funcs)
+    while queue:
+        callee = queue.popleft()
+        callee_idx = func_to_idx[callee]
+        for caller in {bb.parent_funcnode for bb in callee.xrefs}:
+            caller_idx = func_to_idx.get(caller)
+            if caller_idx is None:
+                caller_idx = len(callers)
+                func_to_idx[caller] = caller_idx
+                callers.append([])
+                callees.append([])
+                queue.append(caller)
+            callers[callee_idx].append(caller_idx)
+            callees[caller_idx].append(callee_idx)
+    return callers, callees
+
+
+class FuncDistanceMatrix:
+    """
+    Symmetric function distance matrix; only the upper triangle is stored (flat array).
+    Supports `matrix[f1, f2]` so that it can replace the former Dict[(f1, f2), int].
+    """
+
+    def __init__(self, funcs: List["Funcnode"]):
+        self.func_to_idx: Dict[Funcnode, int] = {f: i for i, f in enumerate(funcs)}
+        self.num_funcs = len(funcs)
+        num_cells = self.num_funcs * (self.num_funcs + 1) // 2
+        self.dists = array("H", bytes(2 * num_cells))
+
+    def row_offset(self, i: int) -> int:
+        # Row i holds (i, i), (i, i + 1), ..., (i, n - 1)
+        return i * (2 * self.num_funcs - i + 1) // 2
+
+    def get(self, i: int, j: int) -> int:
+        if i > j:
+            i, j = j, i
+        return self.dists[self.row_offset(i) + j - i]
+
+    def set_row(self, i: int, row: array):
+        offset = self.row_offset(i)
+        self.dists[offset : offset + len(row)] = row
+
+    def __getitem__(self, key: Tuple["Funcnode", "Funcnode"]) -> int:
+        f1, f2 = key
+        return self.get(self.func_to_idx[f1], self.func_to_idx[f2])
+
+    def __contains__(self, key: Tuple["Funcnode", "Funcnode"]) -> bool:
+        f1, f2 = key
+        return f1 in self.func_to_idx and f2 in self.func_to_idx
+
+    def __len__(self) -> int:
+        return self.num_funcs * self.num_funcs
+
+
+# Call adjacency of the worker processes (set by the pool initializer)
+_worker_adjacency: Tuple[List[List[int]], List[List[int]]] = ([], [])
+
+
+def _init_worker(adjacency: Tuple[List[List[int]], List[List[int]]]):
+    global _worker_adjacency
+    _worker_adjacency = adjacency
+
+
+def _compute_row(i: int, num_funcs: int) -> Tuple[int, array]:
+    """
+    min_a (up(i, a) + down(a, j)) for every j >= i in a single pass:
+    the BFS up over the callers seeds a level-synchronous BFS down over the callees,
+    where each common caller `a` joins the frontier at the level of its up-distance.
+    """
+    callers, callees = _worker_adjacency
+    # BFS up; `up_order` is sorted by the distance
+    up_dists = {i: 0}
+    up_order = [i]
+    for v in up_order:
+        for caller in callers[v]:
+            if caller not in up_dists:
+                up_dists[caller] = up_dists[v] + 1
+                up_order.append(caller)
+
+    dists = [-1] * len(callers)
+    frontier: List[int] = []
+    src_pos = 0
+    level = 0
+    while frontier or src_pos < len(up_order):
+        while src_pos < len(up_order) and up_dists[up_order[src_pos]] == level:
+            src = up_order[src_pos]
+            src_pos += 1
+            if dists[src] < 0:
+                dists[src] = level
+                frontier.append(src)
+        level += 1
+        next_frontier: List[int] = []
+        for v in frontier:
+            for callee in callees[v]:
+                if dists[callee] < 0:
+                    dists[callee] = level
+                    next_frontier.append(callee)
+        frontier = next_frontier
+
+    row = array(
+        "H", (d if d >= 0 else NO_COMMON_CALLER_DISTANCE for d in dists[i:num_funcs])
+    )
+    return i, row
+
+
+def _compute_row_star(args: Tuple[int, int]) -> Tuple[int, array]:
+    return _compute_row(*args)
+
+
+def build_func_distance_matrix(
+    funcs: List["Funcnode"], processes: int = 1
+) -> FuncDistanceMatrix:
+    """
+    O(F * (F + E)): one up-then-down BFS per function instead of a BFS per pair.
+    Rows are distributed over a process pool when `processes` > 1.
+    """
+    matrix = FuncDistanceMatrix(funcs)
+    adjacency = build_call_adjacency(funcs)
+    num_funcs = len(funcs)
+    row_args = [(i, num_funcs) for i in range(num_funcs)]
+    if processes > 1 and num_funcs > 1:
+        with Pool(processes, initializer=_init_worker, initargs=(adjacency,)) as pool:
+            rows = pool.imap_unordered(_compute_row_star, row_args, chunksize=16)
+            for i, row in rows:
+                matrix.set_row(i, row)
+    else:
+        _init_worker(adjacency)
+        for i, _ in row_args:
+            matrix.set_row(*_compute_row(i, num_funcs))
+        _init_worker(([], []))
+    return matrix
+
+
+def _mix64(x: int) -> int:
+    """
+    The splitmix64 finalizer: consecutive pairs spread like random ones, which
+    linear counting assumes
+    """
+    x = (x + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+
+class LazyFuncDistance:
+    """
+    On-demand alternative to FuncDistanceMatrix with bounded memory:
+    a distance is computed on first use from the caller-distance vectors of the two
+    functions; both the vectors and the results are kept in LRU caches.
+    CDBI only asks for pairs of functions owning string-referring BBs,
+    so usually only a tiny fraction of the matrix is ever touched.
+
+    The touched pairs are marked in a bitmap of at most TOUCHED_BITMAP_BITS bits:
+    one bit per pair while the matrix fits, otherwise the pairs are hashed into
+    it and counted by linear counting (an estimate).
+    """
+
+    def __init__(
+        self,
+        funcs: List["Funcnode"],
+        cache_size: int = 1 << 16,
+        vector_cache_size: int = 1 << 12,
+    ):
+        self.func_to_idx: Dict[Funcnode, int] = {f: i for i, f in enumerate(funcs)}
+        self.num_funcs = len(funcs)
+        self.cache_size = cache_size
+        self.vector_cache_size = vector_cache_size
+        self._results: "OrderedDict[int, int]" = OrderedDict()
+        self._vectors: "OrderedDict[Funcnode, Dict[Funcnode, int]]" = OrderedDict()
+        # Pairs computed so far, for the touched ratio
+        num_cells = self.num_funcs * self.num_funcs
+        self.touched_exact = num_cells <= TOUCHED_BITMAP_BITS
+        self.touched_slots = num_cells if self.touched_exact else TOUCHED_BITMAP_BITS
+        # The top bits of the hash index the bitmap (a power of 2)
+        self.touched_shift = 64 - (TOUCHED_BITMAP_BITS.bit_length() - 1)
+        self.touched_bits = bytearray((self.touched_slots + 7) // 8)
+        self.touched_count = 0
+        self.num_lookups = 0
+        self.num_computed = 0
+
+    def _get_vector(self, func: "Funcnode") -> Dict["Funcnode", int]:
+        vector = self._vectors.get(func)
+        if vector is not None:
+            self._vectors.move_to_end(func)
+            return vector
+        vector = get_caller_distances(func)
+        self._vectors[func] = vector
+        if len(self._vectors) > self.vector_cache_size:
+            self._vectors.popitem(last=False)
+        return vector
+
+    def __getitem__(self, key: Tuple["Funcnode", "Funcnode"]) -> int:
+        f1, f2 = key
+        i, j = self.func_to_idx[f1], self.func_to_idx[f2]
+        if i > j:
+            i, j, f1, f2 = j, i, f2, f1
+        packed = i * self.num_funcs + j
+        self.num_lookups += 1
+        dist = self._results.get(packed)
+        if dist is not None:
+            self._results.move_to_end(packed)
+            return dist
+        dist = min_common_distance(self._get_vector(f1), self._get_vector(f2))
+        self.num_computed += 1
+        self._mark_touched(packed)
+        self._results[packed] = dist
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+        return dist
+
+    def _mark_touched(self, packed: int):
+        if not self.touched_exact:
+            packed = _mix64(packed) >> self.touched_shift
+        byte, bit = packed >> 3, 1 << (packed & 7)
+        if not self.touched_bits[byte] & bit:
+            self.touched_bits[byte] |= bit
+            self.touched_count += 1
+
+    def touched_pairs(self) -> int:
+        """
+        Number of distinct pairs computed so far; estimated on a large matrix
+        """
+        if self.touched_exact:
+            return self.touched_count
+        slots = self.touched_slots
+        zeros = max(slots - self.touched_count, 1)
+        return round(slots * math.log(slots / zeros))
+
+    def __contains__(self, key: Tuple["Funcnode", "Funcnode"]) -> bool:
+        f1, f2 = key
+        return f1 in self.func_to_idx and f2 in self.func_to_idx
+
+    def __len__(self) -> int:
+        return self.num_funcs * self.num_funcs
+
+    def touched_ratio(self) -> float:
+        """
+        Fraction of the (upper-triangle) full matrix that has been computed.
+        """
+        num_cells = self.num_funcs * (self.num_funcs + 1) // 2
+        return min(self.touched_pairs() / num_cells, 1.0) if num_cells else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lookups": self.num_lookups,
+            "computed": self.num_computed,
+            "touched_pairs": self.touched_pairs(),
+            "touched_ratio": self.touched_ratio(),
+            "cached_results": len(self._results),
+            "cached_vectors": len(self._vectors),
+        }
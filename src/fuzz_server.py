@@ -1,19 +1,40 @@
-from bb_match import BBMatcher, LabradorMatcher
+from async_server import AsyncServer, StreamChannel
+from bb_match import BBMatcher, LabradorMatcher, CDBI
 from CFG_recover import BB
 from typing import Dict, Tuple, Union, List
-from CFG_transform import CFGTransformer
-import bz_common as bzc
+from func_distance import LazyFuncDistance
+from fuzz_transport import (
+    DeltaCoverage,
+    REQUEST_ACK,
+    Session,
+    fds_are_open,
+    listen_unix,
+    open_coverage,
+    open_response,
+    serve_pipelined,
+)
+from snapshot import load_preprocessed, preprocess_static_analysis
 import os
-import hashlib
 import sys
+import time
 
-# Input byte hash set to avoid duplicate calculation
-seen_bytes = set()
-seen_vertices = set()
 use_labrador_low = False
 use_labrador_high = False
 vertex_idx_map: Dict[int, int] = {}
-# global vars for stats
+# Per-request latency budget in seconds (None: always run the full pipeline)
+time_budget = None
+# Requests in flight with the pipelined protocol (0: lock-step)
+pipeline_depth = 0
+# Inference processes of the asyncio mode (None: not in the asyncio mode), and
+# the socket it accepts fuzzers on
+async_workers = None
+async_socket = None
+
+# Coverage modes; each one is also the 4-byte status token sent to the fuzzer
+MODE_FULL = b"DONE"  # matching + CDBI (the legacy token)
+MODE_NO_CDBI = b"FAST"  # no CDBI, like search_bbs_without_beam
+MODE_TRUNCATED = b"TRNC"  # deadline passed while matching; the rest lines dropped
+MODE_DUPLICATE = b"DUPL"  # already-seen response; the last coverage is repeated
 
 
 def read_max_lines_to_read():
@@ -23,6 +44,49 @@ def read_max_lines_to_read():
     return max_lines
 
 
+# Number of processes used for preprocessing the static analysis result
+def read_preprocess_jobs():
+    return int(os.environ.get("FUZZ_PREPROCESS_JOBS", "1"))
+
+
+# FUZZ_LAZY_FUNC_DISTANCE=<cache size> computes function distances on demand
+def read_lazy_func_distance():
+    cache_size = os.environ.get("FUZZ_LAZY_FUNC_DISTANCE")
+    if cache_size is None:
+        return None
+    return int(cache_size) if cache_size else 1 << 16
+
+
+# Preprocessing snapshot: FUZZ_NO_SNAPSHOT disables it, FUZZ_SNAPSHOT_REBUILD forces
+# a rebuild, FUZZ_SNAPSHOT_DIR overrides <static analysis dir>/snapshot
+def read_snapshot_configs():
+    use_snapshot = "FUZZ_NO_SNAPSHOT" not in os.environ
+    rebuild = "FUZZ_SNAPSHOT_REBUILD" in os.environ
+    return use_snapshot, rebuild, os.environ.get("FUZZ_SNAPSHOT_DIR")
+
+
+# FUZZ_TIME_BUDGET_MS=0 (or unset) disables the graceful degradation
+def read_time_budget():
+    budget_ms = float(os.environ.get("FUZZ_TIME_BUDGET_MS", "0"))
+    if budget_ms <= 0:
+        return None
+    return budget_ms / 1000
+
+
+# FUZZ_PIPELINE_DEPTH=<n> serves the pipelined protocol with up to n requests in flight
+def read_pipeline_depth():
+    return int(os.environ.get("FUZZ_PIPELINE_DEPTH", "0"))
+
+
+# FUZZ_ASYNC_SERVER serves the channels with asyncio, inferring on FUZZ_ASYNC_WORKERS
+# processes (0: in the event loop); FUZZ_ASYNC_SOCKET accepts more fuzzers there
+def read_async_configs():
+    if "FUZZ_ASYNC_SERVER" not in os.environ:
+        return None, None
+    workers = int(os.environ.get("FUZZ_ASYNC_WORKERS", str(os.cpu_count() or 1)))
+    return workers, os.environ.get("FUZZ_ASYNC_SOCKET")
+
+
 # Firstly, read necessary env vars; plus existence checks
 def read_env_configs():
     stat_dir_env = "FUZZ_STATIC_ANALYSIS_PATH"
@@ -37,129 +101,219 @@ def read_env_configs():
     return stat_dir, fuzz_out_dir
 
 
-# PUT response is in stdout.txt and stderr.txt
-def load_put_response(fuzz_out_dir):
-    stdout_file_path = os.path.join(fuzz_out_dir, "stdout.txt")
-    stderr_file_path = os.path.join(fuzz_out_dir, "stderr.txt")
-    lines = []
-    prev_line = None
-    with open(stdout_file_path, "rb") as f:
-        for line in f:
-            if line != prev_line:
-                lines.append(line)
-            prev_line = line
-    prev_line = None
-    with open(stderr_file_path, "rb") as f:
-        for line in f:
-            if line != prev_line:
-                lines.append(line)
-            prev_line = line
-    # return last max_lines lines
-    return lines[-max_lines:]
-
-
 # just read the vertex_idx_map
 def calc_vertex_idx(addr):
     assert addr in vertex_idx_map
     return vertex_idx_map[addr]
 
 
-def save_vertices(bb_list, fuzz_out_dir):
-    out_file_path = os.path.join(fuzz_out_dir, "edges.txt")
-    with open(out_file_path, "w") as f:
-        for bb in bb_list:
-            addr = bb.start_addr
-            idx = calc_vertex_idx(addr)
-            f.write(f"{idx:x}\n")
-            seen_vertices.add(addr)
+def save_vertices(bb_list, session: Session):
+    save_addrs_for_fuzzer([bb.start_addr for bb in bb_list], session)
 
 
 def save_addrs_for_fuzzer(
-    addr_list: Union[List[int], List[Tuple[int, int]]], fuzz_out_dir
+    addr_list: Union[List[int], List[Tuple[int, int]]], session: Session
 ):
-    out_file_path = os.path.join(fuzz_out_dir, "edges.txt")
-    with open(out_file_path, "w") as f:
-        for addr in addr_list:
-            idx = calc_vertex_idx(addr)
-            f.write(f"{idx:x}\n")
-            seen_vertices.add(addr)
+    session.coverage.write([calc_vertex_idx(addr) for addr in addr_list])
+    session.seen_vertices.update(addr_list)
 
 
 matcher = None
 
 
-def process_fuzzer_request(put_cfg, fuzz_out_dir):
-    lines = load_put_response(fuzz_out_dir)
-    whole_bytes = b"".join(lines)
-    hashed_bytes = hashlib.sha256(whole_bytes).digest()
-    if hashed_bytes in seen_bytes:
-        return
-    seen_bytes.add(hashed_bytes)
+def search_bbs_in_budget(matcher: BBMatcher, response: bytes, deadline):
+    """
+    Run the Shepherd pipeline but fall back to cheaper steps once the deadline passes:
+    the rest lines are dropped while matching, and CDBI is skipped (or given up)
+    afterwards.
+    """
+    match_items, truncated = matcher.match_lines(response, deadline)
+    if truncated:
+        return matcher.collect_bbs_without_beam(match_items), MODE_TRUNCATED
+    bbs = CDBI(match_items, matcher.idx_to_match_info, matcher.cfg, deadline)
+    if bbs is None:
+        return matcher.collect_bbs_without_beam(match_items), MODE_NO_CDBI
+    return bbs, MODE_FULL
 
-    global matcher
-    if use_labrador_high:
-        if matcher is None:
-            matcher = LabradorMatcher(put_cfg, 0.70)
-        bbs = matcher.get_labrador_bbs(whole_bytes)
-        addr_list = list(map(lambda x: x.start_addr, bbs))
-        save_addrs_for_fuzzer(addr_list, fuzz_out_dir)
-        return
 
-    elif use_labrador_low:
-        if matcher is None:
-            matcher = LabradorMatcher(put_cfg, 0.35)
+def process_fuzzer_request(session: Session, whole_bytes=None):
+    mode = handle_fuzzer_request(session, whole_bytes)
+    session.mode_counts[mode] += 1
+    return mode
+
+
+def is_duplicate(session: Session, whole_bytes: bytes) -> bool:
+    """
+    Whether the fuzzer sent this response before; then its last coverage is
+    repeated
+    """
+    if session.dedup is not None and session.dedup.seen(whole_bytes):
+        session.coverage.repeat()
+        return True
+    return False
+
+
+def infer_addrs(whole_bytes: bytes, start: float):
+    """
+    The start addresses of the inferred vertices, and the mode; module-level
+    (with the matcher in a global) so that the asyncio mode can run it on its
+    process pool
+    """
+    if use_labrador_high or use_labrador_low:
         bbs = matcher.get_labrador_bbs(whole_bytes)
-        addr_list = list(map(lambda x: x.start_addr, bbs))
-        save_addrs_for_fuzzer(addr_list, fuzz_out_dir)
-    else:
-        if matcher is None:
-            matcher = BBMatcher(put_cfg)
-        bbs = matcher.search_bbs(whole_bytes)
-        addr_list = list(map(lambda x: x.start_addr, bbs))
-        save_addrs_for_fuzzer(addr_list, fuzz_out_dir)
-        return put_cfg, bbs
+        return [bb.start_addr for bb in bbs], MODE_FULL
+    deadline = None if time_budget is None else start + time_budget
+    bbs, mode = search_bbs_in_budget(matcher, whole_bytes, deadline)
+    return [bb.start_addr for bb in bbs], mode
+
+
+def handle_fuzzer_request(session: Session, whole_bytes=None):
+    start = time.perf_counter()
+    if whole_bytes is None:
+        whole_bytes = session.put_response.load(max_lines)
+    if is_duplicate(session, whole_bytes):
+        return MODE_DUPLICATE
 
+    addr_list, mode = infer_addrs(whole_bytes, start)
+    save_addrs_for_fuzzer(addr_list, session)
+    return mode
 
-def save_all_vertices(fuzz_out_dir):
-    edge_file_path = os.path.join(fuzz_out_dir, "all_vertices.txt")
+
+def save_all_vertices(session: Session):
+    edge_file_path = os.path.join(session.fuzz_out_dir, "all_vertices.txt")
     with open(edge_file_path, "w") as f:
-        for addr in seen_vertices:
+        for addr in session.seen_vertices:
             f.write(f"{addr:x}\n")
 
 
-def start_fuzz_server(put_cfg, fuzz_out_dir):
+def save_mode_stats(session: Session):
+    stat_file_path = os.path.join(session.fuzz_out_dir, "mode_stats.txt")
+    with open(stat_file_path, "w") as f:
+        for mode in (MODE_FULL, MODE_NO_CDBI, MODE_TRUNCATED, MODE_DUPLICATE):
+            f.write(f"{mode.decode()}: {session.mode_counts[mode]}\n")
+
+
+def save_dedup_stats(session: Session):
+    if session.dedup is None:
+        return
+    stat_file_path = os.path.join(session.fuzz_out_dir, "dedup_stats.txt")
+    with open(stat_file_path, "w") as f:
+        for key, value in session.dedup.stats().items():
+            f.write(f"{key}: {value}\n")
+
+
+def save_func_distance_stats(put_cfg, fuzz_out_dir):
+    func_distance_map = getattr(put_cfg, "func_distance_map", None)
+    if not isinstance(func_distance_map, LazyFuncDistance):
+        return
+    stat_file_path = os.path.join(fuzz_out_dir, "func_distance_stats.txt")
+    with open(stat_file_path, "w") as f:
+        for key, value in func_distance_map.stats().items():
+            f.write(f"{key}: {value}\n")
+
+
+def save_server_stats(put_cfg, session: Session):
+    save_all_vertices(session)
+    save_mode_stats(session)
+    save_dedup_stats(session)
+    save_func_distance_stats(put_cfg, session.fuzz_out_dir)
+
+
+def start_pipelined_server(put_cfg, session: Session, read_fd, write_fd):
+    def infer(whole_bytes):
+        mode = process_fuzzer_request(session, whole_bytes)
+        return mode, session.coverage.payload()
+
+    print(f"Server is READY: pipelined, depth {pipeline_depth}")
+    try:
+        serve_pipelined(
+            read_fd,
+            write_fd,
+            lambda: session.put_response.load(max_lines),
+            infer,
+            pipeline_depth,
+        )
+        sys.stderr.write("Server: Fuzzer stopped\n")
+    except Exception as e:
+        sys.stderr.write(f"Server: Fuzzer stopped: {e}\n")
+    save_server_stats(put_cfg, session)
+
+
+def start_async_server(put_cfg, session: Session, read_fd, write_fd):
+    channels = []
+    if fds_are_open((read_fd, write_fd)):
+        channels.append(
+            StreamChannel("pipe", session, read_fd, write_fd, pipeline_depth)
+        )
+    server = AsyncServer(
+        infer_addrs,
+        is_duplicate,
+        MODE_DUPLICATE,
+        save_addrs_for_fuzzer,
+        lambda session: save_server_stats(put_cfg, session),
+        max_lines,
+        async_workers,
+        os.path.join(session.fuzz_out_dir, "async_stats.txt"),
+    )
+    listener = listen_unix(async_socket) if async_socket else None
+    print(f"Server is READY: asyncio, {async_workers} workers")
+    server.run(channels, listener)
+
+
+def start_fuzz_server(put_cfg, session: Session):
     read_fd = 88
     write_fd = 89
+    if async_workers is not None:
+        return start_async_server(put_cfg, session, read_fd, write_fd)
+    if pipeline_depth:
+        return start_pipelined_server(put_cfg, session, read_fd, write_fd)
 
     count = 0
     while True:
         count += 1
         print(f"Server is READY: {count}")
         try:
-            os.read(read_fd, 4)
+            request = os.read(read_fd, 4)
+            session.coverage.acknowledge(request == REQUEST_ACK)
 
-            process_fuzzer_request(put_cfg, fuzz_out_dir)
+            mode = process_fuzzer_request(session)
 
-            os.write(write_fd, b"DONE")
+            # The token tells the fuzzer which mode produced the coverage; the
+            # delta coverage follows it
+            os.write(write_fd, mode + session.coverage.payload())
         # if there is error, then the fuzzer stopped, we dump the whole coverage
         except Exception as e:
             sys.stderr.write(f"Server: Fuzzer stopped: {e}\n")
-            save_all_vertices(fuzz_out_dir)
+            save_server_stats(put_cfg, session)
             break
 
 
-def main():
-    stat_dir, fuzz_out_dir = read_env_configs()
+def setup_estimator(stat_dir):
+    """
+    Loads the static analysis and reads the configs shared by every fuzzer;
+    returns the CFG of the PUT
+    """
     global vertex_idx_map
-    put_cfg, _, vertex_idx_map = bzc.load_static_analysis_result(stat_dir)
-    transformer = CFGTransformer(put_cfg)
-    transformer.run_all_passes(put_cfg)
-    put_cfg.build_dominators()
-    put_cfg.build_func_distance_map()
+    global matcher
+    preprocess_jobs = read_preprocess_jobs()
+    lazy_cache_size = read_lazy_func_distance()
+    use_snapshot, rebuild, snapshot_dir = read_snapshot_configs()
+    if use_snapshot:
+        preprocessed = load_preprocessed(
+            stat_dir, preprocess_jobs, lazy_cache_size, rebuild, snapshot_dir
+        )
+    else:
+        preprocessed = preprocess_static_analysis(
+            stat_dir, preprocess_jobs, lazy_cache_size
+        )
+    put_cfg, vertex_idx_map, shepherd_matcher = preprocessed
 
     global max_lines
     max_lines = read_max_lines_to_read()
 
+    global time_budget
+    time_budget = read_time_budget()
+
     global use_labrador_low
     global use_labrador_high
     if "FUZZ_USE_LABRADOR_LOW" in os.environ:
@@ -171,12 +325,40 @@ def main():
         )
         use_labrador_high = True
 
+    if use_labrador_high:
+        matcher = LabradorMatcher(put_cfg, 0.70)
+    elif use_labrador_low:
+        matcher = LabradorMatcher(put_cfg, 0.35)
+    else:
+        matcher = shepherd_matcher
+    return put_cfg
+
+
+def main():
+    stat_dir, fuzz_out_dir = read_env_configs()
+    put_cfg = setup_estimator(stat_dir)
+
+    coverage = open_coverage(fuzz_out_dir)
+
+    global pipeline_depth
+    pipeline_depth = read_pipeline_depth()
+    if pipeline_depth:
+        # trace_bits belongs to the test case being executed by then; the
+        # coverage of the earlier ones goes back in the results
+        coverage = DeltaCoverage()
+
+    global async_workers
+    global async_socket
+    async_workers, async_socket = read_async_configs()
+
+    session = Session(fuzz_out_dir, open_response(fuzz_out_dir), coverage)
+
     if "FUZZ_NOT_START_SERVER" in os.environ:
-        return process_fuzzer_request(put_cfg, fuzz_out_dir)
+        return process_fuzzer_request(session)
 
     print("Sever: Warming up...")
 
-    start_fuzz_server(put_cfg, fuzz_out_dir)
+    start_fuzz_server(put_cfg, session)
 
     """
     for line in lines:
@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+"""
+Transport of the PUT response (stdout and stderr) from the patched AFL++ to the
+fuzz server, and of the inferred coverage back.
+
+By default the faux forkserver of the patch redirects the PUT output into two
+memfds, truncated before every execution, and the fuzz server inherits them as
+STDOUT_FD and STDERR_FD: a response is two fstat and pread calls, without a path
+lookup, an open or a close per execution.
+With FUZZ_RESPONSE_FILES (or without memfd_create), the patch writes
+stdout.txt and stderr.txt in the fuzzer output directory instead, and so does
+try_estimate.py; the server falls back to them whenever the fds are not open.
+
+The coverage is set straight into the trace_bits of AFL++ (FUZZ_COVERAGE_MODE=shm,
+the shm in __AFL_SHM_ID) after the execution, so there is no edges.txt to write
+and parse. The patch picks the mode and passes it with FUZZ_MAP_SIZE; with
+FUZZ_COVERAGE_FILE (and outside of AFL++) the indexes go to edges.txt instead.
+With FUZZ_COVERAGE_DELTA (FUZZ_COVERAGE_MODE=delta), only the vertices never
+reported before follow the status token on the status pipe, see DeltaCoverage.
+
+The lock-step request is REQUEST, or REQUEST_ACK when AFL++ compared the bits of
+the last delta payload against its virgin_bits; the vertices of a payload count
+as reported only once acknowledged.
+
+The pipelined protocol (FUZZ_PIPELINE_DEPTH) is in serve_pipelined.
+"""
+import ctypes
+import io
+import mmap
+import os
+import select
+import socket
+import struct
+from array import array
+from collections import defaultdict, deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from response_dedup import make_dedup
+
+STDOUT_FD = 90
+STDERR_FD = 91
+
+
+def merge_streams(streams: Sequence[bytes], max_lines: int) -> bytes:
+    """
+    The last max_lines lines of the streams, with consecutive duplicate lines
+    dropped in each stream
+    """
+    lines = []
+    for data in streams:
+        prev_line = None
+        for line in io.BytesIO(data):
+            if line != prev_line:
+                lines.append(line)
+            prev_line = line
+    return b"".join(lines[-max_lines:])
+
+
+class FileResponse:
+    """
+    The response in stdout.txt and stderr.txt of the fuzzer output directory
+    """
+
+    def __init__(self, fuzz_out_dir: str):
+        self.paths = [
+            os.path.join(fuzz_out_dir, "stdout.txt"),
+            os.path.join(fuzz_out_dir, "stderr.txt"),
+        ]
+
+    def load(self, max_lines: int) -> bytes:
+        streams = []
+        for path in self.paths:
+            with open(path, "rb") as f:
+                streams.append(f.read())
+        return merge_streams(streams, max_lines)
+
+    def close(self):
+        pass
+
+
+class MemfdResponse:
+    """
+    The response in the memfds inherited from the patched AFL++
+    """
+
+    def __init__(self, fds=(STDOUT_FD, STDERR_FD)):
+        self.fds = fds
+
+    def load(self, max_lines: int) -> bytes:
+        streams = [os.pread(fd, os.fstat(fd).st_size, 0) for fd in self.fds]
+        return merge_streams(streams, max_lines)
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+
+
+def fds_are_open(fds) -> bool:
+    try:
+        for fd in fds:
+            os.fstat(fd)
+    except OSError:
+        return False
+    return True
+
+
+def open_response(fuzz_out_dir: str) -> Union[FileResponse, MemfdResponse]:
+    """
+    The memfds if the patched AFL++ passed them (and FUZZ_RESPONSE_FILES is
+    not set), otherwise the files
+    """
+    fds = (STDOUT_FD, STDERR_FD)
+    if "FUZZ_RESPONSE_FILES" not in os.environ and fds_are_open(fds):
+        return MemfdResponse(fds)
+    return FileResponse(fuzz_out_dir)
+
+
+class FileCoverage:
+    """
+    edges.txt in the fuzzer output directory, a hex vertex index per line
+    """
+
+    def __init__(self, fuzz_out_dir: str):
+        self.path = os.path.join(fuzz_out_dir, "edges.txt")
+
+    def write(self, idxs: Iterable[int]):
+        with open(self.path, "w") as f:
+            for idx in idxs:
+                f.write(f"{idx:x}\n")
+
+    def repeat(self):
+        # edges.txt is left untouched
+        pass
+
+    def acknowledge(self, compared: bool):
+        pass
+
+    def payload(self) -> bytes:
+        return b""
+
+    def close(self):
+        pass
+
+
+class ShmCoverage:
+    """
+    The trace_bits of AFL++: a SysV shm id, or the name of a POSIX shm
+    (AFL++ built with USEMMAP)
+    """
+
+    def __init__(self, shm_id: str, map_size: int):
+        self.map_size = map_size
+        self.last_idxs: List[int] = []
+        self.shm_addr = None
+        if shm_id.startswith("/"):
+            fd = os.open(os.path.join("/dev/shm", shm_id.lstrip("/")), os.O_RDWR)
+            try:
+                self.bits = mmap.mmap(fd, map_size)
+            finally:
+                os.close(fd)
+            return
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        addr = libc.shmat(int(shm_id), None, 0)
+        if addr is None or addr == ctypes.c_void_p(-1).value:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"shmat({shm_id}): {os.strerror(errno)}")
+        self.libc = libc
+        self.shm_addr = addr
+        self.bits = (ctypes.c_ubyte * map_size).from_address(addr)
+
+    def write(self, idxs: List[int]):
+        """
+        AFL++ has cleared trace_bits before the execution
+        """
+        bits = self.bits
+        map_size = self.map_size
+        for idx in idxs:
+            bits[idx % map_size] = 1
+        self.last_idxs = idxs
+
+    def repeat(self):
+        # Like edges.txt left untouched, e.g. for the calibration runs
+        self.write(self.last_idxs)
+
+    def acknowledge(self, compared: bool):
+        pass
+
+    def payload(self) -> bytes:
+        return b""
+
+    def close(self):
+        if self.shm_addr is None:
+            self.bits.close()
+        else:
+            self.bits = None
+            self.libc.shmdt(self.shm_addr)
+            self.shm_addr = None
+
+
+# Header of the delta payload: the hash of the coverage set and the number of
+# new vertices, in the byte order of the host like the u32 indexes after it
+DELTA_HEADER = struct.Struct("=QI")
+_HASH_MASK = (1 << 64) - 1
+
+
+class DeltaCoverage:
+    """
+    Only the vertices that were never reported before, as the payload after the
+    status token. The fuzzer sets their bits, so without new vertices trace_bits
+    stays empty and has nothing to compare against virgin_bits; when the hash of
+    the coverage set is the same as the last one (the calibration runs of an
+    input), it sets the bits of the last payload again.
+
+    With acks (the lock-step protocol), the vertices of a payload stay pending
+    until the next request acknowledges that AFL++ compared their bits against
+    virgin_bits. The trimming and colorization runs, crashes and hangs do not,
+    so their new vertices are sent again by the next execution reaching them.
+    Without acks (pipelined), a vertex counts as reported once sent.
+    """
+
+    def __init__(self, acks: bool = False):
+        self.acks = acks
+        self.reported = set()
+        self.pending = frozenset()
+        self.set_hash = 0
+        self.header = DELTA_HEADER.pack(0, 0)
+        self.new_idxs = b""
+
+    def acknowledge(self, compared: bool):
+        """
+        What the request says of the last payload
+        """
+        if compared:
+            self.reported |= self.pending
+            self.pending = frozenset()
+
+    def write(self, idxs: Iterable[int]):
+        idx_set = frozenset(idxs)
+        new_idxs = idx_set - self.reported
+        if self.acks:
+            self.pending = new_idxs
+        else:
+            self.reported |= new_idxs
+        self.set_hash = hash(idx_set) & _HASH_MASK
+        self.header = DELTA_HEADER.pack(self.set_hash, len(new_idxs))
+        self.new_idxs = array("I", sorted(new_idxs)).tobytes()
+
+    def repeat(self):
+        # Nothing new, and the same set as the last execution
+        self.header = DELTA_HEADER.pack(self.set_hash, 0)
+        self.new_idxs = b""
+
+    def payload(self) -> bytes:
+        return self.header + self.new_idxs
+
+    def close(self):
+        pass
+
+
+def make_coverage(
+    mode: Optional[str],
+    fuzz_out_dir: str,
+    shm_id: str,
+    map_size: int,
+    acks: bool = True,
+) -> Union[FileCoverage, ShmCoverage, DeltaCoverage]:
+    if mode == "shm":
+        return ShmCoverage(shm_id, map_size)
+    if mode == "delta":
+        return DeltaCoverage(acks)
+    return FileCoverage(fuzz_out_dir)
+
+
+def open_coverage(
+    fuzz_out_dir: str,
+) -> Union[FileCoverage, ShmCoverage, DeltaCoverage]:
+    """
+    trace_bits or the delta payload if the patched AFL++ asked for it,
+    otherwise edges.txt
+    """
+    mode = os.environ.get("FUZZ_COVERAGE_MODE")
+    if mode == "shm":
+        shm_id = os.environ["__AFL_SHM_ID"]
+        map_size = int(os.environ["FUZZ_MAP_SIZE"])
+        return make_coverage(mode, fuzz_out_dir, shm_id, map_size)
+    return make_coverage(mode, fuzz_out_dir, "", 0)
+
+
+# Lock-step requests; REQUEST_ACK when AFL++ compared the bits of the last delta
+# payload against its virgin_bits (see DeltaCoverage)
+REQUEST = b"HOW\n"
+REQUEST_ACK = b"ACK\n"
+
+# Pipelined protocol messages: a 4-byte tag and the request id
+PIPE_MESSAGE = struct.Struct("=4sI")
+PIPE_REQUEST = b"PIPE"
+PIPE_ACK = b"TOOK"
+
+
+def read_exact(fd: int, size: int) -> Optional[bytes]:
+    """
+    `size` bytes from the pipe, or None at the end of the file
+    """
+    data = os.read(fd, size)
+    while data and len(data) < size:
+        more = os.read(fd, size - len(data))
+        if not more:
+            break
+        data += more
+    return data if len(data) == size else None
+
+
+def serve_pipelined(
+    read_fd: int,
+    write_fd: int,
+    load_response: Callable[[], bytes],
+    infer: Callable[[bytes], Tuple[bytes, bytes]],
+    depth: int,
+):
+    """
+    Serves the pipelined protocol until the fuzzer closes `read_fd`.
+
+    - The fuzzer sends PIPE_REQUEST with the id of a test case after executing it.
+    - The server copies the response right away (load_response) and answers
+      PIPE_ACK with the same id; from then on, the fuzzer may execute the next
+      test case, which overwrites the response.
+    - The result follows later: the status token, the id and the delta
+      coverage payload (infer gives the token and the payload).
+
+    Results come back in the order of the requests, and the ack of a request
+    always comes before its result. At most `depth` requests are acked but
+    without a result: the server reads no more requests until it sends one, so
+    the fuzzer blocks on the ack. New requests are acked before the pending
+    ones are inferred, so the execution of the next test case overlaps with
+    the inference of the earlier ones.
+    If the fuzzer goes away, the pending results are dropped; if the server
+    goes away, the fuzzer sees the end of the file and has to treat every
+    request without a result as without coverage.
+    """
+    pending = deque()
+    while True:
+        if not pending or (
+            len(pending) < depth and select.select([read_fd], [], [], 0)[0]
+        ):
+            request = read_exact(read_fd, PIPE_MESSAGE.size)
+            if request is None:
+                return
+            tag, request_id = PIPE_MESSAGE.unpack(request)
+            if tag != PIPE_REQUEST:
+                raise ValueError(f"Unknown request {tag!r}")
+            pending.append((request_id, load_response()))
+            os.write(write_fd, PIPE_MESSAGE.pack(PIPE_ACK, request_id))
+        else:
+            request_id, response = pending.popleft()
+            token, payload = infer(response)
+            os.write(write_fd, PIPE_MESSAGE.pack(token, request_id) + payload)
+
+
+class Session:
+    """
+    What belongs to one fuzzer: where its response is read from, where its
+    coverage goes, and its accounting
+    """
+
+    def __init__(self, fuzz_out_dir: str, put_response, coverage):
+        self.fuzz_out_dir = fuzz_out_dir
+        self.put_response = put_response
+        self.coverage = coverage
+        # The responses seen before, to avoid duplicate calculation (None: off)
+        self.dedup = make_dedup()
+        self.seen_vertices = set()
+        self.mode_counts: Dict[bytes, int] = defaultdict(int)
+
+    def close(self):
+        self.put_response.close()
+        self.coverage.close()
+
+
+# The hello of a fuzzer on a socket (estimator_daemon.py, async_server.py): a u32
+# length, then key=value lines. The fds go along with it (SCM_RIGHTS), named
+# by the comma-separated fds key ("stdout,stderr" by default)
+HELLO_LENGTH = struct.Struct("=I")
+HELLO_OK = b"OKAY"
+# Seconds a fuzzer has for the hello after connecting
+HELLO_TIMEOUT = 10
+HELLO_MAX_FDS = 8
+
+
+def parse_hello(data: bytes) -> Dict[str, str]:
+    return dict(line.split("=", 1) for line in data.decode().splitlines() if line)
+
+
+def recv_with_fds(conn: socket.socket, size: int, max_fds: int):
+    """
+    Like socket.recv_fds, which PyPy 3.8 does not have
+    """
+    fds = array("i")
+    ancsize = socket.CMSG_SPACE(max_fds * fds.itemsize)
+    data, ancdata, flags, _ = conn.recvmsg(size, ancsize)
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[: len(cmsg_data) - len(cmsg_data) % fds.itemsize])
+    if flags & socket.MSG_CTRUNC:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError(f"more than {max_fds} fds")
+    return data, list(fds)
+
+
+def send_hello(conn: socket.socket, hello: Dict[str, str], fds: Sequence[int] = ()):
+    """
+    What the patched AFL++ sends (shepherd_connect_daemon)
+    """
+    data = "".join(f"{key}={value}\n" for key, value in hello.items()).encode()
+    message = HELLO_LENGTH.pack(len(data)) + data
+    ancdata = []
+    if fds:
+        ancdata.append((socket.SOL_SOCKET, socket.SCM_RIGHTS, array("i", fds)))
+    sent = conn.sendmsg([message], ancdata)
+    conn.sendall(message[sent:])
+
+
+def recv_hello(conn: socket.socket) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    The hello of a fuzzer and the fds that came with it, by name
+    """
+    data, fds = recv_with_fds(conn, 4096, HELLO_MAX_FDS)
+    try:
+        while len(data) < HELLO_LENGTH.size or len(data) < (
+            HELLO_LENGTH.size + HELLO_LENGTH.unpack_from(data)[0]
+        ):
+            more = conn.recv(4096)
+            if not more:
+                raise ConnectionError("the fuzzer left during the hello")
+            data += more
+        hello = parse_hello(data[HELLO_LENGTH.size :])
+        names = hello["fds"].split(",") if hello.get("fds") else ["stdout", "stderr"]
+        if fds and len(names) != len(fds):
+            raise ValueError(f"{len(fds)} fds for {names}")
+        return hello, dict(zip(names, fds))
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def open_session(hello: Dict[str, str], fds: Dict[str, int]) -> Session:
+    """
+    The session of a fuzzer from its hello; it takes the fds out of `fds` and
+    closes those it does not use
+    """
+    response_fds = [fds.pop(name) for name in ("stdout", "stderr") if name in fds]
+    for fd in fds.values():
+        os.close(fd)
+    fds.clear()
+    try:
+        fuzz_out_dir = hello["out_dir"]
+        coverage = make_coverage(
+            hello.get("coverage"),
+            fuzz_out_dir,
+            hello.get("shm_id", ""),
+            int(hello.get("map_size", "0")),
+            # No acks with the pipelined protocol
+            acks=not int(hello.get("depth", "0")),
+        )
+    except BaseException:
+        for fd in response_fds:
+            os.close(fd)
+        raise
+    if len(response_fds) == 2:
+        return Session(fuzz_out_dir, MemfdResponse(tuple(response_fds)), coverage)
+    for fd in response_fds:
+        os.close(fd)
+    return Session(fuzz_out_dir, FileResponse(fuzz_out_dir), coverage)
+
+
+def listen_unix(socket_path: str) -> socket.socket:
+    """
+    A non-blocking listening socket at socket_path, replacing a stale one
+    """
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    listener.setblocking(False)
+    return listener
@@ -1,8 +1,74 @@
 from CFG_recover import Funcnode
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Tuple
+
+
+# Tarjan's algo; the DFS is on an explicit path, so deep call chains do not
+# hit the recursion limit. The SCCs are numbered in reverse topological order.
+def find_sccs(succs: List[List[int]]) -> Tuple[List[int], int]:
+    num_vertices = len(succs)
+    index = 0
+    stack = []
+    on_stack = [False] * num_vertices
+    indices = [-1] * num_vertices
+    lowlinks = [-1] * num_vertices
+    # Position of the next edge to visit for each vertex on the DFS path
+    next_edge = [0] * num_vertices
+    scc_ids = [-1] * num_vertices
+    scc_count = 0
+
+    for root in range(num_vertices):
+        if indices[root] != -1:
+            continue
+        indices[root] = lowlinks[root] = index
+        index += 1
+        stack.append(root)
+        on_stack[root] = True
+        path = [root]
+        while path:
+            v = path[-1]
+            edges = succs[v]
+            i = next_edge[v]
+            descended = False
+            while i < len(edges):
+                w = edges[i]
+                i += 1
+                if indices[w] == -1:  # Unvisited: keep DFS
+                    indices[w] = lowlinks[w] = index
+                    index += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    path.append(w)
+                    descended = True
+                    break
+                if on_stack[w] and indices[w] < lowlinks[v]:  # Back edge
+                    lowlinks[v] = indices[w]
+            next_edge[v] = i
+            if descended:
+                continue
+
+            # All edges of v are visited: return from v
+            path.pop()
+            if lowlinks[v] == indices[v]:  # Root of SCC
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    scc_ids[w] = scc_count
+                    if w == v:
+                        break
+                scc_count += 1
+            if path and lowlinks[v] < lowlinks[path[-1]]:
+                lowlinks[path[-1]] = lowlinks[v]
+    return scc_ids, scc_count
 
 
 class CallGraph:
+    """
+    Call graph of the interesting functions and their (transitive) callers, with
+    its SCCs and a bottom-up order of them. Inlining (merge_into) and the other
+    changes of calls and functions update it in place (see add_call, remove_call,
+    redirect_call and remove_func); nothing is rebuilt from scratch.
+    """
+
     def __init__(self, _init_funcs: List[Funcnode]):
         self.addr_to_idx: Dict[int, int] = {}  # func.addr -> node idx
         self.idx_to_func: List[Funcnode] = []  # node idx -> func
@@ -11,105 +77,108 @@ class CallGraph:
         self.scc_ids: List[int] = []  # SCC id for each node (Tarjan Algo)
         self.scc_count = 0
         self.scc_dag: List[List[int]] = []
+        # Reverse of scc_dag (caller SCCs of each SCC)
+        self.scc_preds: List[List[int]] = []
         self.scc_funcidx_map: List[List[int]] = []
+        # Tombstones of the removed functions (e.g. merged into their callers by
+        # merge_into); SCC ids of merged or emptied SCCs are not reused either
+        self.removed: List[bool] = []
+        # Bottom-up order of the SCCs: callees before callers. `order` has holes
+        # (-1) where SCCs were removed; scc_pos is the slot of each SCC in it.
+        self.order: List[int] = []
+        self.scc_pos: List[int] = []
         self._build(_init_funcs)
         self._find_sccs()
-        self._build_contracted_dag()
         self._build_scc_funcidx_map()
+        self._build_contracted_dag()
+        self._build_order()
+
+    def _add_vertex(self, f: Funcnode) -> int:
+        idx = self.num_vertices
+        self.adj.append([])
+        self.addr_to_idx[f.addr] = idx
+        self.idx_to_func.append(f)
+        self.removed.append(False)
+        self.num_vertices += 1
+        return idx
 
     # Build the initial call graph from the list of interesting functions
     def _build(self, init_funcs: List[Funcnode]):
-        def _add_func(f: Funcnode):
-            addr = f.addr
-            self.adj.append([])
-            self.addr_to_idx[addr] = self.num_vertices
-            self.idx_to_func.append(f)
-            self.num_vertices += 1
-            visited_funcs.add(addr)
-
-        visited_funcs: Set[int] = set()
         for f in init_funcs:
-            _add_func(f)
+            self._add_vertex(f)
 
-        funcs = init_funcs.copy()  # list of interesting functions
-        while funcs:
-            f = funcs.pop(0)
+        # BFS over the callers; the queue is idx_to_func itself (FIFO by index)
+        callee_idx = 0
+        while callee_idx < self.num_vertices:
+            f = self.idx_to_func[callee_idx]
+            # The callers of f are only added here, so this dedups the edges
+            callers: Set[int] = set()
             for xref in f.xrefs:
                 caller = xref.parent_funcnode
-                if caller.addr not in visited_funcs:
-                    _add_func(caller)
-                    funcs.append(caller)
+                caller_idx = self.addr_to_idx.get(caller.addr)
+                if caller_idx is None:
+                    caller_idx = self._add_vertex(caller)
                 # Add edge (caller -> callee)
-                callee_idx = self.addr_to_idx[f.addr]
-                caller_idx = self.addr_to_idx[caller.addr]
-                if callee_idx not in self.adj[caller_idx]:
+                if caller_idx not in callers:
+                    callers.add(caller_idx)
                     self.adj[caller_idx].append(callee_idx)
+            callee_idx += 1
 
-    # Tarjan's algo
     def _find_sccs(self):
-        index = 0
-        stack = []
-        on_stack = [False] * self.num_vertices
-        indices = [-1] * self.num_vertices
-        lowlinks = [-1] * self.num_vertices
-        self.scc_ids = [-1] * self.num_vertices
-        self.scc_count = 0
-
-        def _strong_connect(v: int):
-            nonlocal index
-            indices[v] = index
-            lowlinks[v] = index
-            index += 1
-            stack.append(v)
-            on_stack[v] = True
-
-            for w in self.adj[v]:
-                if indices[w] == -1:  # Unvisited: keep DFS
-                    _strong_connect(w)
-                    lowlinks[v] = min(lowlinks[v], lowlinks[w])
-                elif on_stack[w]:  # Visited and on stack: back edge
-                    lowlinks[v] = min(lowlinks[v], indices[w])
-
-            if lowlinks[v] == indices[v]:  # Root of SCC
-                while True:
-                    w = stack.pop()
-                    on_stack[w] = False
-                    self.scc_ids[w] = self.scc_count
-                    if w == v:
-                        break
-                self.scc_count += 1
-
-        for v in range(self.num_vertices):
-            if indices[v] == -1:
-                _strong_connect(v)
+        self.scc_ids, self.scc_count = find_sccs(self.adj)
 
-    # Build SCCs DAG
+    # Build SCCs DAG (needs scc_funcidx_map)
     def _build_contracted_dag(self):
         self.scc_dag = [[] for _ in range(self.scc_count)]
-        for v in range(self.num_vertices):
-            for w in self.adj[v]:
-                scc_v, scc_w = self.scc_ids[v], self.scc_ids[w]
-                if scc_v != scc_w and scc_w not in self.scc_dag[scc_v]:
-                    self.scc_dag[scc_v].append(scc_w)
+        # last_from[scc_w] == scc_v: the edge (scc_v -> scc_w) is already added
+        last_from = [-1] * self.scc_count
+        for scc_v, members in enumerate(self.scc_funcidx_map):
+            dag_succs = self.scc_dag[scc_v]
+            for v in members:
+                for w in self.adj[v]:
+                    scc_w = self.scc_ids[w]
+                    if scc_w != scc_v and last_from[scc_w] != scc_v:
+                        last_from[scc_w] = scc_v
+                        dag_succs.append(scc_w)
+        self.scc_preds = [[] for _ in range(self.scc_count)]
+        for scc_v, dag_succs in enumerate(self.scc_dag):
+            for scc_w in dag_succs:
+                self.scc_preds[scc_w].append(scc_v)
 
-    # Reversed topological sort of SCCs DAG
-    def reverse_topological_sort(self) -> List[int]:
+    # Initial bottom-up order: postorder of an iterative DFS over the SCC DAG
+    def _build_order(self):
         visited = [False] * self.scc_count
+        next_edge = [0] * self.scc_count
         stack = []
 
-        def dfs(v):
-            visited[v] = True
-            for neighbor in self.scc_dag[v]:
-                if not visited[neighbor]:
-                    dfs(neighbor)
-            stack.append(v)
+        for root in range(self.scc_count):
+            if visited[root]:
+                continue
+            visited[root] = True
+            path = [root]
+            while path:
+                v = path[-1]
+                neighbors = self.scc_dag[v]
+                i = next_edge[v]
+                while i < len(neighbors) and visited[neighbors[i]]:
+                    i += 1
+                if i < len(neighbors):
+                    next_edge[v] = i + 1
+                    visited[neighbors[i]] = True
+                    path.append(neighbors[i])
+                else:
+                    path.pop()
+                    stack.append(v)
 
-        for i in range(self.scc_count):
-            if not visited[i]:
-                dfs(i)
+        self.order = stack
+        self.scc_pos = [0] * self.scc_count
+        for pos, scc in enumerate(stack):
+            self.scc_pos[scc] = pos
 
-        # We don't reverse at the end because this is exactly the order the nodes should be visited
-        return stack
+    # Reversed topological sort of SCCs DAG
+    def reverse_topological_sort(self) -> List[int]:
+        # We don't reverse because this is exactly the order the nodes should be visited
+        return [scc for scc in self.order if scc != -1]
 
     # scc_idx -> list of function indices
     def _build_scc_funcidx_map(self):
@@ -157,5 +226,334 @@ class CallGraph:
     def build_func_to_scc_id(self) -> Dict[int, int]:
         func_to_scc_id = {}
         for i, func in enumerate(self.idx_to_func):
-            func_to_scc_id[func.addr] = self.scc_ids[i]
+            if not self.removed[i]:
+                func_to_scc_id[func.addr] = self.scc_ids[i]
         return func_to_scc_id
+
+    def get_funcs(self) -> List[Funcnode]:
+        return [f for i, f in enumerate(self.idx_to_func) if not self.removed[i]]
+
+    # Update after inlining `callees` into `caller`: each callee has no other caller
+    # and is not in the SCC of the caller, so it is a singleton SCC and the other
+    # SCCs stay the same. The callees are left as tombstones; indices do not move.
+    def merge_into(self, callees: List[Funcnode], caller: Funcnode):
+        caller_idx = self.addr_to_idx[caller.addr]
+        caller_scc = self.scc_ids[caller_idx]
+        callee_indices = [self.addr_to_idx.pop(callee.addr) for callee in callees]
+        callee_sccs = [self.scc_ids[callee_idx] for callee_idx in callee_indices]
+        assert caller_scc not in callee_sccs, f"{caller} inlined a callee of its SCC"
+
+        # The callees of the callees are now called by the call sites in the caller
+        removed_indices = set(callee_indices)
+        caller_adj = [w for w in self.adj[caller_idx] if w not in removed_indices]
+        seen = set(caller_adj)
+        for callee_idx in callee_indices:
+            for w in self.adj[callee_idx]:
+                if w not in seen and w not in removed_indices:
+                    seen.add(w)
+                    caller_adj.append(w)
+        self.adj[caller_idx] = caller_adj
+
+        removed_sccs = set(callee_sccs)
+        caller_dag = [
+            scc for scc in self.scc_dag[caller_scc] if scc not in removed_sccs
+        ]
+        seen = set(caller_dag)
+        for callee_scc in callee_sccs:
+            for scc in self.scc_dag[callee_scc]:
+                self.scc_preds[scc].remove(callee_scc)
+                if scc not in seen and scc not in removed_sccs:
+                    seen.add(scc)
+                    caller_dag.append(scc)
+                    self.scc_preds[scc].append(caller_scc)
+        self.scc_dag[caller_scc] = caller_dag
+
+        # The callees of the callees were already before the callees in the order
+        for callee_idx, callee_scc in zip(callee_indices, callee_sccs):
+            self.adj[callee_idx] = []
+            self._clear_scc(callee_scc)
+            self.removed[callee_idx] = True
+
+    def _new_scc(self, members: List[int]) -> int:
+        scc = self.scc_count
+        self.scc_count += 1
+        self.scc_dag.append([])
+        self.scc_preds.append([])
+        self.scc_funcidx_map.append(members)
+        self.scc_pos.append(-1)
+        for v in members:
+            self.scc_ids[v] = scc
+        return scc
+
+    def _clear_scc(self, scc: int):
+        # The edges of the SCC must be removed from its neighbors beforehand
+        self.scc_dag[scc] = []
+        self.scc_preds[scc] = []
+        self.scc_funcidx_map[scc] = []
+        self.order[self.scc_pos[scc]] = -1
+        self.scc_pos[scc] = -1
+
+    def _add_func(self, func: Funcnode) -> int:
+        """
+        Adds `func` and its callers that are not in the graph yet, with their calls
+        """
+        v = self._add_vertex(func)
+        self.scc_ids.append(-1)
+        self.scc_pos[self._new_scc([v])] = len(self.order)
+        self.order.append(self.scc_ids[v])
+        new_funcs = [v]
+        while new_funcs:
+            callee_idx = new_funcs.pop()
+            for xref in self.idx_to_func[callee_idx].xrefs:
+                caller = xref.parent_funcnode
+                caller_idx = self.addr_to_idx.get(caller.addr)
+                if caller_idx is None:
+                    caller_idx = self._add_vertex(caller)
+                    self.scc_ids.append(-1)
+                    self.scc_pos[self._new_scc([caller_idx])] = len(self.order)
+                    self.order.append(self.scc_ids[caller_idx])
+                    new_funcs.append(caller_idx)
+                self._add_edge(caller_idx, callee_idx)
+        return v
+
+    def _add_edge(self, v: int, w: int):
+        if w in self.adj[v]:
+            return
+        self.adj[v].append(w)
+        scc_v, scc_w = self.scc_ids[v], self.scc_ids[w]
+        if scc_v != scc_w and scc_w not in self.scc_dag[scc_v]:
+            self._add_scc_edge(scc_v, scc_w)
+
+    def _reach(self, start: int, edges: List[List[int]], lower: int, upper: int):
+        # SCCs reachable from `start` within the slots [lower, upper] of the order
+        reached = {start}
+        todo = [start]
+        while todo:
+            for scc in edges[todo.pop()]:
+                if scc not in reached and lower <= self.scc_pos[scc] <= upper:
+                    reached.add(scc)
+                    todo.append(scc)
+        return reached
+
+    def _add_scc_edge(self, caller_scc: int, callee_scc: int):
+        """
+        Adds (caller_scc -> callee_scc) to the DAG. If the callee is after the caller
+        in the order, the affected slots are reordered by the dynamic topological
+        sort of Pearce and Kelly; if the edge closes a cycle, the SCCs on the cycle
+        are merged into one.
+        """
+        lower, upper = self.scc_pos[caller_scc], self.scc_pos[callee_scc]
+        if upper < lower:
+            self.scc_dag[caller_scc].append(callee_scc)
+            self.scc_preds[callee_scc].append(caller_scc)
+            return
+        # Callers of the caller and callees of the callee between the two slots
+        forward = self._reach(caller_scc, self.scc_preds, lower, upper)
+        backward = self._reach(callee_scc, self.scc_dag, lower, upper)
+        cycle = forward & backward
+        slots = sorted(self.scc_pos[scc] for scc in forward | backward)
+        for slot in slots:
+            self.order[slot] = -1
+        # The callees of the callee go (down) into the first slots, the callers of
+        # the caller (up) into the last ones, and the merged cycle between them
+        moved_down = sorted(backward - cycle, key=self.scc_pos.__getitem__)
+        moved_up = sorted(forward - cycle, key=self.scc_pos.__getitem__)
+        new_slots = slots[: len(moved_down)] + slots[len(slots) - len(moved_up) :]
+        sccs = moved_down + moved_up
+        if cycle:
+            new_slots.insert(len(moved_down), slots[len(moved_down)])
+            sccs.insert(len(moved_down), self._merge_cycle(cycle))
+        for slot, scc in zip(new_slots, sccs):
+            self.order[slot] = scc
+            self.scc_pos[scc] = slot
+        if not cycle:
+            self.scc_dag[caller_scc].append(callee_scc)
+            self.scc_preds[callee_scc].append(caller_scc)
+
+    def _merge_cycle(self, cycle: Set[int]) -> int:
+        merged = min(cycle)
+        members = [v for scc in sorted(cycle) for v in self.scc_funcidx_map[scc]]
+        dag_succs = {s for scc in cycle for s in self.scc_dag[scc]} - cycle
+        dag_preds = {p for scc in cycle for p in self.scc_preds[scc]} - cycle
+        for s in dag_succs:
+            preds = [p for p in self.scc_preds[s] if p not in cycle]
+            self.scc_preds[s] = preds + [merged]
+        for p in dag_preds:
+            succs = [s for s in self.scc_dag[p] if s not in cycle]
+            self.scc_dag[p] = succs + [merged]
+        for scc in cycle:
+            self.scc_dag[scc] = []
+            self.scc_preds[scc] = []
+            self.scc_funcidx_map[scc] = []
+            self.scc_pos[scc] = -1
+        self.scc_dag[merged] = sorted(dag_succs)
+        self.scc_preds[merged] = sorted(dag_preds)
+        self.scc_funcidx_map[merged] = sorted(members)
+        for v in members:
+            self.scc_ids[v] = merged
+        return merged
+
+    def _set_scc_succs(self, scc: int, succs: List[int]):
+        old = set(self.scc_dag[scc])
+        new = set(succs)
+        for s in old - new:
+            self.scc_preds[s].remove(scc)
+        for s in succs:
+            if s not in old:
+                self.scc_preds[s].append(scc)
+        self.scc_dag[scc] = succs
+
+    def _get_scc_succs(self, scc: int) -> List[int]:
+        succs = []
+        seen = {scc}
+        for v in self.scc_funcidx_map[scc]:
+            for w in self.adj[v]:
+                scc_w = self.scc_ids[w]
+                if scc_w not in seen:
+                    seen.add(scc_w)
+                    succs.append(scc_w)
+        return succs
+
+    def _update_scc(self, scc: int, callers_changed: bool):
+        """
+        After calls of the functions in `scc` were removed: splits it into the SCCs
+        of what remains of it, and updates its edges (and those of its callers if
+        their calls changed or it split)
+        """
+        callers = list(self.scc_preds[scc])
+        members = self.scc_funcidx_map[scc]
+        if not members:
+            self._set_scc_succs(scc, [])
+            for p in callers:
+                self._set_scc_succs(p, self._get_scc_succs(p))
+            self._clear_scc(scc)
+            return
+        local_idx = {v: i for i, v in enumerate(members)}
+        local_succs = [
+            [local_idx[w] for w in self.adj[v] if w in local_idx] for v in members
+        ]
+        local_scc_ids, num_sccs = find_sccs(local_succs)
+        sccs = [scc]
+        if num_sccs > 1:
+            # Split; the parts are in reverse topological order, like the whole order
+            parts: List[List[int]] = [[] for _ in range(num_sccs)]
+            for v, local_scc in zip(members, local_scc_ids):
+                parts[local_scc].append(v)
+            self.scc_funcidx_map[scc] = parts[0]
+            sccs += [self._new_scc(part) for part in parts[1:]]
+            self._place_parts(sccs)
+        for part_scc in sccs:
+            self._set_scc_succs(part_scc, self._get_scc_succs(part_scc))
+        if callers_changed or len(sccs) > 1:
+            for p in callers:
+                if p not in sccs:
+                    self._set_scc_succs(p, self._get_scc_succs(p))
+
+    def _place_parts(self, sccs: List[int]):
+        """
+        Slots for the parts of a split SCC (sccs[0] still has the slot of the whole),
+        in their order: the holes nearest to that slot, after the callees and before
+        the callers of the whole (or the end if it has no callers). If there are not
+        enough holes, all slots are renumbered.
+        """
+        scc = sccs[0]
+        slot = self.scc_pos[scc]
+        lower = max((self.scc_pos[s] for s in self.scc_dag[scc]), default=-1)
+        upper = min((self.scc_pos[p] for p in self.scc_preds[scc]), default=-1)
+        if upper == -1:
+            # No callers: the parts go to the end
+            self.order[slot] = -1
+            for part_scc in sccs:
+                self.scc_pos[part_scc] = len(self.order)
+                self.order.append(part_scc)
+            return
+        slots = [slot]
+        left, right = slot - 1, slot + 1
+        while len(slots) < len(sccs) and (left > lower or right < upper):
+            if left > lower:
+                if self.order[left] == -1:
+                    slots.append(left)
+                left -= 1
+            if right < upper and len(slots) < len(sccs):
+                if self.order[right] == -1:
+                    slots.append(right)
+                right += 1
+        if len(slots) < len(sccs):
+            order = []
+            for s in self.order:
+                if s != -1:
+                    order.append(s)
+                    if s == scc:
+                        order += sccs[1:]
+            self.order = order
+            for pos, s in enumerate(order):
+                self.scc_pos[s] = pos
+            return
+        for slot, part_scc in zip(sorted(slots), sccs):
+            self.order[slot] = part_scc
+            self.scc_pos[part_scc] = slot
+
+    def _reaches_in_scc(self, v: int, w: int) -> bool:
+        scc = self.scc_ids[v]
+        reached = {v}
+        todo = [v]
+        while todo:
+            for u in self.adj[todo.pop()]:
+                if u == w:
+                    return True
+                if u not in reached and self.scc_ids[u] == scc:
+                    reached.add(u)
+                    todo.append(u)
+        return False
+
+    def add_call(self, caller: Funcnode, callee: Funcnode):
+        """
+        Adds (caller -> callee); a caller that is not in the graph is added with its
+        callers. Calls of functions that are not in the graph are not tracked.
+        """
+        w = self.addr_to_idx.get(callee.addr)
+        if w is None:
+            return
+        v = self.addr_to_idx.get(caller.addr)
+        if v is None:
+            v = self._add_func(caller)
+        self._add_edge(v, w)
+
+    def remove_call(self, caller: Funcnode, callee: Funcnode):
+        """
+        Removes (caller -> callee); calls that are not in the graph are ignored
+        """
+        v = self.addr_to_idx.get(caller.addr)
+        w = self.addr_to_idx.get(callee.addr)
+        if v is None or w is None or w not in self.adj[v]:
+            return
+        self.adj[v].remove(w)
+        scc_v = self.scc_ids[v]
+        if scc_v == self.scc_ids[w]:
+            # The SCC stays as it is if v still reaches w some other way
+            if not self._reaches_in_scc(v, w):
+                self._update_scc(scc_v, False)
+        else:
+            self._set_scc_succs(scc_v, self._get_scc_succs(scc_v))
+
+    def redirect_call(self, caller: Funcnode, old_callee: Funcnode, callee: Funcnode):
+        self.remove_call(caller, old_callee)
+        self.add_call(caller, callee)
+
+    def remove_func(self, func: Funcnode):
+        """
+        Removes `func` and its calls; the callers stay in the graph. A function
+        that is not in the graph is ignored, like in add_call and remove_call.
+        """
+        v = self.addr_to_idx.pop(func.addr, None)
+        if v is None:
+            return
+        scc = self.scc_ids[v]
+        for p in self.scc_preds[scc] + [scc]:
+            for u in self.scc_funcidx_map[p]:
+                if v in self.adj[u]:
+                    self.adj[u].remove(v)
+        self.adj[v] = []
+        self.removed[v] = True
+        self.scc_funcidx_map[scc].remove(v)
+        self._update_scc(scc, True)
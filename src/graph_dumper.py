@@ -161,8 +161,8 @@ def visualize_funcnode(
     # Add edges
     for bb in func_bbs:
         for succ in bb.dst_bbs:
-            if len(bb.edge_implicate_bbs[succ]) > 0:
-                implicated_bbs = bb.edge_implicate_bbs[succ]
+            implicated_bbs = funcnode.get_implicated_bbs(bb, succ)
+            if len(implicated_bbs) > 0:
                 implication_text = f"{implicated_bbs}"
             else:
                 implication_text = ""
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Edge implications of a function while the CFG is transformed.
+
+Passing the edge (src -> dst) of a minimized CFG implicates passing the BBs that
+were removed or merged on the way in the original CFG. CFGTransformer keeps
+joining (union) and meeting (intersection) these sets; here a set is an int bitset
+over a per-function numbering of the implicated BBs, and the sets of all edges
+of the function are in one table keyed by (src.id, dst.id). An edge without
+implications has no entry, and looking it up allocates nothing.
+
+CFG.freeze turns the table into BB.edge_implicate_bbs for the estimation.
+"""
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple
+
+if TYPE_CHECKING:
+    from CFG_recover import BB
+
+# (src.id, dst.id) packed into one int key
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+def _edge_key(src: "BB", dst: "BB") -> int:
+    return (src.id << _ID_BITS) | dst.id
+
+
+class ImplicationTable:
+    __slots__ = ("bit_bbs", "bit_of", "edges", "endpoints")
+
+    def __init__(self):
+        # Numbering of the implicated BBs (bit i of a bitset is bit_bbs[i])
+        self.bit_bbs: List["BB"] = []
+        self.bit_of: Dict["BB", int] = {}
+        # (src.id, dst.id) -> non-zero bitset
+        self.edges: Dict[int, int] = {}
+        # id -> BB of the ends of the edges in `edges`
+        self.endpoints: Dict[int, "BB"] = {}
+
+    def bit(self, bb: "BB") -> int:
+        index = self.bit_of.get(bb)
+        if index is None:
+            index = self.bit_of[bb] = len(self.bit_bbs)
+            self.bit_bbs.append(bb)
+        return 1 << index
+
+    def to_bits(self, bbs: Iterable["BB"]) -> int:
+        bits = 0
+        for bb in bbs:
+            bits |= self.bit(bb)
+        return bits
+
+    def to_bbs(self, bits: int) -> List["BB"]:
+        result = []
+        while bits:
+            low_bit = bits & -bits
+            result.append(self.bit_bbs[low_bit.bit_length() - 1])
+            bits ^= low_bit
+        return result
+
+    def get(self, src: "BB", dst: "BB") -> int:
+        return self.edges.get(_edge_key(src, dst), 0)
+
+    def set(self, src: "BB", dst: "BB", bits: int):
+        key = _edge_key(src, dst)
+        if bits:
+            self.edges[key] = bits
+            self.endpoints[src.id] = src
+            self.endpoints[dst.id] = dst
+        else:
+            self.edges.pop(key, None)
+
+    def intersect(self, src: "BB", dst: "BB", bits: int):
+        key = _edge_key(src, dst)
+        current = self.edges.get(key)
+        if current is None:
+            return
+        current &= bits
+        if current:
+            self.edges[key] = current
+        else:
+            del self.edges[key]
+
+    def discard(self, src: "BB", dst: "BB"):
+        self.edges.pop(_edge_key(src, dst), None)
+
+    def items(self) -> Iterator[Tuple["BB", "BB", int]]:
+        endpoints = self.endpoints
+        for key, bits in self.edges.items():
+            yield endpoints[key >> _ID_BITS], endpoints[key & _ID_MASK], bits
+
+    def absorb(self, other: "ImplicationTable"):
+        """
+        Moves the implications of `other` (e.g. of an inlined callee) into this table
+        """
+        offset = len(self.bit_bbs)
+        if all(bb not in self.bit_of for bb in other.bit_bbs):
+            # Disjoint numberings: the bits of `other` just move up by the offset
+            for index, bb in enumerate(other.bit_bbs):
+                self.bit_of[bb] = offset + index
+            self.bit_bbs.extend(other.bit_bbs)
+            for key, bits in other.edges.items():
+                self.edges[key] = bits << offset
+        else:
+            for key, bits in other.edges.items():
+                self.edges[key] = self.to_bits(other.to_bbs(bits))
+        self.endpoints.update(other.endpoints)
+
+    def compact(self):
+        """
+        Renumbers only the BBs that some edge still implicates; the intersections
+        leave most of the BBs numbered by the node removal unused
+        """
+        used = 0
+        for bits in self.edges.values():
+            used |= bits
+        if used == (1 << len(self.bit_bbs)) - 1:
+            return
+        # old bit -> new bit
+        new_bit: Dict[int, int] = {}
+        old_bbs = self.bit_bbs
+        self.bit_bbs = []
+        self.bit_of = {}
+        while used:
+            low_bit = used & -used
+            new_bit[low_bit] = self.bit(old_bbs[low_bit.bit_length() - 1])
+            used ^= low_bit
+        edges = {}
+        endpoints = {}
+        for key, bits in self.edges.items():
+            new_bits = 0
+            while bits:
+                low_bit = bits & -bits
+                new_bits |= new_bit[low_bit]
+                bits ^= low_bit
+            edges[key] = new_bits
+            src_id = key >> _ID_BITS
+            dst_id = key & _ID_MASK
+            endpoints[src_id] = self.endpoints[src_id]
+            endpoints[dst_id] = self.endpoints[dst_id]
+        self.edges = edges
+        self.endpoints = endpoints
+
+    def __len__(self) -> int:
+        return len(self.edges)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Per-function preprocessing steps on a process pool.
+
+A function is shipped to a worker in a compact integer form (FuncPayload):
+its BBs are numbered in the order of Funcnode.get_bbs(), and the BBs outside of
+the function that appear in the edge implications get the numbers after them.
+The worker rebuilds lightweight Funcnode/BB objects whose addresses are those
+numbers, runs the very same CFGTransformer step on them, and sends back the
+surviving BBs and edges (FuncResult), which are merged into the real objects.
+"""
+from multiprocessing.pool import Pool
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from CFG_recover import BB, Funcnode
+from dominators import compute_idoms, compute_post_idoms
+from implications import ImplicationTable
+
+# (src, dst, implicated BBs) of an edge whose implication is not empty
+Implication = Tuple[int, int, List[int]]
+
+
+class FuncPayload(NamedTuple):
+    num_bbs: int
+    entry: int
+    succs: List[List[int]]
+    implications: List[Implication]
+    # Per-BB integer label; its meaning depends on the step
+    # (saved flag for the node removal, behavior class for the node merge)
+    labels: List[int]
+
+
+class FuncResult(NamedTuple):
+    kept: List[int]
+    # Successors of the kept BBs (same order as `kept`)
+    succs: List[List[int]]
+    implications: List[Implication]
+    operation_count: int
+
+
+def encode_func(func: Funcnode, labels: List[int]) -> Tuple[FuncPayload, List[BB]]:
+    """
+    Returns the payload and the table to map the numbers back to the BBs.
+    """
+    id_to_bb = func.get_bbs()
+    bb_to_id: Dict[BB, int] = {bb: i for i, bb in enumerate(id_to_bb)}
+
+    def get_id(bb: BB) -> int:
+        bb_id = bb_to_id.get(bb)
+        if bb_id is None:
+            bb_id = len(id_to_bb)
+            bb_to_id[bb] = bb_id
+            id_to_bb.append(bb)
+        return bb_id
+
+    num_bbs = len(id_to_bb)
+    succs = [[get_id(succ) for succ in bb.dst_bbs] for bb in id_to_bb]
+    implications: List[Implication] = []
+    if func.implications is not None:
+        table = func.implications
+        for src_bb, dst_bb, bits in table.items():
+            implications.append(
+                (
+                    bb_to_id[src_bb],
+                    get_id(dst_bb),
+                    [get_id(i) for i in table.to_bbs(bits)],
+                )
+            )
+    entry = bb_to_id[func.get_entry()]
+    return FuncPayload(num_bbs, entry, succs, implications, labels), id_to_bb
+
+
+def decode_func(payload: FuncPayload) -> Funcnode:
+    """
+    Worker side: lightweight Funcnode whose BB addresses are the BB numbers
+    """
+    func = Funcnode(payload.entry)
+    id_to_bb: Dict[int, BB] = {}
+
+    def get_bb(bb_id: int) -> BB:
+        bb = id_to_bb.get(bb_id)
+        if bb is None:
+            bb = id_to_bb[bb_id] = BB(bb_id, func)
+        return bb
+
+    for bb_id in range(payload.num_bbs):
+        func.register_bb(get_bb(bb_id))
+    for src, succs in enumerate(payload.succs):
+        id_to_bb[src].dst_bbs = {get_bb(dst) for dst in succs}
+    table = func.get_implications()
+    for src, dst, implicated in payload.implications:
+        table.set(id_to_bb[src], get_bb(dst), table.to_bits(map(get_bb, implicated)))
+    func.update_preds()
+    return func
+
+
+def encode_result(func: Funcnode, operation_count: int) -> FuncResult:
+    kept = [bb.start_addr for bb in func.get_bbs()]
+    succs: List[List[int]] = []
+    implications: List[Implication] = []
+    for bb in func.get_bbs():
+        succs.append([succ.start_addr for succ in bb.dst_bbs])
+    table = func.get_implications()
+    for src_bb, dst_bb, bits in table.items():
+        implications.append(
+            (
+                src_bb.start_addr,
+                dst_bb.start_addr,
+                [i.start_addr for i in table.to_bbs(bits)],
+            )
+        )
+    return FuncResult(kept, succs, implications, operation_count)
+
+
+def apply_result(func: Funcnode, result: FuncResult, id_to_bb: List[BB]) -> List[BB]:
+    """
+    Writes the worker result back into the real objects; returns the removed BBs.
+    """
+    kept_ids = set(result.kept)
+    removed = [bb for i, bb in enumerate(func.get_bbs()) if i not in kept_ids]
+    for bb in removed:
+        bb.dst_bbs = set()
+        bb.pred_bbs = set()
+
+    func.BBs = {}
+    for bb_id, succs in zip(result.kept, result.succs):
+        bb = id_to_bb[bb_id]
+        func.register_bb(bb)
+        bb.dst_bbs = {id_to_bb[dst] for dst in succs}
+    table = func.implications = ImplicationTable()
+    for src, dst, implicated in result.implications:
+        table.set(
+            id_to_bb[src],
+            id_to_bb[dst],
+            table.to_bits(id_to_bb[i] for i in implicated),
+        )
+    func.update_preds()
+    return removed
+
+
+def run_minimize(payload: FuncPayload) -> FuncResult:
+    # Import here; CFG_transform imports this module
+    from CFG_transform import CFGTransformer
+
+    func = decode_func(payload)
+    transformer = CFGTransformer(None)
+    bbs = func.get_bbs()
+    saved_bbs = {bbs[i] for i, saved in enumerate(payload.labels) if saved}
+    transformer.minimize_funcnode_cfg(func, saved_bbs)
+    return encode_result(func, transformer.operation_count)
+
+
+def run_merge(payload: FuncPayload) -> FuncResult:
+    from CFG_transform import CFGTransformer
+
+    class LabelTransformer(CFGTransformer):
+        # Behaviors are precomputed by the parent as the labels
+        def get_bb_behavior(self, bb, interesting_funcs):
+            return payload.labels[bb.start_addr]
+
+    func = decode_func(payload)
+    # The callees are not shipped; the parent updates their xrefs on merging back
+    transformer = LabelTransformer(None)
+    transformer.merge_duplicate_nodes(func, set())
+    return encode_result(func, transformer.operation_count)
+
+
+def run_idoms(succs: List[List[int]], entry: int) -> Tuple[List[int], List[int]]:
+    return compute_idoms(succs, entry), compute_post_idoms(succs)
+
+
+def _call_star(args: Tuple[Callable, int, tuple]):
+    worker, idx, worker_args = args
+    return idx, worker(*worker_args)
+
+
+class PreprocessPool:
+    """
+    Process pool for the per-function steps; runs serially if processes <= 1.
+    Use as a context manager so that the workers are joined.
+    """
+
+    def __init__(self, processes: int = 1):
+        self.processes = processes
+        self.pool: Optional[Pool] = Pool(processes) if processes > 1 else None
+
+    def map(self, worker: Callable, args_list: Sequence[tuple]) -> List:
+        """
+        worker(*args) for every args in args_list; the results are in order
+        """
+        if self.pool is None or len(args_list) <= 1:
+            return [worker(*args) for args in args_list]
+        results: List = [None] * len(args_list)
+        # A few chunks per process amortize the IPC while keeping the load balanced
+        chunksize = max(1, len(args_list) // (self.processes * 4))
+        tasks = [(worker, idx, args) for idx, args in enumerate(args_list)]
+        for idx, result in self.pool.imap_unordered(
+            _call_star, tasks, chunksize=chunksize
+        ):
+            results[idx] = result
+        return results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self) -> "PreprocessPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Coarsest stable partition (bisimulation) of a graph with labeled nodes, by the
+relational partition refinement of Paige and Tarjan ("Three Partition Refinement
+Algorithms"), O(E log V).
+
+Two nodes end up in the same block iff they have the same label and, for every
+block, either both or neither of them has a successor in it; i.e. the sets of
+blocks of their successors are equal.
+"""
+from typing import Dict, Hashable, List, Sequence, Set
+
+
+class _Refinement:
+    def __init__(self, labels: Sequence[Hashable], succs: Sequence[Sequence[int]]):
+        num_nodes = len(succs)
+        self.preds: List[List[int]] = [[] for _ in range(num_nodes)]
+        for v, vsuccs in enumerate(succs):
+            for w in vsuccs:
+                self.preds[w].append(v)
+
+        # Blocks of the partition Q
+        self.block_of: List[int] = [0] * num_nodes
+        self.blocks: List[Set[int]] = []
+        label_to_block: Dict[Hashable, int] = {}
+        for v, label in enumerate(labels):
+            block = label_to_block.get(label)
+            if block is None:
+                block = label_to_block[label] = len(self.blocks)
+                self.blocks.append(set())
+            self.block_of[v] = block
+            self.blocks[block].add(v)
+
+        # Compound blocks X: unions of blocks; Q is stable w.r.t. every one of them
+        self.xblock_of: List[int] = [0] * len(self.blocks)
+        self.xblocks: List[List[int]] = [list(range(len(self.blocks)))]
+        self.compound: Set[int] = {0} if len(self.blocks) > 1 else set()
+        # count[(v, S)]: number of successors of v in the compound block S
+        self.count: Dict[tuple, int] = {}
+        for v, vsuccs in enumerate(succs):
+            if vsuccs:
+                self.count[(v, 0)] = len(vsuccs)
+
+        # Stable w.r.t. the single compound block: with or without successors
+        self.split({v for v, vsuccs in enumerate(succs) if vsuccs})
+
+    def split(self, marked: Set[int]):
+        """
+        Splits every block into its nodes in `marked` and the others
+        """
+        marked_in_block: Dict[int, List[int]] = {}
+        for v in marked:
+            marked_in_block.setdefault(self.block_of[v], []).append(v)
+        for block, nodes in marked_in_block.items():
+            if len(nodes) == len(self.blocks[block]):
+                continue
+            new_block = len(self.blocks)
+            self.blocks[block].difference_update(nodes)
+            self.blocks.append(set(nodes))
+            for v in nodes:
+                self.block_of[v] = new_block
+            xblock = self.xblock_of[block]
+            self.xblock_of.append(xblock)
+            self.xblocks[xblock].append(new_block)
+            self.compound.add(xblock)
+
+    def refine(self):
+        while self.compound:
+            xblock = self.compound.pop()
+            members = self.xblocks[xblock]
+            # B: the smaller of two blocks of S, so a node is in B O(log V) times
+            if len(self.blocks[members[-1]]) <= len(self.blocks[members[-2]]):
+                splitter = members.pop()
+            else:
+                splitter = members.pop(-2)
+            if len(members) > 1:
+                self.compound.add(xblock)
+            new_xblock = len(self.xblocks)
+            self.xblocks.append([splitter])
+            self.xblock_of[splitter] = new_xblock
+
+            # Predecessors of B, with their number of successors in B
+            count_in_splitter: Dict[int, int] = {}
+            for w in self.blocks[splitter]:
+                for v in self.preds[w]:
+                    count_in_splitter[v] = count_in_splitter.get(v, 0) + 1
+
+            # Split by "has a successor in B", then by "has no successor in S - B"
+            self.split(set(count_in_splitter))
+            self.split(
+                {
+                    v
+                    for v, num in count_in_splitter.items()
+                    if num == self.count[(v, xblock)]
+                }
+            )
+
+            for v, num in count_in_splitter.items():
+                remaining = self.count[(v, xblock)] - num
+                if remaining:
+                    self.count[(v, xblock)] = remaining
+                else:
+                    del self.count[(v, xblock)]
+                self.count[(v, new_xblock)] = num
+
+
+def coarsest_stable_partition(
+    labels: Sequence[Hashable], succs: Sequence[Sequence[int]]
+) -> List[List[int]]:
+    """
+    Blocks of the coarsest partition of the nodes 0..len(succs)-1 that is
+    compatible with `labels` and stable w.r.t. the edges `succs`.
+    Each block is in increasing order, and the blocks are ordered by their first node.
+    """
+    refinement = _Refinement(labels, succs)
+    refinement.refine()
+    blocks = [sorted(block) for block in refinement.blocks]
+    blocks.sort()
+    return blocks
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded dedup of the PUT responses: the estimator skips the inference of a
+response the fuzzer sent before, and repeats its coverage instead.
+
+The responses are hashed to 64 bits (xxh3 if xxhash is installed, else the
+built-in hash of bytes) and the hashes kept in a fixed-size table of 4-slot
+buckets, indexed by the low bits of the hash. A new hash goes to the front of
+its bucket; when the bucket is full, the oldest one falls off, and a hash found
+again moves one slot forward, so that the responses seen often stay. The memory
+is 8 bytes * FUZZ_DEDUP_SLOTS whatever the length of the campaign.
+
+Forgetting a response only costs its inference again. A false positive (a new
+response taken for a duplicate) needs its hash to equal one of the 4 in its
+bucket, which already share log2(slots / 4) bits: about slots / 2**64 per
+lookup, 5.7e-14 with the default 2**20 slots. A Bloom filter of the same size
+would not forget, and its false positive rate would grow with the campaign.
+"""
+import os
+import sys
+from array import array
+from typing import Optional
+
+try:
+    import xxhash
+except ImportError:  # Not installed: the built-in hash
+    xxhash = None
+
+BUCKET_SLOTS = 4
+DEFAULT_SLOTS = 1 << 20
+
+if xxhash is not None:
+    HASH_NAME = "xxh3_64"
+
+    def response_hash(data: bytes) -> int:
+        return xxhash.xxh3_64_intdigest(data)
+
+else:
+    # The hash of bytes (siphash); its seed changes per process, which does
+    # not matter to a table that is never saved
+    HASH_NAME = f"{sys.hash_info.algorithm}_{sys.hash_info.width}"
+
+    def response_hash(data: bytes) -> int:
+        return hash(data) & 0xFFFFFFFFFFFFFFFF
+
+
+class ResponseDedup:
+    def __init__(self, slots: int = DEFAULT_SLOTS):
+        buckets = 1
+        while buckets * BUCKET_SLOTS < slots:
+            buckets *= 2
+        self.bucket_mask = buckets - 1
+        # 0 is an empty slot
+        self.table = array("Q", bytes(8 * buckets * BUCKET_SLOTS))
+        self.lookups = 0
+        self.duplicates = 0
+        self.evictions = 0
+
+    def seen(self, data: bytes) -> bool:
+        """
+        Whether data was seen before (and not forgotten since); if not, it is
+        remembered
+        """
+        self.lookups += 1
+        key = response_hash(data) or 1
+        table = self.table
+        base = (key & self.bucket_mask) * BUCKET_SLOTS
+        bucket = table[base : base + BUCKET_SLOTS]
+        if key in bucket:
+            i = base + bucket.index(key)
+            if i > base:
+                table[i - 1], table[i] = key, table[i - 1]
+            self.duplicates += 1
+            return True
+        if bucket[-1]:
+            self.evictions += 1
+        table[base + 1 : base + BUCKET_SLOTS] = bucket[:-1]
+        table[base] = key
+        return False
+
+    def used(self) -> int:
+        return len(self.table) - self.table.count(0)
+
+    def stats(self):
+        return {
+            "hash": HASH_NAME,
+            "slots": len(self.table),
+            "used": self.used(),
+            "lookups": self.lookups,
+            "duplicates": self.duplicates,
+            "evictions": self.evictions,
+        }
+
+
+# FUZZ_DEDUP_SLOTS=<n> sizes the table of each fuzzer; 0 disables the dedup
+def read_dedup_slots() -> int:
+    return int(os.environ.get("FUZZ_DEDUP_SLOTS", str(DEFAULT_SLOTS)))
+
+
+def make_dedup() -> Optional[ResponseDedup]:
+    slots = read_dedup_slots()
+    return ResponseDedup(slots) if slots > 0 else None
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot of the fully preprocessed static analysis result.
+
+Loading + CFGTransformer.run_all_passes + build_dominators + the function distances
++ the BBMatcher tables are the same on every start for the same target, so the
+result is pickled once under a key made of
+    - the content of the static analysis files that the loader reads,
+    - the source code of this directory (any edit invalidates every snapshot),
+    - the options that change the result (e.g. lazy function distances).
+The file name starts with the interpreter and the options (the variant), so that
+e.g. the fuzz server under PyPy and try_estimate.py under CPython each keep theirs.
+
+The CFG is a deeply linked object graph; pickling it as is recurses along the
+paths of the CFG and overflows the stack. Instead, every Funcnode/BB/XREF is
+first written as an empty object, and their slots follow afterwards in flat batches.
+"""
+import copyreg
+import gc
+import hashlib
+import logging
+import os
+import pickle
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+from bb_match import BBMatcher
+from CFG_recover import CFG, BB, Funcnode, XREF
+from CFG_transform import CFGTransformer
+from cfg_binary import BINARY_FILE_NAME
+import bz_common as bzc
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_DIR_NAME = "snapshot"
+TEXT_INPUT_FILES = ["pickle_analysis.bin", "CFG_analysis.txt", "edge.txt", "vertex.txt"]
+
+# Objects of the CFG graph, written as empty objects followed by their slots
+_GRAPH_CLASSES = {Funcnode, BB, XREF}
+
+
+class Preprocessed(NamedTuple):
+    cfg: CFG
+    vertex_idx_map: Dict[int, int]
+    matcher: BBMatcher
+
+
+def preprocess_static_analysis(
+    stat_dir: str, processes: int = 1, lazy_cache_size: Optional[int] = None
+) -> Preprocessed:
+    """
+    The preprocessing pipeline without the snapshot
+    """
+    cfg, _, vertex_idx_map = bzc.load_static_analysis_result(stat_dir, pruned=True)
+    transformer = CFGTransformer(cfg, processes)
+    transformer.run_all_passes(cfg)
+    cfg.build_dominators(processes)
+    if lazy_cache_size is None:
+        cfg.build_func_distance_map(processes)
+    else:
+        cfg.build_lazy_func_distance_map(lazy_cache_size)
+    cfg.freeze()
+    return Preprocessed(cfg, vertex_idx_map, BBMatcher(cfg))
+
+
+def _hash_file(hasher, path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            hasher.update(chunk)
+
+
+def get_input_files(stat_dir: str) -> List[str]:
+    """
+    The files that bz_common.load_static_analysis_result reads
+    """
+    binary_path = os.path.join(stat_dir, BINARY_FILE_NAME)
+    if os.path.exists(binary_path):
+        return [binary_path]
+    return [os.path.join(stat_dir, name) for name in TEXT_INPUT_FILES]
+
+
+def get_code_version() -> str:
+    hasher = hashlib.sha256()
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(src_dir)):
+        if name.endswith(".py"):
+            hasher.update(name.encode())
+            _hash_file(hasher, os.path.join(src_dir, name))
+    return hasher.hexdigest()
+
+
+def get_snapshot_variant(lazy_cache_size: Optional[int] = None) -> str:
+    """
+    The part of the key that two runs on the same inputs may differ in
+    """
+    lazy = "full" if lazy_cache_size is None else f"lazy{lazy_cache_size}"
+    return f"{sys.implementation.cache_tag}.{lazy}"
+
+
+def get_snapshot_key(stat_dir: str, lazy_cache_size: Optional[int] = None) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(f"{SNAPSHOT_FORMAT} {sys.implementation.cache_tag}".encode())
+    hasher.update(get_code_version().encode())
+    hasher.update(f"lazy_func_distance={lazy_cache_size}".encode())
+    for path in get_input_files(stat_dir):
+        hasher.update(os.path.basename(path).encode())
+        _hash_file(hasher, path)
+    return hasher.hexdigest()
+
+
+class _SnapshotPickler(pickle.Pickler):
+    def __init__(self, file):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.objects: List[object] = []
+
+    def reducer_override(self, obj):
+        cls = type(obj)
+        if cls not in _GRAPH_CLASSES:
+            return NotImplemented
+        # An empty object; the pickler memoizes it, so any later reference is a
+        # memo lookup and the slots are written by dump_all
+        self.objects.append(obj)
+        return copyreg.__newobj__, (cls,)
+
+    def dump_all(self, payload):
+        self.dump((SNAPSHOT_FORMAT, payload))
+        # Slots of the graph objects; they may refer to objects not seen yet,
+        # which are appended to self.objects and written by the next batch
+        done = 0
+        while done < len(self.objects):
+            batch = self.objects[done:]
+            done = len(self.objects)
+            self.dump([_SlotsOf(obj) for obj in batch])
+        self.dump(None)
+
+
+def _same(obj):
+    return obj
+
+
+class _SlotsOf:
+    """
+    Pickled as "the (already memoized) object + BUILD with its slots", so the
+    unpickler sets the slots in C
+    """
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __reduce__(self):
+        return _same, (self.obj,), (None, _get_slots(self.obj))
+
+
+def _load_all(file):
+    unpickler = pickle.Unpickler(file)
+    snapshot_format, payload = unpickler.load()
+    if snapshot_format != SNAPSHOT_FORMAT:
+        raise ValueError(f"snapshot format {snapshot_format}")
+    while unpickler.load() is not None:
+        pass
+    return payload
+
+
+def _get_slots(obj) -> Dict[str, object]:
+    return {
+        name: getattr(obj, name) for name in type(obj).__slots__ if hasattr(obj, name)
+    }
+
+
+def save_snapshot(path: str, preprocessed: Preprocessed):
+    # Written next to the final path and renamed, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(tmp_path, "wb") as f:
+            _SnapshotPickler(f).dump_all(tuple(preprocessed))
+        os.replace(tmp_path, path)
+    finally:
+        if gc_enabled:
+            gc.enable()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_snapshot(path: str) -> Preprocessed:
+    # The cyclic GC would repeatedly scan the millions of new objects while loading
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, "rb") as f:
+            return Preprocessed(*_load_all(f))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def remove_stale_snapshots(snapshot_dir: str, variant: str, keep_path: str):
+    """
+    The other snapshots of the same variant are for older inputs or code; they
+    are never hit again. Those of other interpreters or options are kept.
+    """
+    for name in os.listdir(snapshot_dir):
+        path = os.path.join(snapshot_dir, name)
+        if (
+            name.startswith(f"{variant}.")
+            and name.endswith(".pickle")
+            and path != keep_path
+        ):
+            os.remove(path)
+
+
+def load_preprocessed(
+    stat_dir: str,
+    processes: int = 1,
+    lazy_cache_size: Optional[int] = None,
+    rebuild: bool = False,
+    snapshot_dir: Optional[str] = None,
+) -> Preprocessed:
+    """
+    preprocess_static_analysis() through the snapshot in `snapshot_dir`
+    (<stat_dir>/snapshot by default). `rebuild` ignores an existing snapshot.
+    A snapshot that cannot be loaded or written only costs the preprocessing.
+    """
+    if snapshot_dir is None:
+        snapshot_dir = os.path.join(stat_dir, SNAPSHOT_DIR_NAME)
+    variant = get_snapshot_variant(lazy_cache_size)
+    key = get_snapshot_key(stat_dir, lazy_cache_size)
+    path = os.path.join(snapshot_dir, f"{variant}.{key}.pickle")
+
+    if not rebuild and os.path.exists(path):
+        try:
+            preprocessed = load_snapshot(path)
+            logging.info(f"Loaded the preprocessing snapshot {path}")
+            return preprocessed
+        except Exception as e:
+            logging.warning(f"Broken preprocessing snapshot {path}: {e}")
+
+    preprocessed = preprocess_static_analysis(stat_dir, processes, lazy_cache_size)
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        save_snapshot(path, preprocessed)
+        logging.info(f"Saved the preprocessing snapshot {path}")
+        remove_stale_snapshots(snapshot_dir, variant, path)
+    except OSError as e:
+        logging.warning(f"Cannot save the preprocessing snapshot {path}: {e}")
+    return preprocessed
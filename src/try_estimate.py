@@ -8,7 +8,7 @@ import time
 from collections import defaultdict
 from bb_match import BBMatcher, RegexMatcher, augment_must_bbs, aggressive_augment
 from CFG_recover import BB
-from CFG_transform import CFGTransformer
+from snapshot import load_preprocessed
 from typing import Set
 
 
@@ -136,18 +136,17 @@ def main():
         action="store_true",
         help="Run the fuzzing script with Pin",
     )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Ignore the preprocessing snapshot and build it again",
+    )
     args = parser.parse_args()
 
     bzc.setup_logging(False)
     setup_environment(args.input, args.static_analysis, args.stderr)
     # if inputt has the form .../responses/*.txt, then we read the .../edges/*.txt
-    put_cfg, _, _ = bzc.load_static_analysis_result(args.static_analysis)
-    transformer = CFGTransformer(put_cfg)
-    transformer.run_all_passes(put_cfg)
-    put_cfg.build_dominators()
-    put_cfg.build_func_distance_map()
-
-    matcher = BBMatcher(put_cfg)
+    put_cfg, _, matcher = load_preprocessed(args.static_analysis, rebuild=args.rebuild)
     rg_matcher = RegexMatcher(put_cfg)
 
     with open(args.input, "rb") as f:
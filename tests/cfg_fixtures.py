@@ -0,0 +1,207 @@
+"""
+Fixtures shared by the tests: static analysis results, CFGs and call graphs
+"""
+import json
+import os
+import pickle
+import random
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import CFG, BB, Funcnode, XREF  # noqa: E402
+from graph_algo import CallGraph  # noqa: E402
+
+
+def write_ghidra_result(stat_dir: str, num_funcs: int, seed: int):
+    """
+    Random result in the format of ghidra/static_analysis_by_ghidra.py
+    """
+    rng = random.Random(seed)
+    funcnode_dict = {}
+    func_addrs = [0x10000 * (i + 1) for i in range(num_funcs)]
+    for func_addr in func_addrs:
+        bb_addrs = [func_addr + k * 0x10 for k in range(rng.randrange(1, 8))]
+        bbs = {}
+        for k, bb_addr in enumerate(bb_addrs):
+            dsts = set(rng.sample(bb_addrs, min(len(bb_addrs), rng.randrange(0, 3))))
+            calls = {rng.choice(func_addrs)} if rng.random() < 0.3 else set()
+            bbs[bb_addr] = {
+                "dst_bbs": list(dsts),
+                "call_func": list(calls),
+                "xrefs": [],
+                "end_addr": bb_addr + 0xF,
+                "parent_funcnode": func_addr,
+            }
+        funcnode_dict[func_addr] = {"call_func": [], "BBs": bbs, "xrefs": []}
+    ghidra_cfg = CFG()
+    for i in range(num_funcs // 2):
+        literal = f"literal {i}".encode()
+        xref = ghidra_cfg.string_xref[literal] = XREF(literal)
+        for _ in range(rng.randrange(1, 3)):
+            func_addr = rng.choice(func_addrs)
+            xref.funcnodes.add(func_addr)
+            xref.bbs.add(rng.choice(list(funcnode_dict[func_addr]["BBs"])))
+    with open(os.path.join(stat_dir, "CFG_analysis.txt"), "w") as f:
+        json.dump(funcnode_dict, f)
+    with open(os.path.join(stat_dir, "pickle_analysis.bin"), "wb") as f:
+        pickle.dump(ghidra_cfg, f)
+    for name in ("edge.txt", "vertex.txt"):
+        open(os.path.join(stat_dir, name), "w").close()
+
+
+def dump_cfg(
+    cfg: CFG,
+    ids: bool = True,
+    implications: bool = False,
+    dropped_funcs: bool = False,
+):
+    """
+    Comparable form of an object CFG. `ids` keeps the BB and function ids (they
+    differ between CFGs built separately), `implications` adds the BBs implicated
+    by each edge. With `dropped_funcs`, the CFG can be compared with one that
+    still has the functions it dropped: the calls to them are left out.
+    """
+    funcs = set(cfg.get_funcs())
+
+    def live(callees):
+        return sorted(f.addr for f in callees if not dropped_funcs or f in funcs)
+
+    bbs = {}
+    for func in funcs:
+        for bb in func.get_bbs():
+            bbs[bb.start_addr] = (
+                bb.id if ids else None,
+                bb.end_addr,
+                bb.parent_funcnode.addr,
+                sorted(succ.start_addr for succ in bb.dst_bbs),
+                sorted(pred.start_addr for pred in bb.pred_bbs),
+                live(bb.call_func),
+                sorted(xref.literal for xref in bb.xrefs),
+            )
+            if implications:
+                bbs[bb.start_addr] += (
+                    {
+                        dst.start_addr: sorted(
+                            i.start_addr for i in func.get_implicated_bbs(bb, dst)
+                        )
+                        for dst in bb.dst_bbs
+                        if func.get_implicated_bbs(bb, dst)
+                    },
+                )
+    func_dump = {
+        func.addr: (
+            func.id if ids else None,
+            live(func.call_func),
+            sorted(bb.start_addr for bb in func.xrefs),
+        )
+        for func in funcs
+    }
+    xrefs = {
+        literal: (
+            sorted(bb.start_addr for bb in xref.bbs),
+            sorted(xref.funcnodes),
+            sorted(xref.ro_addrs),
+        )
+        for literal, xref in cfg.string_xref.items()
+    }
+    return bbs, func_dump, xrefs
+
+
+def make_cfg(
+    num_funcs: int,
+    seed: int,
+    min_bbs: int = 2,
+    max_bbs: int = 16,
+    back_edge_rate: float = 0.15,
+    max_calls: int = 2,
+    single_callee_sites: bool = False,
+    literal_rate: float = 0.2,
+    num_literals: int = 8,
+    implication_rate: float = 0.0,
+) -> CFG:
+    """
+    Random functions with branches and back edges, calls going mostly downwards,
+    and string literals (some shared) on a few BBs. By default every function
+    makes `max_calls` calls from any of its BBs; with `single_callee_sites`, up
+    to `max_calls` calls from distinct BBs other than the entry (so the inliner
+    result does not depend on the iteration order of call_func). Each edge has
+    implications (of two BBs) with a probability of `implication_rate`.
+    """
+    rng = random.Random(seed)
+    cfg = CFG()
+    funcs = []
+    for i in range(num_funcs):
+        func = Funcnode(0x10000 * (i + 1))
+        cfg.funcnode_dict[func.addr] = func
+        num_bbs = rng.randrange(min_bbs, max_bbs)
+        for k in range(num_bbs):
+            func.register_bb(BB(func.addr + k * 0x10, func))
+        bbs = func.get_bbs()
+        for k, bb in enumerate(bbs[:-1]):
+            bb.dst_bbs.add(bbs[k + 1])
+            if rng.random() < 0.4:
+                bb.dst_bbs.add(bbs[rng.randrange(k + 1, num_bbs)])
+            if k > 0 and rng.random() < back_edge_rate:
+                bb.dst_bbs.add(bbs[rng.randrange(1, k + 1)])
+        funcs.append(func)
+    for i, caller in enumerate(funcs):
+        if single_callee_sites:
+            free_bbs = caller.get_bbs()[1:]
+            rng.shuffle(free_bbs)
+            num_calls = min(len(free_bbs), rng.randrange(0, max_calls + 1))
+        else:
+            num_calls = max_calls
+        for _ in range(num_calls):
+            callee = funcs[rng.randrange(i, num_funcs)]
+            if single_callee_sites:
+                call_site = free_bbs.pop()
+            else:
+                call_site = rng.choice(caller.get_bbs())
+            call_site.call_func.add(callee)
+            caller.call_func.add(callee)
+            callee.xrefs.add(call_site)
+    for func in funcs:
+        for bb in func.get_bbs():
+            if rng.random() < literal_rate:
+                literal = f"message {rng.randrange(0, num_literals)}".encode()
+                xref = cfg.string_xref.setdefault(literal, XREF(literal))
+                xref.bbs.add(bb)
+                bb.xrefs.add(xref)
+    if implication_rate:
+        for func in funcs:
+            bbs = func.get_bbs()
+            table = func.get_implications()
+            for bb in bbs:
+                for dst in sorted(bb.dst_bbs, key=lambda dst: dst.start_addr):
+                    if rng.random() < implication_rate:
+                        table.set(bb, dst, table.to_bits(rng.sample(bbs, 2)))
+    return cfg
+
+
+def dump_sccs(cg: CallGraph):
+    """
+    SCCs and DAG edges as sets of function addresses; checks scc_preds and the order
+    """
+    live_sccs = [scc for scc in range(cg.scc_count) if cg.scc_funcidx_map[scc]]
+    assert sorted(cg.reverse_topological_sort()) == live_sccs
+    funcs_of = {
+        scc: frozenset(cg.idx_to_func[v].addr for v in cg.scc_funcidx_map[scc])
+        for scc in live_sccs
+    }
+    dag = set()
+    for scc in live_sccs:
+        assert len(set(cg.scc_dag[scc])) == len(cg.scc_dag[scc])
+        for succ in cg.scc_dag[scc]:
+            assert scc in cg.scc_preds[succ]
+            assert cg.scc_pos[succ] < cg.scc_pos[scc]
+            dag.add((funcs_of[scc], funcs_of[succ]))
+        for pred in cg.scc_preds[scc]:
+            assert scc in cg.scc_dag[pred]
+    calls = {
+        (cg.idx_to_func[v].addr, cg.idx_to_func[w].addr)
+        for v in range(cg.num_vertices)
+        if not cg.removed[v]
+        for w in cg.adj[v]
+    }
+    return set(funcs_of.values()), dag, calls
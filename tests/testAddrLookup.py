@@ -0,0 +1,102 @@
+import os
+import random
+import tempfile
+import unittest
+import sys
+from array import array
+from unittest import mock
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+import cfg_arrays  # noqa: E402
+from CFG_recover import Funcnode, BB, AddrToBBLookup  # noqa: E402
+from cfg_arrays import CFGArrays  # noqa: E402
+from cfg_fixtures import write_ghidra_result  # noqa: E402
+import bz_common as bzc  # noqa: E402
+
+
+def make_lookup(seed: int):
+    rng = random.Random(seed)
+    func = Funcnode(0x1000)
+    bbs = set()
+    addr = 0x1000
+    for _ in range(200):
+        bb = BB(addr, func)
+        size = rng.randrange(1, 0x20)
+        # Unknown end, and gaps between the BBs
+        bb.end_addr = None if rng.random() < 0.1 else addr + size
+        bbs.add(bb)
+        addr += size + 1 + rng.choice([0, 0, 0x10])
+    return AddrToBBLookup(bbs), addr
+
+
+def naive_lookup(bbs, addr):
+    for bb in bbs:
+        if bb.end_addr and bb.start_addr <= addr <= bb.end_addr:
+            return bb
+    return None
+
+
+class testAddrLookup(unittest.TestCase):
+    def check_lookup_many(self):
+        for seed in range(5):
+            lookup, max_addr = make_lookup(seed)
+            rng = random.Random(seed)
+            addrs = [rng.randrange(0, max_addr + 0x40) for _ in range(500)]
+            addrs += [0, 2**64 - 1, 0x1000]
+            expected = [naive_lookup(lookup.sorted_bbs, addr) for addr in addrs]
+            self.assertEqual([lookup(addr) for addr in addrs], expected)
+            self.assertEqual(lookup.lookup_many(addrs), expected)
+            self.assertEqual(
+                lookup.lookup_unique(addrs), {bb for bb in expected if bb is not None}
+            )
+
+    def test_lookup_many(self):
+        self.check_lookup_many()
+
+    def test_lookup_many_without_numpy(self):
+        with mock.patch.object(cfg_arrays, "np", None):
+            self.check_lookup_many()
+
+    def check_convert_edges(self, stat_dir):
+        cfg, _, _ = bzc.load_static_analysis_result(stat_dir)
+        arrays = CFGArrays.from_static_analysis(stat_dir)
+        bbs = [bb for func in cfg.get_funcs() for bb in func.get_bbs()]
+        rng = random.Random(0)
+        edges = []
+        for _ in range(300):
+            src, dst = rng.choice(bbs), rng.choice(bbs)
+            edges.append((src.start_addr + rng.randrange(0, 0x20), dst.start_addr))
+        edges.append((0x10, 0x20))
+        expected = set()
+        for src_addr, dst_addr in edges:
+            for addr in (src_addr, dst_addr):
+                bb = naive_lookup(bbs, addr)
+                if bb is not None:
+                    expected.add(bb)
+        flat = array("Q", [addr for edge in edges for addr in edge])
+        forms = [edges, flat]
+        if cfg_arrays.np is not None:
+            forms.append(cfg_arrays.np.array(edges, dtype=cfg_arrays.np.uint64))
+        for form in forms:
+            self.assertEqual(cfg.convert_edges_to_BBs(form), expected)
+            self.assertEqual(
+                {bb.start_addr for bb in arrays.convert_edges_to_BBs(form)},
+                {bb.start_addr for bb in expected},
+            )
+        addrs = [addr for edge in edges for addr in edge]
+        self.assertEqual(
+            arrays.lookup_bb_ids(addrs), [arrays.lookup_bb_id(addr) for addr in addrs]
+        )
+        self.assertEqual(cfg.convert_edges_to_BBs([]), set())
+
+    def test_convert_edges(self):
+        with tempfile.TemporaryDirectory() as stat_dir:
+            write_ghidra_result(stat_dir, 40, 0)
+            self.check_convert_edges(stat_dir)
+            with mock.patch.object(cfg_arrays, "np", None):
+                self.check_convert_edges(stat_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+import ctypes
+import os
+import select
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from async_server import (  # noqa: E402
+    DOORBELL_ACK,
+    EVENTFD_VALUE,
+    RESULT_LENGTH,
+    AsyncServer,
+    LatencyHistogram,
+    StreamChannel,
+)
+from fuzz_transport import (  # noqa: E402
+    DELTA_HEADER,
+    HELLO_LENGTH,
+    HELLO_OK,
+    PIPE_ACK,
+    PIPE_MESSAGE,
+    PIPE_REQUEST,
+    DeltaCoverage,
+    MemfdResponse,
+    Session,
+    listen_unix,
+    read_exact,
+    send_hello,
+)
+
+SLOW_SECONDS = 0.5
+
+
+def infer(whole_bytes: bytes, start: float):
+    """
+    Runs on the pool: one vertex per byte value
+    """
+    if whole_bytes.startswith(b"slow"):
+        time.sleep(SLOW_SECONDS)
+    return sorted(set(whole_bytes)), b"DONE"
+
+
+def is_duplicate(session: Session, whole_bytes: bytes) -> bool:
+    if session.dedup.seen(whole_bytes):
+        session.coverage.repeat()
+        return True
+    return False
+
+
+def account(addr_list, session: Session):
+    session.coverage.write(addr_list)
+
+
+def eventfd() -> int:
+    # os.eventfd is Python 3.10+
+    if hasattr(os, "eventfd"):
+        return os.eventfd(0)
+    libc = ctypes.CDLL(None, use_errno=True)
+    fd = libc.eventfd(0, 0)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "eventfd")
+    return fd
+
+
+def decode(payload: bytes):
+    _, count = DELTA_HEADER.unpack_from(payload)
+    return sorted(struct.unpack_from(f"={count}I", payload, DELTA_HEADER.size))
+
+
+class Fuzzer:
+    def __init__(self):
+        self.fds = (os.memfd_create("stdout"), os.memfd_create("stderr"))
+
+    def respond(self, response: bytes):
+        os.ftruncate(self.fds[0], 0)
+        os.pwrite(self.fds[0], response, 0)
+
+    def read_result(self, fd: int):
+        token = read_exact(fd, 4)
+        header = read_exact(fd, DELTA_HEADER.size)
+        _, count = DELTA_HEADER.unpack(header)
+        return token, decode(header + (read_exact(fd, 4 * count) if count else b""))
+
+
+class testAsyncServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.finished = []
+        self.server = AsyncServer(
+            infer,
+            is_duplicate,
+            b"DUPL",
+            account,
+            lambda session: self.finished.append(session.fuzz_out_dir),
+            5000,
+            2,
+            os.path.join(self.tmp_dir.name, "async_stats.txt"),
+        )
+        # Before any fd of the fuzzers is open: the workers would keep them open
+        self.server.start_workers()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_session(self, fuzzer: Fuzzer, name: str) -> Session:
+        # The server closes the memfds with the session
+        fds = tuple(os.dup(fd) for fd in fuzzer.fds)
+        return Session(name, MemfdResponse(fds), DeltaCoverage())
+
+    def make_pipe_channel(self, name: str, depth: int):
+        fuzzer = Fuzzer()
+        request_r, request_w = os.pipe()
+        result_r, result_w = os.pipe()
+        channel = StreamChannel(
+            name, self.make_session(fuzzer, name), request_r, result_w, depth
+        )
+        return fuzzer, channel, request_w, result_r
+
+    def start(self, channels, listener=None) -> threading.Thread:
+        thread = threading.Thread(target=self.server.run, args=(channels, listener))
+        thread.start()
+        return thread
+
+    def test_slow_channel_does_not_block(self):
+        slow, slow_channel, slow_w, slow_r = self.make_pipe_channel("slow", 0)
+        fast, fast_channel, fast_w, fast_r = self.make_pipe_channel("fast", 2)
+        thread = self.start([slow_channel, fast_channel])
+
+        slow.respond(b"slow")
+        os.write(slow_w, b"HOW\n")
+        start = time.perf_counter()
+        results = []
+        for request_id, response in enumerate([b"ab", b"bc", b"ab"]):
+            fast.respond(response)
+            os.write(fast_w, PIPE_MESSAGE.pack(PIPE_REQUEST, request_id))
+            while True:
+                tag, i = PIPE_MESSAGE.unpack(read_exact(fast_r, PIPE_MESSAGE.size))
+                if tag == PIPE_ACK:
+                    self.assertEqual(i, request_id)
+                    break
+                results.append((tag, i, self.read_delta(fast_r)))
+        while len(results) < 3:
+            tag, i = PIPE_MESSAGE.unpack(read_exact(fast_r, PIPE_MESSAGE.size))
+            results.append((tag, i, self.read_delta(fast_r)))
+        # While the slow request is still inferred
+        self.assertLess(time.perf_counter() - start, SLOW_SECONDS)
+        self.assertEqual(select.select([slow_r], [], [], 0)[0], [])
+        self.assertEqual(
+            results,
+            [(b"DONE", 0, [97, 98]), (b"DONE", 1, [99]), (b"DUPL", 2, [])],
+        )
+        self.assertEqual(slow.read_result(slow_r), (b"DONE", sorted(set(b"slow"))))
+
+        for fd in (slow_w, fast_w):
+            os.close(fd)
+        thread.join()
+        for fd in (slow_r, fast_r):
+            os.close(fd)
+        self.assertEqual(sorted(self.finished), ["fast", "slow"])
+        with open(self.server.stats_path) as f:
+            stats = f.read().splitlines()
+        self.assertTrue(stats[0].startswith("slow: requests 1, depth max 1"))
+        self.assertTrue(stats[1].startswith("fast: requests 3"))
+        self.assertLessEqual(int(stats[1].split("depth max ")[1].split()[0]), 2)
+        self.assertTrue(stats[2].startswith("all: requests 4"))
+
+    def read_delta(self, fd: int):
+        header = read_exact(fd, DELTA_HEADER.size)
+        _, count = DELTA_HEADER.unpack(header)
+        return decode(header + (read_exact(fd, 4 * count) if count else b""))
+
+    def test_socket_and_doorbell(self):
+        socket_path = os.path.join(self.tmp_dir.name, "async.sock")
+        thread = self.start([], listen_unix(socket_path))
+
+        def connect(fuzzer: Fuzzer, out_dir: str, names: str, fds):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(socket_path)
+            hello = {"out_dir": out_dir, "coverage": "delta", "fds": names}
+            send_hello(sock, hello, list(fuzzer.fds) + fds)
+            self.assertEqual(sock.recv(4), HELLO_OK)
+            return sock
+
+        stream = Fuzzer()
+        stream_sock = connect(stream, "stream", "stdout,stderr", [])
+        doorbell = Fuzzer()
+        request_fd = eventfd()
+        result_fd = eventfd()
+        area_fd = os.memfd_create("area")
+        doorbell_sock = connect(
+            doorbell,
+            "doorbell",
+            "stdout,stderr,request,result,area",
+            [request_fd, result_fd, area_fd],
+        )
+
+        def ring(response: bytes, value: int = DOORBELL_ACK):
+            doorbell.respond(response)
+            os.write(request_fd, EVENTFD_VALUE.pack(value))
+            os.read(result_fd, 8)
+            (length,) = RESULT_LENGTH.unpack(os.pread(area_fd, 4, 0))
+            result = os.pread(area_fd, length, 4)
+            return result[:4], decode(result[4:])
+
+        self.assertEqual(ring(b"xy"), (b"DONE", [120, 121]))
+        # Its own accounting: new to the stream fuzzer
+        stream.respond(b"xy")
+        stream_sock.sendall(b"HOW\n")
+        self.assertEqual(
+            stream.read_result(stream_sock.fileno()), (b"DONE", [120, 121])
+        )
+        self.assertEqual(ring(b"xy"), (b"DUPL", []))
+        self.assertEqual(ring(b"x{"), (b"DONE", [123]))
+        # That payload is not acknowledged (e.g. a trimming run): 123 is resent
+        self.assertEqual(ring(b"xz", 1), (b"DONE", [122]))
+        self.assertEqual(ring(b"xz{"), (b"DONE", [123]))
+        self.assertEqual(ring(b"xz"), (b"DUPL", []))
+
+        doorbell_sock.close()
+        stream_sock.close()
+        deadline = time.monotonic() + 10
+        while len(self.finished) < 2:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.server.stop()
+        thread.join()
+        self.assertEqual(sorted(self.finished), ["doorbell", "stream"])
+        self.assertFalse(os.path.exists(socket_path))
+        for fd in (request_fd, result_fd, area_fd) + stream.fds + doorbell.fds:
+            os.close(fd)
+
+    def test_bad_hello(self):
+        socket_path = os.path.join(self.tmp_dir.name, "async.sock")
+        thread = self.start([], listen_unix(socket_path))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        # Without out_dir
+        sock.sendall(HELLO_LENGTH.pack(6) + b"x=1\ny\n")
+        self.assertEqual(sock.recv(4), b"")
+        sock.close()
+        self.server.stop()
+        thread.join()
+        self.assertEqual(self.finished, [])
+
+
+class testLatencyHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 101):
+            histogram.add(ms / 1000)
+        self.assertEqual(histogram.total, 100)
+        self.assertEqual(histogram.max, 0.1)
+        for q in (0.5, 0.9, 0.99):
+            exact = q * 0.1
+            self.assertGreaterEqual(histogram.percentile(q), exact)
+            self.assertLessEqual(histogram.percentile(q), exact * 2**0.25 + 1e-3)
+        other = LatencyHistogram()
+        other.add(2.0)
+        histogram.merge(other)
+        self.assertEqual(histogram.max, 2.0)
+        self.assertEqual(histogram.percentile(1.0), 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import pickle
+import tempfile
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from cfg_arrays import CFGArrays  # noqa: E402
+from graph_algo import CallGraph  # noqa: E402
+import bz_common as bzc  # noqa: E402
+from cfg_fixtures import write_ghidra_result  # noqa: E402
+
+
+def addrs(bbs):
+    return sorted(bb.start_addr for bb in bbs)
+
+
+class testCFGArrays(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        write_ghidra_result(self.tmp_dir.name, 40, 0)
+        self.cfg, _, _ = bzc.load_static_analysis_result(self.tmp_dir.name)
+        self.arrays = CFGArrays.from_static_analysis(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_matches_object_model(self):
+        bbs = [bb for func in self.cfg.get_funcs() for bb in func.get_bbs()]
+        self.assertEqual(self.arrays.num_bbs, len(bbs))
+        for bb in bbs:
+            view = self.arrays.bb(bb.id)
+            self.assertEqual(view.start_addr, bb.start_addr)
+            self.assertEqual(view.end_addr, bb.end_addr)
+            self.assertEqual(view.parent_funcnode.addr, bb.parent_funcnode.addr)
+            self.assertEqual(addrs(view.dst_bbs), addrs(bb.dst_bbs))
+            self.assertEqual(addrs(view.pred_bbs), addrs(bb.pred_bbs))
+            self.assertEqual(
+                sorted(f.addr for f in view.call_func),
+                sorted(f.addr for f in bb.call_func),
+            )
+            self.assertEqual(
+                sorted(x.literal for x in view.xrefs),
+                sorted(x.literal for x in bb.xrefs),
+            )
+        for func in self.cfg.get_funcs():
+            view = self.arrays.func(func.id)
+            self.assertEqual(view.get_entry().start_addr, func.get_entry().start_addr)
+            self.assertEqual(addrs(view.xrefs), addrs(func.xrefs))
+        self.assertEqual(
+            addrs(self.arrays.get_string_refer_bbs()),
+            addrs(self.cfg.get_string_refer_bbs()),
+        )
+
+    def test_address_lookup(self):
+        for func in self.cfg.get_funcs():
+            for bb in func.get_bbs():
+                for addr in (bb.start_addr, bb.start_addr + 4, bb.end_addr):
+                    self.assertIs(self.arrays.get_bb_from_addr(addr), self.arrays.bb(bb.id))
+        self.assertIsNone(self.arrays.get_bb_from_addr(0x10))
+        edges = [(0x10000, 0x10004), (0x20000, 0x5)]
+        self.assertEqual(
+            addrs(self.arrays.convert_edges_to_BBs(edges)),
+            addrs(self.cfg.convert_edges_to_BBs(edges)),
+        )
+
+    def test_transitive_callers(self):
+        string_funcs = list(self.cfg.get_string_refer_funcs())
+        expected = {f.addr for f in CallGraph(string_funcs).idx_to_func}
+        func_ids = self.arrays.transitive_caller_func_ids(
+            self.arrays.string_refer_func_ids()
+        )
+        self.assertEqual({self.arrays.func_addr[i] for i in func_ids}, expected)
+
+    def test_pickle(self):
+        restored = pickle.loads(pickle.dumps(self.arrays))
+        self.assertEqual(list(restored.succs.ids), list(self.arrays.succs.ids))
+        self.assertEqual(restored.literals, self.arrays.literals)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from cfg_arrays import CFGArrays  # noqa: E402
+from cfg_binary import (  # noqa: E402
+    ARRAY_FIELDS,
+    BINARY_FILE_NAME,
+    CSR_FIELDS,
+    HEADER,
+    convert_static_analysis_result,
+    read_cfg_binary,
+)
+import bz_common as bzc  # noqa: E402
+from cfg_fixtures import dump_cfg, write_ghidra_result  # noqa: E402
+
+
+class testCFGBinary(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stat_dir = self.tmp_dir.name
+        write_ghidra_result(self.stat_dir, 40, 0)
+        self.text_result = bzc.load_static_analysis_result(self.stat_dir)
+        cfg = self.text_result[0]
+        bbs = [bb for func in cfg.get_funcs() for bb in func.get_bbs()]
+        with open(os.path.join(self.stat_dir, "vertex.txt"), "w") as f:
+            f.write("\n".join(hex(bb.start_addr) for bb in bbs))
+        with open(os.path.join(self.stat_dir, "edge.txt"), "w") as f:
+            f.write(
+                "\n".join(
+                    f"{hex(bb.start_addr)} {hex(dst.start_addr)}"
+                    for bb in bbs
+                    for dst in bb.dst_bbs
+                )
+            )
+        self.text_result = bzc.load_static_analysis_result(self.stat_dir)
+        self.binary_path = os.path.join(self.stat_dir, BINARY_FILE_NAME)
+        convert_static_analysis_result(self.stat_dir, self.binary_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_arrays_round_trip(self):
+        expected = CFGArrays.from_static_analysis(self.stat_dir)
+        restored = read_cfg_binary(self.binary_path)
+        for name in ARRAY_FIELDS[:-2]:
+            self.assertEqual(
+                list(getattr(restored, name)), list(getattr(expected, name)), name
+            )
+        for name in CSR_FIELDS:
+            for part in ("offsets", "ids"):
+                self.assertEqual(
+                    list(getattr(getattr(restored, name), part)),
+                    list(getattr(getattr(expected, name), part)),
+                    name,
+                )
+        self.assertEqual(restored.literals, expected.literals)
+        self.assertEqual(
+            restored.get_bb_from_addr(expected.bb_start[3]).id,
+            expected.get_bb_from_addr(expected.bb_start[3]).id,
+        )
+
+    def test_same_as_text_result(self):
+        text_cfg, text_edges, text_vertices = self.text_result
+        binary_cfg, binary_edges, binary_vertices = bzc.load_static_analysis_result(
+            self.stat_dir
+        )
+        self.assertEqual(dump_cfg(binary_cfg), dump_cfg(text_cfg))
+        self.assertTrue(text_edges)
+        self.assertEqual(binary_edges, text_edges)
+        self.assertEqual(binary_vertices, text_vertices)
+
+    def test_rejects_other_version(self):
+        with open(self.binary_path, "r+b") as f:
+            magic, version, byte_order, num_sections = HEADER.unpack(
+                f.read(HEADER.size)
+            )
+            f.seek(0)
+            f.write(HEADER.pack(magic, version + 1, byte_order, num_sections))
+        with self.assertRaises(ValueError):
+            read_cfg_binary(self.binary_path)
+        # The text files are still usable
+        cfg, _, _ = bzc.load_static_analysis_result(self.stat_dir, prefer_binary=False)
+        self.assertEqual(dump_cfg(cfg), dump_cfg(self.text_result[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import pickle
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import CFG, Funcnode, BB, XREF  # noqa: E402
+
+
+def make_cfg() -> CFG:
+    cfg = CFG()
+    for func_addr in (0x1000, 0x2000):
+        func = Funcnode(func_addr)
+        cfg.funcnode_dict[func_addr] = func
+        for k in range(3):
+            func.register_bb(BB(func_addr + k * 0x10, func))
+        bbs = func.get_bbs()
+        bbs[0].dst_bbs.update(bbs[1:])
+        bbs[1].dst_bbs.add(bbs[2])
+        table = func.get_implications()
+        table.set(bbs[0], bbs[2], table.to_bits((bbs[1],)))
+        table.set(bbs[1], bbs[2], table.to_bits(()))
+    caller, callee = cfg.get_funcs()
+    caller.get_bbs()[1].call_func.add(callee)
+    callee.xrefs.add(caller.get_bbs()[1])
+    xref = XREF(b"literal")
+    xref.bbs.add(callee.get_bbs()[2])
+    cfg.string_xref[xref.literal] = xref
+    return cfg
+
+
+class testCFGRecover(unittest.TestCase):
+    def test_assign_ids(self):
+        cfg = make_cfg()
+        cfg.assign_ids()
+        self.assertEqual([f.id for f in cfg.get_funcs()], [0, 1])
+        ids = [bb.id for f in cfg.get_funcs() for bb in f.get_bbs()]
+        self.assertEqual(ids, list(range(6)))
+        self.assertEqual(cfg.num_bb_ids, 6)
+
+    def test_no_instance_dict(self):
+        cfg = make_cfg()
+        bb = cfg.get_funcs()[0].get_entry()
+        self.assertFalse(hasattr(bb, "__dict__"))
+        self.assertFalse(hasattr(bb.parent_funcnode, "__dict__"))
+
+    def test_bbs_hash_by_identity(self):
+        func = Funcnode(0x1000)
+        self.assertNotEqual(BB(0x1000, func), BB(0x1000, func))
+
+    def test_freeze(self):
+        cfg = make_cfg()
+        cfg.freeze()
+        caller, callee = cfg.get_funcs()
+        bbs = caller.get_bbs()
+        self.assertIsInstance(bbs[0].dst_bbs, tuple)
+        self.assertEqual(set(bbs[2].pred_bbs), {bbs[0], bbs[1]})
+        self.assertEqual(bbs[0].edge_implicate_bbs, {bbs[2]: (bbs[1],)})
+        # The empty implications are dropped
+        self.assertEqual(bbs[1].edge_implicate_bbs.get(bbs[2], ()), ())
+        self.assertEqual(bbs[1].call_func, (callee,))
+        self.assertEqual(callee.xrefs, (bbs[1],))
+        self.assertEqual(cfg.string_xref[b"literal"].bbs, (callee.get_bbs()[2],))
+
+    def test_xref_legacy_pickle_state(self):
+        # XREFs pickled before __slots__ carry their __dict__
+        xref = XREF.__new__(XREF)
+        xref.__setstate__(
+            {"bbs": {0x10}, "literal": b"abcd", "ro_addrs": {0x20}, "funcnodes": {0}}
+        )
+        self.assertEqual(xref.literal, b"abcd")
+        self.assertEqual(xref.bbs, {0x10})
+        restored = pickle.loads(pickle.dumps(xref))
+        self.assertEqual(restored.ro_addrs, {0x20})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import CFG, Funcnode, BB  # noqa: E402
+from CFG_transform import CFGTransformer  # noqa: E402
+from graph_algo import CallGraph  # noqa: E402
+from cfg_fixtures import dump_cfg, dump_sccs, make_cfg as make_random_cfg  # noqa: E402
+
+
+def make_cfg(num_funcs: int, seed: int) -> CFG:
+    """
+    Random program whose call sites call a single function each, with callees
+    called once, or twice from BBs that are merged later
+    """
+    return make_random_cfg(
+        num_funcs,
+        seed,
+        min_bbs=3,
+        max_bbs=12,
+        back_edge_rate=0.1,
+        single_callee_sites=True,
+        literal_rate=0.15,
+        num_literals=4,
+    )
+
+
+def dump_callgraph(cg: CallGraph):
+    funcs = cg.get_funcs()
+    func_to_scc_id = cg.build_func_to_scc_id()
+    sccs = {}
+    for func in funcs:
+        sccs.setdefault(func_to_scc_id[func.addr], set()).add(func.addr)
+    edges = {
+        cg.idx_to_func[v].addr: sorted(cg.idx_to_func[w].addr for w in cg.adj[v])
+        for v in range(cg.num_vertices)
+        if not cg.removed[v]
+    }
+    return edges, sorted(sorted(scc) for scc in sccs.values())
+
+
+class testCFGTransform(unittest.TestCase):
+    def test_worklist_matches_whole_program_rounds(self):
+        for seed in range(30):
+            rounds_cfg = make_cfg(30, seed)
+            rounds = CFGTransformer(rounds_cfg)
+            rounds.run_passes_n_times(rounds_cfg, 1000)
+            worklist_cfg = make_cfg(30, seed)
+            worklist = CFGTransformer(worklist_cfg)
+            worklist.run_all_passes(worklist_cfg)
+            for func in rounds_cfg.get_funcs() + worklist_cfg.get_funcs():
+                func.update_preds()
+            self.assertEqual(
+                dump_cfg(rounds_cfg, ids=False, implications=True),
+                dump_cfg(worklist_cfg, ids=False, implications=True),
+            )
+            self.assertEqual(rounds.operation_count, worklist.operation_count)
+
+    def test_callgraph_after_inlining(self):
+        inlined = 0
+        for seed in range(30):
+            cfg = make_cfg(30, seed)
+            transformer = CFGTransformer(cfg)
+            transformer.remove_unrelated_funcs(cfg)
+            num_funcs = len(transformer.get_funcs())
+            transformer.run_inliner_pass(cfg)
+            inlined += num_funcs - len(transformer.get_funcs())
+            transformer.verify_cfg(cfg)
+            # Incrementally updated vs built from scratch
+            updated = transformer.get_callgraph()
+            transformer._rebuild_callgraph()
+            self.assertEqual(
+                dump_callgraph(updated), dump_callgraph(transformer.get_callgraph())
+            )
+            self.assertEqual(dump_sccs(updated), dump_sccs(transformer.get_callgraph()))
+        self.assertGreater(inlined, 0)
+
+    def test_inlined_sinks_own_their_implications(self):
+        cfg = CFG()
+        caller = Funcnode(0x1000)
+        callee = Funcnode(0x2000)
+        for func, num_bbs in ((caller, 3), (callee, 3)):
+            cfg.funcnode_dict[func.addr] = func
+            for k in range(num_bbs):
+                func.register_bb(BB(func.addr + k * 0x10, func))
+        call_site, after, implicated = caller.get_bbs()
+        call_site.dst_bbs = {after}
+        table = caller.get_implications()
+        table.set(call_site, after, table.to_bits((implicated,)))
+        call_site.call_func.add(callee)
+        callee.xrefs.add(call_site)
+        entry, sink1, sink2 = callee.get_bbs()
+        entry.dst_bbs = {sink1, sink2}
+        callee_table = callee.get_implications()
+        callee_table.set(entry, sink1, callee_table.to_bits((sink2,)))
+
+        CFGTransformer(cfg).inline_callee(call_site, callee, [])
+        self.assertEqual(call_site.dst_bbs, {entry})
+        self.assertIsNone(callee.implications)
+        # The implications of the callee move into the table of the caller
+        self.assertEqual(caller.get_implicated_bbs(entry, sink1), [sink2])
+        for sink in (sink1, sink2):
+            self.assertEqual(sink.dst_bbs, {after})
+            self.assertEqual(caller.get_implicated_bbs(sink, after), [implicated])
+        # The passes intersect the implications of the sinks separately
+        table.intersect(sink1, after, 0)
+        self.assertEqual(caller.get_implicated_bbs(sink2, after), [implicated])
+        self.assertEqual(caller.get_implicated_bbs(call_site, entry), [])
+        self.assertEqual(caller.get_implicated_bbs(call_site, after), [])
+
+    def test_entry_incoming_edge_implications(self):
+        cfg = CFG()
+        func = Funcnode(0x1000)
+        cfg.funcnode_dict[func.addr] = func
+        for k in range(5):
+            func.register_bb(BB(func.addr + k * 0x10, func))
+        entry, succ1, succ2, pred, implicated = func.get_bbs()
+        entry.dst_bbs = {entry, succ1, succ2}
+        pred.dst_bbs = {entry}
+        table = func.get_implications()
+        table.set(pred, entry, table.to_bits((implicated,)))
+
+        transformer = CFGTransformer(cfg)
+        transformer.remove_entry_incoming_edge(pred, entry)
+        self.assertEqual(pred.dst_bbs, {succ1, succ2})
+        # Every successor inherits the implication of the removed edge
+        for succ in (succ1, succ2):
+            self.assertEqual(func.get_implicated_bbs(pred, succ), [implicated])
+        self.assertEqual(table.get(pred, entry), 0)
+
+        # An entry with only a self loop: the edge goes without a trace
+        entry.dst_bbs = {entry}
+        succ1.dst_bbs = {entry}
+        table.set(succ1, entry, table.to_bits((implicated,)))
+        transformer.remove_entry_incoming_edge(succ1, entry)
+        self.assertEqual(succ1.dst_bbs, set())
+        self.assertEqual(table.get(succ1, entry), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
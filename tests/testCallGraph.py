@@ -0,0 +1,181 @@
+import os
+import random
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import Funcnode, BB  # noqa: E402
+from graph_algo import CallGraph  # noqa: E402
+from cfg_fixtures import dump_sccs  # noqa: E402
+
+
+def make_funcs(num_funcs: int, edges):
+    """
+    Functions of one BB each; (caller, callee) in `edges` is a call, possibly
+    from several call sites
+    """
+    funcs = []
+    for i in range(num_funcs):
+        func = Funcnode(0x1000 * (i + 1))
+        func.register_bb(BB(func.addr, func))
+        funcs.append(func)
+    for caller, callee in edges:
+        func = funcs[caller]
+        call_site = BB(func.addr + 0x10 * len(func.BBs), func)
+        func.register_bb(call_site)
+        funcs[callee].xrefs.add(call_site)
+    return funcs
+
+
+def reachable(num_funcs: int, edges):
+    reach = [{v} for v in range(num_funcs)]
+    changed = True
+    while changed:
+        changed = False
+        for v, w in edges:
+            if not reach[w] <= reach[v]:
+                reach[v] |= reach[w]
+                changed = True
+    return reach
+
+
+def add_call(caller: Funcnode, callee: Funcnode):
+    call_site = BB(caller.addr + 0x10 * len(caller.BBs), caller)
+    caller.register_bb(call_site)
+    callee.xrefs.add(call_site)
+
+
+class testCallGraph(unittest.TestCase):
+    def test_sccs_and_order(self):
+        for seed in range(50):
+            rng = random.Random(seed)
+            num_funcs = rng.randrange(1, 30)
+            edges = [
+                (rng.randrange(num_funcs), rng.randrange(num_funcs))
+                for _ in range(rng.randrange(0, 3 * num_funcs))
+            ]
+            funcs = make_funcs(num_funcs, edges)
+            cg = CallGraph(funcs)
+            idx = [cg.addr_to_idx[func.addr] for func in funcs]
+
+            # Same SCC iff reachable from each other
+            reach = reachable(num_funcs, edges)
+            for v in range(num_funcs):
+                for w in range(num_funcs):
+                    self.assertEqual(
+                        cg.scc_ids[idx[v]] == cg.scc_ids[idx[w]],
+                        w in reach[v] and v in reach[w],
+                    )
+            # Deduplicated edges
+            for v, w in edges:
+                self.assertEqual(cg.adj[idx[v]].count(idx[w]), 1)
+            for dag_succs in cg.scc_dag:
+                self.assertEqual(len(dag_succs), len(set(dag_succs)))
+            # The callees come first
+            order = cg.reverse_topological_sort()
+            self.assertEqual(sorted(order), list(range(cg.scc_count)))
+            position = {scc: i for i, scc in enumerate(order)}
+            for v, w in edges:
+                scc_v, scc_w = cg.scc_ids[idx[v]], cg.scc_ids[idx[w]]
+                if scc_v != scc_w:
+                    self.assertIn(scc_w, cg.scc_dag[scc_v])
+                    self.assertLess(position[scc_w], position[scc_v])
+
+    def test_callers_are_added(self):
+        funcs = make_funcs(5, [(0, 1), (1, 2), (0, 2), (0, 2), (3, 0), (2, 4)])
+        cg = CallGraph([funcs[2]])
+        # The (transitive) callers, in BFS order; not the callees
+        self.assertEqual(cg.idx_to_func[0], funcs[2])
+        self.assertEqual(set(cg.idx_to_func[1:3]), {funcs[0], funcs[1]})
+        self.assertEqual(cg.idx_to_func[3], funcs[3])
+        self.assertEqual(cg.num_vertices, 4)
+        self.assertEqual(cg.adj[cg.addr_to_idx[funcs[0].addr]].count(0), 1)
+
+    def test_deep_call_chain(self):
+        # Far deeper than the recursion limit
+        num_funcs = 20 * sys.getrecursionlimit()
+        edges = [(i, i + 1) for i in range(num_funcs - 1)] + [(num_funcs - 1, 0)]
+        cg = CallGraph(make_funcs(num_funcs, edges))
+        self.assertEqual(cg.scc_count, 1)
+        cg = CallGraph(make_funcs(num_funcs, edges[:-1]))
+        self.assertEqual(cg.scc_count, num_funcs)
+        order = cg.reverse_topological_sort()
+        self.assertEqual(
+            [cg.idx_to_func[cg.scc_funcidx_map[scc][0]].addr for scc in order],
+            [0x1000 * (i + 1) for i in reversed(range(num_funcs))],
+        )
+
+    def test_incremental_updates_match_rebuild(self):
+        for seed in range(40):
+            rng = random.Random(seed)
+            num_funcs = rng.randrange(2, 20)
+            edges = [
+                (rng.randrange(num_funcs), rng.randrange(num_funcs))
+                for _ in range(rng.randrange(0, 2 * num_funcs))
+            ]
+            funcs = make_funcs(num_funcs, edges)
+            # Some functions are outside of the graph until something calls them
+            cg = CallGraph(funcs[: num_funcs // 2])
+            for _ in range(30):
+                live = cg.get_funcs()
+                op = rng.random()
+                caller = rng.choice(funcs)
+                callee = rng.choice(live)
+                if op < 0.5:
+                    if caller.addr in cg.addr_to_idx or rng.random() < 0.3:
+                        add_call(caller, callee)
+                        cg.add_call(caller, callee)
+                elif op < 0.8:
+                    for call_site in list(callee.xrefs):
+                        if call_site.parent_funcnode == caller:
+                            callee.xrefs.remove(call_site)
+                    cg.remove_call(caller, callee)
+                elif len(live) > 1:
+                    for func in funcs:
+                        func.xrefs -= set(callee.get_bbs())
+                    callee.xrefs.clear()
+                    funcs.remove(callee)
+                    cg.remove_func(callee)
+                rebuilt = CallGraph(cg.get_funcs())
+                self.assertEqual(dump_sccs(cg), dump_sccs(rebuilt))
+
+    def test_add_call_merges_sccs(self):
+        funcs = make_funcs(4, [(0, 1), (1, 2), (2, 3)])
+        cg = CallGraph(funcs)
+        self.assertEqual(cg.scc_count, 4)
+        add_call(funcs[3], funcs[1])
+        cg.add_call(funcs[3], funcs[1])
+        sccs, _, _ = dump_sccs(cg)
+        self.assertEqual(
+            sccs,
+            {frozenset({funcs[0].addr}), frozenset(f.addr for f in funcs[1:])},
+        )
+        # Removing the call splits it again, in bottom-up order
+        cg.remove_call(funcs[3], funcs[1])
+        order = [
+            cg.idx_to_func[cg.scc_funcidx_map[scc][0]]
+            for scc in cg.reverse_topological_sort()
+        ]
+        self.assertEqual(order, funcs[::-1])
+
+    def test_unknown_funcs_are_ignored(self):
+        funcs = make_funcs(4, [(0, 1), (1, 2), (2, 0)])
+        cg = CallGraph(funcs[:3])
+        expected = dump_sccs(cg)
+        outside = funcs[3]
+        cg.add_call(funcs[0], outside)
+        cg.remove_call(outside, funcs[0])
+        cg.redirect_call(outside, funcs[1], funcs[2])
+        cg.remove_func(outside)
+        self.assertEqual(dump_sccs(cg), expected)
+        # Twice: the second time it is no longer in the graph
+        cg.remove_func(funcs[2])
+        expected = dump_sccs(cg)
+        self.assertEqual(len(expected[0]), 2)
+        cg.remove_func(funcs[2])
+        self.assertEqual(dump_sccs(cg), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
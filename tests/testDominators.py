@@ -0,0 +1,112 @@
+import os
+import random
+import unittest
+import sys
+from typing import Dict, List, Set
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import Funcnode, BB  # noqa: E402
+
+
+def make_func(num_bbs: int, edges: List[tuple]) -> Funcnode:
+    func = Funcnode(0x1000)
+    for k in range(num_bbs):
+        func.register_bb(BB(func.addr + k, func))
+    bbs = func.get_bbs()
+    for src, dst in edges:
+        bbs[src].dst_bbs.add(bbs[dst])
+    func.update_preds()
+    return func
+
+
+def make_random_func(num_bbs: int, seed: int) -> Funcnode:
+    """
+    Random forward chain with branches and back edges; the last BB is the only sink.
+    """
+    rng = random.Random(seed)
+    edges = [(k, k + 1) for k in range(num_bbs - 1)]
+    for k in range(num_bbs - 1):
+        if rng.random() < 0.4:
+            edges.append((k, rng.randrange(k + 1, num_bbs)))
+        if rng.random() < 0.2:
+            edges.append((k, rng.randrange(0, k + 1)))
+    return make_func(num_bbs, edges)
+
+
+def naive_dominators(bbs: List[BB], entry: BB, succ_attr: str) -> Dict[BB, Set[BB]]:
+    """
+    The former dataflow solver: Dom(n) = {n} ∪ ⋂ Dom(p) over the predecessors
+    """
+    preds: Dict[BB, List[BB]] = {bb: [] for bb in bbs}
+    for bb in bbs:
+        for succ in getattr(bb, succ_attr):
+            preds[succ].append(bb)
+    doms = {bb: set(bbs) for bb in bbs}
+    doms[entry] = {entry}
+    changed = True
+    while changed:
+        changed = False
+        for bb in bbs:
+            if bb == entry:
+                continue
+            new_doms = {bb} | set.intersection(*(doms[p] for p in preds[bb]))
+            if new_doms != doms[bb]:
+                doms[bb] = new_doms
+                changed = True
+    return doms
+
+
+class testDominators(unittest.TestCase):
+    def check_tree(self, tree, bbs: List[BB], expected: Dict[BB, Set[BB]]):
+        for bb in bbs:
+            self.assertEqual(set(tree.dominators(bb)), expected[bb])
+            for other in bbs:
+                self.assertEqual(tree.dominates(other, bb), other in expected[bb])
+
+    def test_dominators_match_dataflow(self):
+        for seed in range(30):
+            func = make_random_func(20, seed)
+            func.build_dominators()
+            bbs = func.get_bbs()
+            expected = naive_dominators(bbs, func.get_entry(), "dst_bbs")
+            self.check_tree(func.dom_tree, bbs, expected)
+
+    def test_post_dominators_match_dataflow(self):
+        for seed in range(30):
+            func = make_random_func(20, seed)
+            func.build_post_dominators()
+            bbs = func.get_bbs()
+            # The last BB is the only sink, so it acts as the exit
+            expected = naive_dominators(bbs[::-1], bbs[-1], "pred_bbs")
+            self.check_tree(func.pdom_tree, bbs, expected)
+
+    def test_unreachable_bb(self):
+        # BB 2 has no predecessor; the former solver crashed on it
+        func = make_func(4, [(0, 1), (2, 1), (1, 3)])
+        func.build_dominators()
+        bbs = func.get_bbs()
+        self.assertEqual(set(func.dom_tree.dominators(bbs[3])), {bbs[0], bbs[1], bbs[3]})
+        self.assertEqual(func.dom_tree.dominators(bbs[2]), [bbs[2]])
+        self.assertIsNone(func.dom_tree.idom(bbs[2]))
+
+    def test_infinite_loop_without_sink(self):
+        # 0 -> 1 -> 2 -> 1: no sink at all
+        func = make_func(3, [(0, 1), (1, 2), (2, 1)])
+        func.build_post_dominators()
+        bbs = func.get_bbs()
+        # The virtual exit is attached to the bottom of the loop
+        self.assertEqual(func.pdom_tree.dominators(bbs[2]), [bbs[2]])
+        self.assertEqual(set(func.pdom_tree.dominators(bbs[1])), {bbs[1], bbs[2]})
+        self.assertEqual(
+            set(func.pdom_tree.dominators(bbs[0])), {bbs[0], bbs[1], bbs[2]}
+        )
+
+    def test_unknown_bb_has_no_dominators(self):
+        func = make_func(2, [(0, 1)])
+        func.build_dominators()
+        self.assertEqual(func.dom_tree.dominator_bits(BB(0x2000, func)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import struct
+import tempfile
+import time
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from fuzz_transport import (  # noqa: E402
+    DELTA_HEADER,
+    HELLO_LENGTH,
+    HELLO_MAX_FDS,
+    HELLO_OK,
+    REQUEST_ACK,
+    read_exact,
+    send_hello,
+)
+from cfg_fixtures import write_ghidra_result  # noqa: E402
+
+DAEMON_PATH = os.path.join(pwd, "..", "src", "estimator_daemon.py")
+
+
+class Fuzzer:
+    """
+    What the patched AFL++ does with FUZZ_DAEMON_SOCKET, with the delta coverage
+    """
+
+    def __init__(self, socket_path: str, out_dir: str):
+        self.out_dir = out_dir
+        self.fds = (os.memfd_create("stdout"), os.memfd_create("stderr"))
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        hello = {
+            "out_dir": out_dir,
+            "coverage": "delta",
+            "shm_id": "",
+            "map_size": 65536,
+        }
+        send_hello(self.sock, hello, self.fds)
+        self.reply = self.sock.recv(4)
+
+    def execute(self, response: bytes):
+        os.ftruncate(self.fds[0], 0)
+        os.pwrite(self.fds[0], response, 0)
+        self.sock.sendall(REQUEST_ACK)
+        token = read_exact(self.sock.fileno(), 4)
+        _, count = DELTA_HEADER.unpack(read_exact(self.sock.fileno(), 12))
+        payload = read_exact(self.sock.fileno(), 4 * count) if count else b""
+        return token, sorted(struct.unpack(f"={count}I", payload))
+
+    def close(self):
+        self.sock.close()
+        for fd in self.fds:
+            os.close(fd)
+
+
+class testEstimatorDaemon(unittest.TestCase):
+    python = sys.executable
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stat_dir = os.path.join(self.tmp_dir.name, "stat")
+        os.mkdir(self.stat_dir)
+        write_ghidra_result(self.stat_dir, 40, 0)
+        with open(os.path.join(self.stat_dir, "CFG_analysis.txt")) as f:
+            funcnode_dict = json.load(f)
+        with open(os.path.join(self.stat_dir, "vertex.txt"), "w") as f:
+            for func in funcnode_dict.values():
+                for bb_addr in func["BBs"]:
+                    f.write(f"{int(bb_addr):x}\n")
+        self.socket_path = os.path.join(self.tmp_dir.name, "daemon.sock")
+        env = dict(
+            os.environ,
+            FUZZ_STATIC_ANALYSIS_PATH=self.stat_dir,
+            FUZZ_DAEMON_SOCKET=self.socket_path,
+            FUZZ_DAEMON_WORKERS="2",
+        )
+        self.daemon = subprocess.Popen(
+            [self.python, DAEMON_PATH], env=env, stdout=subprocess.PIPE
+        )
+        # The first line once the socket is up
+        self.assertIn(b"Daemon is READY", self.daemon.stdout.readline())
+
+    def tearDown(self):
+        self.daemon.terminate()
+        self.daemon.wait()
+        self.daemon.stdout.close()
+        self.tmp_dir.cleanup()
+
+    def make_fuzzer(self, name: str) -> Fuzzer:
+        out_dir = os.path.join(self.tmp_dir.name, name)
+        os.mkdir(out_dir)
+        fuzzer = Fuzzer(self.socket_path, out_dir)
+        self.assertEqual(fuzzer.reply, HELLO_OK)
+        return fuzzer
+
+    def wait_for_stats(self, out_dir: str):
+        stat_path = os.path.join(out_dir, "mode_stats.txt")
+        deadline = time.monotonic() + 10
+        while not os.path.exists(stat_path):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        with open(stat_path) as f:
+            return f.read()
+
+    def test_separate_accounting(self):
+        first = self.make_fuzzer("first")
+        second = self.make_fuzzer("second")
+        token, idxs = first.execute(b"literal 1\nliteral 2\n")
+        self.assertEqual(token, b"DONE")
+        self.assertTrue(idxs)
+        self.assertEqual(first.execute(b"literal 1\nliteral 2\n"), (b"DUPL", []))
+        # Neither the response nor the vertices are known to the second fuzzer
+        self.assertEqual(second.execute(b"literal 1\nliteral 2\n"), (b"DONE", idxs))
+        self.assertEqual(second.execute(b"literal 1\n")[0], b"DONE")
+        first.close()
+        self.assertIn("DUPL: 1", self.wait_for_stats(first.out_dir))
+        self.assertFalse(os.path.exists(os.path.join(second.out_dir, "mode_stats.txt")))
+        # The daemon goes on serving the rest
+        self.assertEqual(second.execute(b"literal 1\n"), (b"DUPL", []))
+        second.close()
+        stats = self.wait_for_stats(second.out_dir)
+        self.assertIn("DONE: 2", stats)
+        self.assertIn("DUPL: 1", stats)
+
+    def test_bad_hello(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        # Without out_dir
+        sock.sendall(HELLO_LENGTH.pack(6) + b"x=1\ny\n")
+        self.assertEqual(sock.recv(4), b"")
+        sock.close()
+        fuzzer = self.make_fuzzer("after")
+        self.assertEqual(fuzzer.execute(b"literal 3\n")[0], b"DONE")
+        fuzzer.close()
+
+    def test_too_many_fds(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        fds = [os.memfd_create("fd") for _ in range(HELLO_MAX_FDS + 1)]
+        # The daemon may close the connection before the rest of the hello is sent
+        try:
+            send_hello(sock, {"out_dir": self.tmp_dir.name}, fds)
+            self.assertEqual(sock.recv(4), b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        sock.close()
+        for fd in fds:
+            os.close(fd)
+        fuzzer = self.make_fuzzer("after")
+        self.assertEqual(fuzzer.execute(b"literal 3\n")[0], b"DONE")
+        fuzzer.close()
+
+
+@unittest.skipIf(shutil.which("pypy3") is None, "pypy3 is not installed")
+class testEstimatorDaemonPyPy(testEstimatorDaemon):
+    """
+    The daemon under the interpreter of Dockerfile.fuzz (PyPy 3.8)
+    """
+
+    python = shutil.which("pypy3")
+
+
+if __name__ == "__main__":
+    unittest.main()
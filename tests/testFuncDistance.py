@@ -0,0 +1,113 @@
+import os
+import random
+import unittest
+import sys
+from typing import Dict, List, Tuple
+from unittest import mock
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import CFG, Funcnode, BB  # noqa: E402
+import func_distance  # noqa: E402
+from func_distance import get_caller_distances  # noqa: E402
+
+
+def make_call_graph(num_funcs: int, num_calls: int, seed: int) -> CFG:
+    rng = random.Random(seed)
+    cfg = CFG()
+    for i in range(num_funcs):
+        func = Funcnode(0x1000 * (i + 1))
+        for k in range(3):
+            func.register_bb(BB(func.addr + k, func))
+        cfg.funcnode_dict[func.addr] = func
+    funcs = cfg.get_funcs()
+    for _ in range(num_calls):
+        caller = rng.choice(funcs)
+        callee = rng.choice(funcs)
+        call_site = rng.choice(caller.get_bbs())
+        call_site.call_func.add(callee)
+        caller.call_func.add(callee)
+        callee.xrefs.add(call_site)
+    return cfg
+
+
+def pairwise_distances(cfg: CFG) -> Dict[Tuple[Funcnode, Funcnode], int]:
+    distances: Dict[Tuple[Funcnode, Funcnode], int] = {}
+    funcs: List[Funcnode] = cfg.get_funcs()
+    caller_dists = {f: get_caller_distances(f) for f in funcs}
+    for f1 in funcs:
+        for f2 in funcs:
+            common = caller_dists[f1].keys() & caller_dists[f2].keys()
+            distances[f1, f2] = min(
+                (caller_dists[f1][f] + caller_dists[f2][f] for f in common),
+                default=100,
+            )
+    return distances
+
+
+class testFuncDistance(unittest.TestCase):
+    def test_matrix_matches_pairwise(self):
+        for seed in range(20):
+            cfg = make_call_graph(30, 40, seed)
+            cfg.build_func_distance_map()
+            for (f1, f2), dist in pairwise_distances(cfg).items():
+                self.assertEqual(cfg.get_func_distance(f1, f2), dist)
+
+    def test_parallel_matches_serial(self):
+        cfg = make_call_graph(60, 90, 0)
+        cfg.build_func_distance_map()
+        serial = cfg.func_distance_map
+        cfg.build_func_distance_map(processes=2)
+        self.assertEqual(list(serial.dists), list(cfg.func_distance_map.dists))
+
+    def test_no_common_caller(self):
+        cfg = make_call_graph(2, 0, 0)
+        cfg.build_func_distance_map()
+        f1, f2 = cfg.get_funcs()
+        self.assertEqual(cfg.get_func_distance(f1, f1), 0)
+        self.assertEqual(cfg.get_func_distance(f1, f2), 100)
+
+    def test_lazy_matches_matrix(self):
+        cfg = make_call_graph(40, 60, 1)
+        cfg.build_func_distance_map()
+        matrix = cfg.func_distance_map
+        # A tiny cache forces evictions and recomputation
+        cfg.build_lazy_func_distance_map(cache_size=8)
+        funcs = cfg.get_funcs()
+        for _ in range(2):
+            for f1 in funcs:
+                for f2 in funcs:
+                    self.assertEqual(cfg.get_func_distance(f1, f2), matrix[f1, f2])
+        self.assertEqual(cfg.func_distance_map.touched_ratio(), 1.0)
+        self.assertLessEqual(len(cfg.func_distance_map._results), 8)
+
+    def test_lazy_touched_ratio(self):
+        cfg = make_call_graph(10, 10, 2)
+        cfg.build_lazy_func_distance_map()
+        f1, f2 = cfg.get_funcs()[:2]
+        cfg.get_func_distance(f1, f2)
+        cfg.get_func_distance(f2, f1)
+        stats = cfg.func_distance_map.stats()
+        self.assertEqual(stats["lookups"], 2)
+        self.assertEqual(stats["computed"], 1)
+        self.assertAlmostEqual(stats["touched_ratio"], 1 / 55)
+
+    def test_lazy_touched_estimate(self):
+        cfg = make_call_graph(40, 60, 1)
+        # 40 * 40 pairs do not fit: they are hashed and counted approximately
+        with mock.patch.object(func_distance, "TOUCHED_BITMAP_BITS", 1 << 10):
+            cfg.build_lazy_func_distance_map(cache_size=8)
+        distances = cfg.func_distance_map
+        self.assertEqual(len(distances.touched_bits), 128)
+        funcs = cfg.get_funcs()
+        for _ in range(2):
+            for f1 in funcs:
+                for f2 in funcs:
+                    cfg.get_func_distance(f1, f2)
+        # Every lookup is recomputed, but each pair counts once
+        self.assertEqual(distances.num_computed, 2 * 40 * 40)
+        self.assertAlmostEqual(distances.touched_pairs() / 820, 1.0, delta=0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+import unittest
+import sys
+from unittest import mock
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import CFG  # noqa: E402
+from fuzz_server import (  # noqa: E402
+    MODE_FULL,
+    MODE_NO_CDBI,
+    search_bbs_in_budget,
+)
+from snapshot import preprocess_static_analysis  # noqa: E402
+from cfg_fixtures import write_ghidra_result  # noqa: E402
+
+
+class testFuzzServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as stat_dir:
+            write_ghidra_result(stat_dir, 40, 0)
+            cls.matcher = preprocess_static_analysis(stat_dir).matcher
+        # Literals of several BBs, so that CDBI runs its beam search
+        literals = [
+            info.xref.literal
+            for info in cls.matcher.idx_to_match_info
+            if len(info.xref.bbs) > 1
+        ]
+        cls.response = b"\n".join(literals) + b"\n"
+
+    def test_no_deadline(self):
+        bbs, mode = search_bbs_in_budget(self.matcher, self.response, None)
+        self.assertEqual(mode, MODE_FULL)
+        self.assertEqual(bbs, self.matcher.search_bbs(self.response))
+
+    def test_deadline_expires_during_cdbi(self):
+        # Matched before the deadline is set: only CDBI runs against it
+        match_items, _ = self.matcher.match_lines(self.response)
+        get_bb_distance = CFG.get_bb_distance
+        deadline = time.perf_counter() + 0.05
+
+        def slow_distance(cfg, bb1, bb2):
+            # The first distance takes the whole budget
+            while time.perf_counter() <= deadline:
+                time.sleep(0.01)
+            return get_bb_distance(cfg, bb1, bb2)
+
+        with mock.patch.object(CFG, "get_bb_distance", slow_distance):
+            bbs, mode = search_bbs_in_budget(self.matcher, self.response, deadline)
+        self.assertEqual(mode, MODE_NO_CDBI)
+        self.assertEqual(bbs, self.matcher.collect_bbs_without_beam(match_items))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+import ctypes
+import io
+import os
+import random
+import struct
+import tempfile
+import threading
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from fuzz_transport import (  # noqa: E402
+    DELTA_HEADER,
+    PIPE_ACK,
+    PIPE_MESSAGE,
+    PIPE_REQUEST,
+    DeltaCoverage,
+    FileCoverage,
+    FileResponse,
+    MemfdResponse,
+    ShmCoverage,
+    fds_are_open,
+    merge_streams,
+    open_response,
+    read_exact,
+    serve_pipelined,
+)
+
+RESPONSES = [
+    (b"", b""),
+    (b"a\nb\n", b""),
+    (b"", b"err\nerr\n"),
+    (b"a\na\nb\na\na", b"a\nerror: x\nerror: x\n"),
+    (b"\n\n\nno newline", b"c\nc"),
+]
+
+
+def load_line_by_line(streams, max_lines: int) -> bytes:
+    """
+    The former load_put_response, on in-memory files
+    """
+    lines = []
+    for data in streams:
+        prev_line = None
+        for line in io.BytesIO(data):
+            if line != prev_line:
+                lines.append(line)
+            prev_line = line
+    return b"".join(lines[-max_lines:])
+
+
+class testFuzzTransport(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.TemporaryDirectory()
+        self.fds = (os.memfd_create("stdout"), os.memfd_create("stderr"))
+
+    def tearDown(self):
+        self.out_dir.cleanup()
+        for fd in self.fds:
+            os.close(fd)
+
+    def write_response(self, stdout: bytes, stderr: bytes):
+        for name, fd, data in (
+            ("stdout.txt", self.fds[0], stdout),
+            ("stderr.txt", self.fds[1], stderr),
+        ):
+            with open(os.path.join(self.out_dir.name, name), "wb") as f:
+                f.write(data)
+            # Like the faux forkserver before every execution
+            os.ftruncate(fd, 0)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, data)
+
+    def test_memfd_matches_files(self):
+        files = FileResponse(self.out_dir.name)
+        memfds = MemfdResponse(self.fds)
+        for stdout, stderr in RESPONSES:
+            self.write_response(stdout, stderr)
+            for max_lines in (1, 2, 5000):
+                expected = files.load(max_lines)
+                self.assertEqual(memfds.load(max_lines), expected)
+                self.assertIsInstance(memfds.load(max_lines), bytes)
+        self.write_response(b"a\na\nb\n", b"b\nb\nc")
+        self.assertEqual(memfds.load(5000), b"a\nb\nb\nc")
+        self.assertEqual(memfds.load(2), b"b\nc")
+
+    def test_merge_streams(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            streams = [
+                b"".join(rng.choice([b"a", b"b", b"\n", b"a\n"]) for _ in range(n))
+                for n in (rng.randrange(12), rng.randrange(12))
+            ]
+            for max_lines in range(1, 8):
+                self.assertEqual(
+                    merge_streams(streams, max_lines),
+                    load_line_by_line(streams, max_lines),
+                )
+
+    def test_fallback_to_files(self):
+        self.assertTrue(fds_are_open(self.fds))
+        closed_fd = os.dup(self.fds[0])
+        os.close(closed_fd)
+        self.assertFalse(fds_are_open((closed_fd,)))
+        # Nothing is passed on the default fds here
+        response = open_response(self.out_dir.name)
+        self.assertIsInstance(response, FileResponse)
+
+
+class testCoverage(unittest.TestCase):
+    def check_coverage(self, coverage: ShmCoverage, read_bits):
+        coverage.write([3, 5, 1 << 20])
+        self.assertEqual([i for i, bit in enumerate(read_bits()) if bit], [0, 3, 5])
+        coverage.repeat()
+        self.assertEqual(sum(read_bits()), 3)
+        coverage.close()
+
+    def test_sysv_shm(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        # IPC_PRIVATE, IPC_CREAT | 0600 like afl_shm_init
+        shm_id = libc.shmget(0, 64, 0o1000 | 0o600)
+        self.assertGreaterEqual(shm_id, 0)
+        addr = libc.shmat(shm_id, None, 0)
+        try:
+            bits = (ctypes.c_ubyte * 64).from_address(addr)
+            self.check_coverage(ShmCoverage(str(shm_id), 64), lambda: bytes(bits))
+        finally:
+            libc.shmdt(addr)
+            # IPC_RMID
+            libc.shmctl(shm_id, 0, None)
+
+    def test_posix_shm(self):
+        name = f"/shepherd_test_{os.getpid()}"
+        path = os.path.join("/dev/shm", name[1:])
+        if not os.path.isdir("/dev/shm"):
+            self.skipTest("no /dev/shm")
+        with open(path, "wb") as f:
+            f.write(bytes(64))
+        try:
+
+            def read_bits():
+                with open(path, "rb") as f:
+                    return f.read()
+
+            self.check_coverage(ShmCoverage(name, 64), read_bits)
+        finally:
+            os.remove(path)
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            coverage = FileCoverage(out_dir)
+            coverage.write([10, 255])
+            coverage.repeat()
+            with open(os.path.join(out_dir, "edges.txt")) as f:
+                self.assertEqual(f.read(), "a\nff\n")
+
+    def decode_delta(self, payload: bytes):
+        set_hash, count = DELTA_HEADER.unpack_from(payload)
+        idxs = struct.unpack_from(f"={count}I", payload, DELTA_HEADER.size)
+        self.assertEqual(len(payload), DELTA_HEADER.size + 4 * count)
+        return set_hash, list(idxs)
+
+    def test_delta(self):
+        decode = self.decode_delta
+        coverage = DeltaCoverage()
+        coverage.write([7, 3, 7])
+        hash_a, new_idxs = decode(coverage.payload())
+        self.assertEqual(new_idxs, [3, 7])
+        # A duplicate response: the same set, nothing new
+        coverage.repeat()
+        self.assertEqual(decode(coverage.payload()), (hash_a, []))
+        coverage.write([3, 9, 7])
+        hash_b, new_idxs = decode(coverage.payload())
+        self.assertEqual(new_idxs, [9])
+        self.assertNotEqual(hash_a, hash_b)
+        # Known vertices only: the set is identified by its hash
+        coverage.write([7, 3])
+        self.assertEqual(decode(coverage.payload()), (hash_a, []))
+
+    def test_delta_acks(self):
+        coverage = DeltaCoverage(acks=True)
+        coverage.write([1, 2])
+        self.assertEqual(self.decode_delta(coverage.payload())[1], [1, 2])
+        # e.g. a trimming run: AFL++ did not compare the bits, they are resent
+        coverage.acknowledge(False)
+        coverage.write([1, 2, 3])
+        self.assertEqual(self.decode_delta(coverage.payload())[1], [1, 2, 3])
+        coverage.acknowledge(True)
+        coverage.write([1, 2, 3, 4])
+        self.assertEqual(self.decode_delta(coverage.payload())[1], [4])
+        # Only the last payload is acknowledged
+        coverage.write([5])
+        coverage.acknowledge(True)
+        coverage.write([4, 5])
+        self.assertEqual(self.decode_delta(coverage.payload())[1], [4])
+
+
+class testPipelined(unittest.TestCase):
+    def run_fuzzer(self, depth: int, num_requests: int):
+        """
+        Executes test cases as far ahead as the acks allow; returns the messages
+        """
+        request_r, request_w = os.pipe()
+        result_r, result_w = os.pipe()
+        state = {"response": b"", "in_flight": 0, "max_in_flight": 0}
+
+        def infer(response: bytes):
+            state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+            state["in_flight"] -= 1
+            return b"DONE", response[:1]
+
+        def load_response():
+            state["in_flight"] += 1
+            return state["response"]
+
+        server = threading.Thread(
+            target=serve_pipelined,
+            args=(request_r, result_w, load_response, infer, depth),
+        )
+        server.start()
+        messages = []
+
+        def read_message():
+            tag, request_id = PIPE_MESSAGE.unpack(read_exact(result_r, 8))
+            payload = b"" if tag == PIPE_ACK else read_exact(result_r, 1)
+            messages.append((tag, request_id, payload))
+            return tag
+
+        for request_id in range(num_requests):
+            # The execution overwrites the response of the previous test case
+            state["response"] = b"%c" % (ord("a") + request_id)
+            os.write(request_w, PIPE_MESSAGE.pack(PIPE_REQUEST, request_id))
+            while read_message() != PIPE_ACK:
+                pass
+        while sum(tag != PIPE_ACK for tag, _, _ in messages) < num_requests:
+            read_message()
+        os.close(request_w)
+        server.join()
+        for fd in (request_r, result_r, result_w):
+            os.close(fd)
+        return messages, state["max_in_flight"]
+
+    def test_order_and_depth(self):
+        for depth in (1, 3):
+            messages, max_in_flight = self.run_fuzzer(depth, 10)
+            self.assertLessEqual(max_in_flight, depth)
+            results = [(i, payload) for tag, i, payload in messages if tag == b"DONE"]
+            # In the order of the requests, each on its own response
+            self.assertEqual(results, [(i, b"%c" % (ord("a") + i)) for i in range(10)])
+            acks = [i for tag, i, _ in messages if tag == PIPE_ACK]
+            self.assertEqual(acks, list(range(10)))
+            for i in range(10):
+                self.assertLess(
+                    messages.index((PIPE_ACK, i, b"")),
+                    messages.index((b"DONE", i, b"%c" % (ord("a") + i))),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import Funcnode, BB  # noqa: E402
+from implications import ImplicationTable  # noqa: E402
+
+
+def make_bbs(num_bbs: int):
+    func = Funcnode(0x1000)
+    return [BB(func.addr + k * 0x10, func) for k in range(num_bbs)]
+
+
+class testImplications(unittest.TestCase):
+    def test_missing_edge(self):
+        a, b, c = make_bbs(3)
+        table = ImplicationTable()
+        table.set(a, b, table.to_bits((c,)))
+        self.assertEqual(table.get(b, a), 0)
+        table.intersect(b, c, table.to_bits((a,)))
+        table.discard(c, a)
+        # Lookups and updates of edges without implications add no entries
+        self.assertEqual(len(table), 1)
+        self.assertEqual(list(table.items()), [(a, b, table.to_bits((c,)))])
+
+    def test_intersect_and_empty(self):
+        a, b, c, d = make_bbs(4)
+        table = ImplicationTable()
+        table.set(a, b, table.to_bits((c, d)))
+        table.intersect(a, b, table.to_bits((d, a)))
+        self.assertEqual(table.to_bbs(table.get(a, b)), [d])
+        # An empty implication is no entry
+        table.intersect(a, b, table.to_bits((c,)))
+        self.assertEqual(len(table), 0)
+        table.set(a, c, 0)
+        self.assertEqual(len(table), 0)
+
+    def test_absorb(self):
+        a, b, c, d, e = make_bbs(5)
+        table = ImplicationTable()
+        table.set(a, b, table.to_bits((c,)))
+        other = ImplicationTable()
+        other.set(d, e, other.to_bits((d, e)))
+        table.absorb(other)
+        self.assertEqual(set(table.to_bbs(table.get(d, e))), {d, e})
+        self.assertEqual(table.to_bbs(table.get(a, b)), [c])
+
+        # Overlapping numberings are remapped
+        overlapping = ImplicationTable()
+        overlapping.set(c, a, overlapping.to_bits((e, c)))
+        table.absorb(overlapping)
+        self.assertEqual(set(table.to_bbs(table.get(c, a))), {c, e})
+        self.assertEqual(len(table.bit_bbs), 3)
+
+    def test_compact(self):
+        a, b, c, d = make_bbs(4)
+        table = ImplicationTable()
+        table.set(a, b, table.to_bits((c, d, a)))
+        table.set(b, c, table.to_bits((a, b)))
+        table.intersect(a, b, table.to_bits((d,)))
+        table.discard(b, c)
+        table.compact()
+        self.assertEqual(table.bit_bbs, [d])
+        self.assertEqual(list(table.items()), [(a, b, 1)])
+        self.assertEqual(set(table.endpoints.values()), {a, b})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import random
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_recover import CFG, Funcnode  # noqa: E402
+from CFG_transform import CFGTransformer  # noqa: E402
+from cfg_fixtures import dump_cfg, make_cfg  # noqa: E402
+
+
+def make_func(num_bbs: int, seed: int) -> CFG:
+    """
+    A random function with branches, back edges, self loops and edge implications
+    """
+    cfg = make_cfg(
+        1,
+        seed,
+        min_bbs=num_bbs,
+        max_bbs=num_bbs + 1,
+        back_edge_rate=0.3,
+        max_calls=0,
+        literal_rate=0.0,
+        implication_rate=0.3,
+    )
+    for func in cfg.get_funcs():
+        func.update_preds()
+    return cfg
+
+
+def dump_func(cfg: CFG):
+    return dump_cfg(cfg, ids=False, implications=True)
+
+
+def check_implications(test: unittest.TestCase, func: Funcnode):
+    # Only the existing edges have (non-empty) implications
+    for src, dst, bits in func.get_implications().items():
+        test.assertIn(src, func.get_bbs())
+        test.assertIn(dst, src.dst_bbs)
+        test.assertNotEqual(bits, 0)
+
+
+def pick_removed(func: Funcnode, seed: int):
+    rng = random.Random(seed)
+    entry = func.get_entry()
+    return [bb for bb in func.get_bbs() if bb != entry and rng.random() < 0.6]
+
+
+class testNodeRemoval(unittest.TestCase):
+    def test_remove_node_keeps_preds(self):
+        for seed in range(20):
+            cfg = make_func(24, seed)
+            (func,) = cfg.get_funcs()
+            transformer = CFGTransformer(None)
+            for bb in pick_removed(func, seed):
+                transformer.remove_node(func, bb)
+                check_implications(self, func)
+                preds = dump_func(cfg)
+                func.update_preds()
+                self.assertEqual(preds, dump_func(cfg))
+
+    def test_remove_nodes_matches_remove_node(self):
+        for seed in range(50):
+            expected_cfg = make_func(24, seed)
+            (expected_func,) = expected_cfg.get_funcs()
+            removed = pick_removed(expected_func, seed)
+            # The one-by-one result does not depend on the order
+            random.Random(seed).shuffle(removed)
+            expected = CFGTransformer(None)
+            for bb in removed:
+                expected.remove_node(expected_func, bb)
+
+            cfg = make_func(24, seed)
+            (func,) = cfg.get_funcs()
+            transformer = CFGTransformer(None)
+            transformer.remove_nodes(func, set(pick_removed(func, seed)))
+            self.assertEqual(dump_func(expected_cfg), dump_func(cfg))
+            check_implications(self, func)
+            self.assertEqual(expected.operation_count, transformer.operation_count)
+            preds = dump_func(cfg)
+            func.update_preds()
+            self.assertEqual(preds, dump_func(cfg))
+
+
+if __name__ == "__main__":
+    unittest.main()
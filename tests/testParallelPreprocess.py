@@ -0,0 +1,56 @@
+import os
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_transform import CFGTransformer  # noqa: E402
+from parallel_preprocess import PreprocessPool  # noqa: E402
+from cfg_fixtures import dump_cfg, make_cfg  # noqa: E402
+
+
+class testParallelPreprocess(unittest.TestCase):
+    def test_passes_match_serial(self):
+        # No inliner here: its order depends on the object identities
+        for seed in range(10):
+            serial_cfg = make_cfg(40, seed)
+            serial = CFGTransformer(serial_cfg)
+            serial.remove_unrelated_funcs(serial_cfg)
+            parallel_cfg = make_cfg(40, seed)
+            parallel = CFGTransformer(parallel_cfg, processes=2)
+            parallel.remove_unrelated_funcs(parallel_cfg)
+            with PreprocessPool(2) as parallel.pool:
+                # The second round ships the implications made by the first one
+                for _ in range(2):
+                    serial.run_node_remove_pass(serial_cfg)
+                    serial.run_node_merge_pass(serial_cfg)
+                    parallel.run_node_remove_pass(parallel_cfg)
+                    parallel.run_node_merge_pass(parallel_cfg)
+            for func in serial_cfg.get_funcs() + parallel_cfg.get_funcs():
+                func.update_preds()
+            self.assertEqual(
+                dump_cfg(serial_cfg, ids=False, implications=True),
+                dump_cfg(parallel_cfg, ids=False, implications=True),
+            )
+            self.assertEqual(serial.operation_count, parallel.operation_count)
+
+    def test_run_all_passes(self):
+        cfg = make_cfg(40, 0)
+        transformer = CFGTransformer(cfg, processes=2)
+        transformer.run_all_passes(cfg)
+        self.assertIsNone(transformer.pool)
+        transformer.verify_cfg(cfg)
+        self.assertGreater(transformer.operation_count, 0)
+
+    def test_dominators_match_serial(self):
+        serial_cfg = make_cfg(30, 0)
+        serial_cfg.build_dominators()
+        parallel_cfg = make_cfg(30, 0)
+        parallel_cfg.build_dominators(processes=2)
+        for f1, f2 in zip(serial_cfg.get_funcs(), parallel_cfg.get_funcs()):
+            self.assertEqual(f1.dom_tree.idom_idx, f2.dom_tree.idom_idx)
+            self.assertEqual(f1.pdom_tree.idom_idx, f2.pdom_tree.idom_idx)
+
+
+if __name__ == "__main__":
+    unittest.main()
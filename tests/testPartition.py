@@ -0,0 +1,79 @@
+import os
+import random
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from partition import coarsest_stable_partition  # noqa: E402
+
+
+def moore_refinement(labels, succs):
+    """
+    Reference: splits every block by the blocks of the successors until the
+    number of blocks stops growing
+    """
+    block_of = {}
+    for v, label in enumerate(labels):
+        block_of[v] = block_of.setdefault(("label", label), len(block_of))
+    block_of = [block_of[v] for v in range(len(labels))]
+    num_blocks = len(set(block_of))
+    while True:
+        signatures = [
+            (block_of[v], frozenset(block_of[w] for w in succs[v]))
+            for v in range(len(labels))
+        ]
+        ids = {}
+        block_of = [ids.setdefault(sig, len(ids)) for sig in signatures]
+        if len(ids) == num_blocks:
+            break
+        num_blocks = len(ids)
+    blocks = {}
+    for v, block in enumerate(block_of):
+        blocks.setdefault(block, []).append(v)
+    return sorted(blocks.values())
+
+
+def make_graph(num_nodes, num_labels, seed):
+    rng = random.Random(seed)
+    labels = [rng.randrange(num_labels) for _ in range(num_nodes)]
+    succs = []
+    for v in range(num_nodes):
+        vsuccs = set()
+        if v + 1 < num_nodes and rng.random() < 0.8:
+            vsuccs.add(v + 1)
+        for _ in range(rng.randrange(0, 3)):
+            vsuccs.add(rng.randrange(num_nodes))
+        succs.append(list(vsuccs))
+    return labels, succs
+
+
+class testPartition(unittest.TestCase):
+    def test_matches_moore_refinement(self):
+        for seed in range(200):
+            labels, succs = make_graph(random.Random(seed).randrange(1, 40), 2, seed)
+            self.assertEqual(
+                moore_refinement(labels, succs),
+                coarsest_stable_partition(labels, succs),
+            )
+
+    def test_merges_bisimilar_nodes(self):
+        # 0 -> {1, 2}, 1 -> 3, 2 -> 3, 3 -> 3: 1 and 2 are indistinguishable
+        succs = [[1, 2], [3], [3], [3], []]
+        self.assertEqual(
+            coarsest_stable_partition(["a", "b", "b", "c", "c"], succs),
+            [[0], [1, 2], [3], [4]],
+        )
+        # Splitting [3, 4] (3 has a successor) splits [1, 2] only if they differ
+        succs = [[1, 2], [3], [4], [3], []]
+        self.assertEqual(
+            coarsest_stable_partition(["a", "b", "b", "c", "c"], succs),
+            [[0], [1], [2], [3], [4]],
+        )
+
+    def test_empty(self):
+        self.assertEqual(coarsest_stable_partition([], []), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
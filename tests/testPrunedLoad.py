@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from CFG_transform import CFGTransformer  # noqa: E402
+from cfg_binary import BINARY_FILE_NAME, convert_static_analysis_result  # noqa: E402
+import bz_common as bzc  # noqa: E402
+from cfg_fixtures import dump_cfg, write_ghidra_result  # noqa: E402
+
+
+def run_deterministic_passes(cfg):
+    # The inliner depends on set iteration order, so it is left out
+    transformer = CFGTransformer(cfg)
+    transformer.remove_unrelated_funcs(cfg)
+    transformer.run_node_remove_pass(cfg)
+    transformer.run_node_merge_pass(cfg)
+    return dump_cfg(cfg, implications=True, ids=False, dropped_funcs=True)
+
+
+class testPrunedLoad(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stat_dir = self.tmp_dir.name
+        write_ghidra_result(self.stat_dir, 60, 1)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_same_as_full_load(self, prefer_binary):
+        full_cfg, _, vertex_idx_map = bzc.load_static_analysis_result(
+            self.stat_dir, prefer_binary
+        )
+        pruned_cfg, _, pruned_vertex_idx_map = bzc.load_static_analysis_result(
+            self.stat_dir, prefer_binary, pruned=True
+        )
+        self.assertLess(pruned_cfg.get_num_funcs(), full_cfg.get_num_funcs())
+        self.assertEqual(pruned_vertex_idx_map, vertex_idx_map)
+
+        transformer = CFGTransformer(full_cfg)
+        transformer.remove_unrelated_funcs(full_cfg)
+        self.assertEqual(
+            dump_cfg(pruned_cfg, ids=False, dropped_funcs=True),
+            dump_cfg(full_cfg, ids=False, dropped_funcs=True),
+        )
+        # Ids are dense over the materialized BBs
+        ids = [bb.id for func in pruned_cfg.get_funcs() for bb in func.get_bbs()]
+        self.assertEqual(ids, list(range(pruned_cfg.num_bb_ids)))
+
+        self.assertEqual(
+            run_deterministic_passes(pruned_cfg), run_deterministic_passes(full_cfg)
+        )
+
+    def test_text(self):
+        self.check_same_as_full_load(prefer_binary=False)
+
+    def test_binary(self):
+        convert_static_analysis_result(
+            self.stat_dir, os.path.join(self.stat_dir, BINARY_FILE_NAME)
+        )
+        self.check_same_as_full_load(prefer_binary=True)
+
+    def test_lazy_edge_idx_map(self):
+        with open(os.path.join(self.stat_dir, "edge.txt"), "w") as f:
+            f.write("0x10000 0x10010\n0x20000 0x20010\n")
+        _, edge_idx_map, _ = bzc.load_static_analysis_result(self.stat_dir)
+        self.assertIsNone(edge_idx_map._map)
+        self.assertEqual(edge_idx_map[(0x20000, 0x20010)], 1)
+        self.assertEqual(
+            dict(edge_idx_map), {(0x10000, 0x10010): 0, (0x20000, 0x20010): 1}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+from response_dedup import (  # noqa: E402
+    BUCKET_SLOTS,
+    ResponseDedup,
+    make_dedup,
+    response_hash,
+)
+
+
+def same_bucket(dedup: ResponseDedup, count: int):
+    """
+    count distinct responses that fall in the same bucket
+    """
+    responses = []
+    i = 0
+    while len(responses) < count:
+        data = f"response {i}".encode()
+        if response_hash(data) & dedup.bucket_mask == 0:
+            responses.append(data)
+        i += 1
+    return responses
+
+
+class testResponseDedup(unittest.TestCase):
+    def test_duplicates(self):
+        dedup = ResponseDedup(1 << 16)
+        responses = [f"line {i}\n".encode() for i in range(300)]
+        self.assertFalse(any(dedup.seen(data) for data in responses))
+        self.assertTrue(all(dedup.seen(data) for data in responses))
+        self.assertFalse(dedup.seen(b""))
+        self.assertTrue(dedup.seen(b""))
+        stats = dedup.stats()
+        self.assertEqual(stats["slots"], 1 << 16)
+        self.assertEqual(stats["lookups"], 602)
+        self.assertEqual(stats["duplicates"], 301)
+        self.assertEqual(stats["used"] + stats["evictions"], 301)
+
+    def test_bounded(self):
+        dedup = ResponseDedup(64)
+        for i in range(10000):
+            dedup.seen(str(i).encode())
+        self.assertEqual(len(dedup.table), 64)
+        self.assertEqual(dedup.used(), 64)
+        self.assertEqual(dedup.evictions, 10000 - 64)
+        self.assertEqual(dedup.duplicates, 0)
+
+    def test_eviction_order(self):
+        dedup = ResponseDedup(4 * BUCKET_SLOTS)
+        first, *rest = same_bucket(dedup, BUCKET_SLOTS + 2)
+        dedup.seen(first)
+        for data in rest[: BUCKET_SLOTS - 1]:
+            dedup.seen(data)
+        # Found again: moves forward, so the next one to fall off is rest[0]
+        self.assertTrue(dedup.seen(first))
+        dedup.seen(rest[BUCKET_SLOTS - 1])
+        self.assertEqual(dedup.evictions, 1)
+        self.assertTrue(dedup.seen(first))
+        self.assertFalse(dedup.seen(rest[0]))
+
+    def test_config(self):
+        os.environ["FUZZ_DEDUP_SLOTS"] = "0"
+        try:
+            self.assertIsNone(make_dedup())
+            os.environ["FUZZ_DEDUP_SLOTS"] = "100"
+            self.assertEqual(len(make_dedup().table), 128)
+        finally:
+            del os.environ["FUZZ_DEDUP_SLOTS"]
+
+
+if __name__ == "__main__":
+    unittest.main()
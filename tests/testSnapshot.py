@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+import sys
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(pwd, "..", "src"))
+import snapshot  # noqa: E402
+from snapshot import (  # noqa: E402
+    get_snapshot_key,
+    get_snapshot_variant,
+    load_preprocessed,
+    preprocess_static_analysis,
+)
+from cfg_fixtures import dump_cfg, write_ghidra_result  # noqa: E402
+
+
+def dump_preprocessed(preprocessed):
+    cfg, vertex_idx_map, matcher = preprocessed
+    dominators = {
+        bb.start_addr: (
+            sorted(d.start_addr for d in func.dom_tree.dominators(bb)),
+            sorted(d.start_addr for d in func.pdom_tree.dominators(bb)),
+        )
+        for func in cfg.get_funcs()
+        for bb in func.get_bbs()
+    }
+    distances = {
+        (f1.addr, f2.addr): cfg.get_func_distance(f1, f2)
+        for f1 in cfg.get_funcs()
+        for f2 in cfg.get_funcs()
+    }
+    patterns = [
+        (info.xref.literal, info.has_format) for info in matcher.idx_to_match_info
+    ]
+    return dump_cfg(cfg), vertex_idx_map, dominators, distances, patterns
+
+
+class testSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stat_dir = self.tmp_dir.name
+        write_ghidra_result(self.stat_dir, 40, 0)
+        self.snapshot_dir = os.path.join(self.stat_dir, snapshot.SNAPSHOT_DIR_NAME)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def snapshot_files(self):
+        return os.listdir(self.snapshot_dir)
+
+    def test_snapshot_matches_preprocessing(self):
+        built = load_preprocessed(self.stat_dir)
+        self.assertEqual(len(self.snapshot_files()), 1)
+        loaded = load_preprocessed(self.stat_dir)
+        self.assertIsNot(loaded.cfg, built.cfg)
+        self.assertEqual(dump_preprocessed(loaded), dump_preprocessed(built))
+        # Every object is shared as in the original graph
+        for func in loaded.cfg.get_funcs():
+            for bb in func.get_bbs():
+                self.assertIs(bb.parent_funcnode, func)
+                self.assertIs(loaded.cfg.get_bb_from_addr(bb.start_addr), bb)
+        literal = loaded.matcher.idx_to_match_info[0].xref.literal
+        self.assertEqual(
+            {bb.start_addr for bb in loaded.matcher.search_bbs(literal)},
+            {bb.start_addr for bb in built.matcher.search_bbs(literal)},
+        )
+
+    def test_key_follows_inputs_and_options(self):
+        key = get_snapshot_key(self.stat_dir)
+        self.assertEqual(get_snapshot_key(self.stat_dir), key)
+        self.assertNotEqual(get_snapshot_key(self.stat_dir, 16), key)
+        with open(os.path.join(self.stat_dir, "vertex.txt"), "w") as f:
+            f.write("0x10000\n")
+        self.assertNotEqual(get_snapshot_key(self.stat_dir), key)
+
+    def test_stale_snapshot_is_replaced(self):
+        load_preprocessed(self.stat_dir)
+        old_files = self.snapshot_files()
+        with open(os.path.join(self.stat_dir, "vertex.txt"), "w") as f:
+            f.write("0x10000\n")
+        preprocessed = load_preprocessed(self.stat_dir)
+        self.assertEqual(preprocessed.vertex_idx_map, {0x10000: 0})
+        self.assertEqual(len(self.snapshot_files()), 1)
+        self.assertNotEqual(self.snapshot_files(), old_files)
+
+    def test_other_variants_are_kept(self):
+        load_preprocessed(self.stat_dir)
+        load_preprocessed(self.stat_dir, lazy_cache_size=16)
+        # e.g. the fuzz server under PyPy
+        other = f"pypy38.full.{get_snapshot_key(self.stat_dir)}.pickle"
+        with open(os.path.join(self.snapshot_dir, other), "wb"):
+            pass
+        self.assertEqual(len(self.snapshot_files()), 3)
+        with open(os.path.join(self.stat_dir, "vertex.txt"), "w") as f:
+            f.write("0x10000\n")
+        load_preprocessed(self.stat_dir)
+        files = self.snapshot_files()
+        self.assertEqual(len(files), 3)
+        self.assertIn(other, files)
+        self.assertEqual(
+            sum(name.startswith(get_snapshot_variant(16) + ".") for name in files), 1
+        )
+
+    def test_rebuild_and_broken_snapshot(self):
+        expected = dump_preprocessed(preprocess_static_analysis(self.stat_dir))
+        load_preprocessed(self.stat_dir)
+        (name,) = self.snapshot_files()
+        path = os.path.join(self.snapshot_dir, name)
+        with open(path, "r+b") as f:
+            f.truncate(100)
+        with self.assertLogs(level="WARNING"):
+            preprocessed = load_preprocessed(self.stat_dir)
+        self.assertEqual(dump_preprocessed(preprocessed), expected)
+        self.assertGreater(os.path.getsize(path), 100)
+
+        mtime = os.path.getmtime(path)
+        os.utime(path, (mtime - 100, mtime - 100))
+        load_preprocessed(self.stat_dir, rebuild=True)
+        self.assertGreater(os.path.getmtime(path), mtime - 100)
+
+
+if __name__ == "__main__":
+    unittest.main()